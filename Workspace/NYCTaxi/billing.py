@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Single-pass cost attribution over GCP billing export files.
+
+``sql/bill_report/gcp/query_bill_by_resource_by_day.sql`` reads the billing
+export table three times (``UNNEST(labels)`` for matching_resources, again
+for resource_labels, then billing_data joined back to both), and the table
+grows every month. Here exported rows (newline-delimited JSON, CSV or
+Parquet, as written by a BigQuery export of the billing table) are streamed
+once, and each row updates
+
+- the daily per-resource totals of the SQL report: cost in local currency
+  and in USD per (usage date, service, resource, currency), with the
+  resource's labels of the day
+- the cost per pipeline run, stage and cost category, from the row's labels
+
+A row's run is its ``run_id`` label (the run ids of run_metrics.py).
+Unlabeled rows are totaled per usage date, apart from the runs, so a run id
+such as ``2025-06-01`` is still a run. A row's stage is its ``stage`` label,
+or the stage of its BigQuery job ``name`` label (STAGE_BY_JOB_NAME). Its cost
+category, the split the comparison charts use, comes from COST_CATEGORY_RULES.
+
+Totals are kept per export file in a JSON ledger together with the file's
+size and mtime, so a rerun over the export directory reads only new or
+changed files, and a changed file replaces its earlier contribution.
+
+Files without the export's ``usage_start_time``, ``cost`` and ``currency``
+columns (e.g. a ``--daily-csv`` report written into the export directory)
+are not ingested. Rows whose cost cannot be converted to USD (no usable
+``currency_conversion_rate`` for a non-USD currency, or no numeric cost)
+are skipped and counted.
+
+Usage:
+    python -m NYCTaxi.billing <ledger.json> <export_file_or_dir>... [--daily-csv out.csv]
+        Ingest new or changed export files, print the cost per run and stage
+        and optionally write the daily per-resource report
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+LEDGER_VERSION = 2
+EXPORT_SUFFIXES = (".json", ".jsonl", ".csv", ".parquet")
+# Top-level columns every billing export row has
+EXPORT_COLUMNS = ("usage_start_time", "cost", "currency")
+PARQUET_BATCH_ROWS = 65536
+
+RUN_LABEL = "run_id"
+STAGE_LABEL = "stage"
+
+# BigQuery job "name" labels set by the transform notebooks -> pipeline stage
+STAGE_BY_JOB_NAME = {
+    "transform_yellow_taxi": "transform",
+    "transform_green_taxi": "transform",
+    "transform_taxi_mat_view": "materialize",
+}
+
+# (service description, substring of the SKU description or None, label key or None) -> chart category;
+# the first matching rule wins
+COST_CATEGORY_RULES = [
+    (None, "Egress", None, "copy_data"),
+    ("Cloud Storage", None, None, "storage"),
+    ("BigLake", None, None, "storage"),
+    ("BigQuery", None, None, "transform"),
+    ("Compute Engine", None, "databricks-instance-name", "compute_databricks"),
+    ("Databricks", None, None, "compute_databricks"),
+    ("Compute Engine", None, None, "compute_vm"),
+]
+OTHER_CATEGORY = "other"
+
+
+def _field(row, name):
+    # Nested export rows ({"service": {"description": ...}}) and flattened
+    # ones ("service.description" or "service_description") alike
+    value = row
+    for part in name.split("."):
+        if not isinstance(value, dict):
+            value = None
+            break
+        value = value.get(part)
+    if value is None:
+        value = row.get(name, row.get(name.replace(".", "_")))
+    return value
+
+
+def _labels(row):
+    labels = row.get("labels") or []
+    if isinstance(labels, str):
+        labels = json.loads(labels) if labels.strip() else []
+    if isinstance(labels, dict):
+        return {str(key): str(value) for key, value in labels.items()}
+    return {label["key"]: label["value"] for label in labels}
+
+
+def cost_category(service, sku, labels):
+    """Chart cost category of a billing row, from COST_CATEGORY_RULES."""
+    for rule_service, rule_sku, rule_label, category in COST_CATEGORY_RULES:
+        if rule_service is not None and rule_service != service:
+            continue
+        if rule_sku is not None and rule_sku not in (sku or ""):
+            continue
+        if rule_label is not None and rule_label not in labels:
+            continue
+        return category
+    return OTHER_CATEGORY
+
+
+def iter_export_rows(path):
+    """
+    Rows of one billing export file, streamed.
+
+    Newline-delimited JSON and CSV are read line by line; Parquet is read in
+    record batches (pyarrow is only needed for Parquet).
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_ROWS):
+            yield from batch.to_pylist()
+    elif path.endswith(".csv"):
+        with open(path, "r", newline="") as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _float(value):
+    # A number from a JSON/Parquet value or a CSV string; None when missing or not a number
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def usd_cost(row):
+    """
+    (cost in the row's currency, cost in USD) of a billing row, or None when it cannot be converted.
+
+    USD rows need no conversion rate; other currencies need a positive
+    currency_conversion_rate (local currency per USD).
+    """
+    cost = _float(_field(row, "cost"))
+    if cost is None:
+        return None
+    if _field(row, "currency") == "USD":
+        return cost, cost
+    rate = _float(_field(row, "currency_conversion_rate"))
+    if not rate or rate <= 0:
+        return None
+    return cost, cost / rate
+
+
+def aggregate_rows(rows):
+    """
+    Fold billing rows into daily per-resource totals and per-run stage costs.
+
+    Returns:
+        Dict with "daily" ([date, service, resource, global name, currency,
+        local cost, USD cost] lists), "labels" ([date, service, resource,
+        global name, sorted "key,value" labels] lists), "runs" ([run,
+        stage, category, USD cost] lists of the rows with a run label),
+        "days" ([usage date, stage, category, USD cost] lists of the rows
+        without one) and "skipped" (rows without a USD cost, see usd_cost)
+    """
+    daily = defaultdict(lambda: [0.0, 0.0])
+    resource_labels = defaultdict(set)
+    runs = defaultdict(float)
+    days = defaultdict(float)
+    skipped = 0
+    for row in rows:
+        costs = usd_cost(row)
+        if costs is None:
+            skipped += 1
+            continue
+        cost, usd = costs
+        usage_date = str(_field(row, "usage_start_time"))[:10]
+        service = _field(row, "service.description")
+        resource = (usage_date, service, _field(row, "resource.name"), _field(row, "resource.global_name"))
+        currency = _field(row, "currency")
+        labels = _labels(row)
+
+        totals = daily[resource + (currency,)]
+        totals[0] += cost
+        totals[1] += usd
+        resource_labels[resource].update(f"{key},{value}" for key, value in labels.items())
+
+        stage = labels.get(STAGE_LABEL) or STAGE_BY_JOB_NAME.get(labels.get("name"), OTHER_CATEGORY)
+        category = cost_category(service, _field(row, "sku.description"), labels)
+        if labels.get(RUN_LABEL):
+            runs[(labels[RUN_LABEL], stage, category)] += usd
+        else:
+            days[(usage_date, stage, category)] += usd
+
+    return {
+        "daily": [list(key) + totals for key, totals in daily.items()],
+        "labels": [list(key) + [sorted(values)] for key, values in resource_labels.items()],
+        "runs": [list(key) + [usd] for key, usd in runs.items()],
+        "days": [list(key) + [usd] for key, usd in days.items()],
+        "skipped": skipped,
+    }
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def export_columns(path):
+    """Top-level column names of an export file, from its header, first row or schema."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    if path.endswith(".csv"):
+        with open(path, "r", newline="") as f:
+            return next(csv.reader(f), [])
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                return list(row) if isinstance(row, dict) else []
+    return []
+
+
+def is_export_file(path):
+    """Whether a file has the billing export's columns; an empty file counts as one."""
+    try:
+        columns = export_columns(path)
+    except (OSError, ValueError):
+        return False
+    if not columns and os.path.getsize(path) == 0:
+        return True
+    return all(name in columns for name in EXPORT_COLUMNS)
+
+
+def find_export_files(paths):
+    """Export files among the given files and dirs (searched recursively), sorted."""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for suffix in EXPORT_SUFFIXES:
+                files.update(glob.glob(os.path.join(path, "**", f"*{suffix}"), recursive=True))
+        else:
+            files.add(path)
+    return sorted(os.path.abspath(path) for path in files)
+
+
+class BillingLedger:
+    """
+    Per-file billing aggregates, maintained incrementally.
+
+    Usage:
+        ledger = BillingLedger(ledger_path)
+        ledger.ingest(["/exports/billing"])
+        ledger.save()
+        costs = ledger.run_costs()
+    """
+
+    def __init__(self, ledger_path):
+        self.ledger_path = ledger_path
+        self.files = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.ledger_path):
+            return {}
+        with open(self.ledger_path, "r") as f:
+            ledger = json.load(f)
+        if ledger.get("version") != LEDGER_VERSION:
+            print(f"Ignoring billing ledger {self.ledger_path} with unsupported version {ledger.get('version')}")
+            return {}
+        return ledger["files"]
+
+    def save(self):
+        """Write the ledger atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.ledger_path)), exist_ok=True)
+        tmp_path = self.ledger_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": LEDGER_VERSION, "files": self.files}, f, sort_keys=True)
+        os.replace(tmp_path, self.ledger_path)
+
+    def ingest(self, paths, forget_missing=False, exclude=()):
+        """
+        Aggregate new and changed export files.
+
+        Args:
+            paths: Export files and dirs
+            forget_missing: Drop the totals of ledger files no longer found under paths
+            exclude: Files never to ingest, e.g. reports written next to the exports
+
+        Returns:
+            Dict with the ingested, ignored (not export files) and removed file
+            paths, rows read, rows skipped (see usd_cost) and elapsed seconds
+        """
+        start_time = time.time()
+        excluded = {os.path.abspath(path) for path in exclude if path} | {os.path.abspath(self.ledger_path)}
+        found = [path for path in find_export_files(paths) if path not in excluded]
+        for path in excluded:
+            self.files.pop(path, None)
+        ingested, ignored, rows, skipped = [], [], 0, 0
+        for path in found:
+            signature = file_signature(path)
+            if self.files.get(path, {}).get("signature") == signature:
+                continue
+            if not is_export_file(path):
+                self.files.pop(path, None)
+                ignored.append(path)
+                continue
+            counter = [0]
+
+            def counted(source):
+                for row in source:
+                    counter[0] += 1
+                    yield row
+
+            self.files[path] = {"signature": signature, **aggregate_rows(counted(iter_export_rows(path)))}
+            self.files[path]["rows"] = counter[0]
+            ingested.append(path)
+            rows += counter[0]
+            skipped += self.files[path]["skipped"]
+        removed = sorted(set(self.files) - set(found)) if forget_missing else []
+        for path in removed:
+            del self.files[path]
+        return {"ingested": ingested, "ignored": ignored, "removed": removed, "rows": rows, "skipped": skipped,
+                "seconds": time.time() - start_time}
+
+    def daily_resource_costs(self):
+        """
+        Rows of the query_bill_by_resource_by_day.sql report, newest day and highest cost first.
+
+        Returns:
+            List of dicts with usage_date, service_description, resource_name,
+            resource_global_name, labels_string, local_currency_cost,
+            local_currency and usd_cost
+        """
+        totals = defaultdict(lambda: [0.0, 0.0])
+        labels = defaultdict(set)
+        for entry in self.files.values():
+            for *key, local_cost, usd_cost in entry["daily"]:
+                total = totals[tuple(key)]
+                total[0] += local_cost
+                total[1] += usd_cost
+            for *key, values in entry["labels"]:
+                labels[tuple(key)].update(values)
+        report = []
+        for (usage_date, service, resource, global_name, currency), (local_cost, usd_cost) in totals.items():
+            resource_labels = labels.get((usage_date, service, resource, global_name))
+            report.append({
+                "usage_date": usage_date,
+                "service_description": service,
+                "resource_name": resource,
+                "resource_global_name": global_name,
+                "labels_string": ";".join(sorted(resource_labels)) if resource_labels else None,
+                "local_currency_cost": round(local_cost, 2),
+                "local_currency": currency,
+                "usd_cost": round(usd_cost, 2),
+            })
+        report.sort(key=lambda row: row["usd_cost"], reverse=True)
+        report.sort(key=lambda row: row["usage_date"], reverse=True)
+        return report
+
+    def _costs(self, key):
+        costs = defaultdict(lambda: defaultdict(float))
+        for entry in self.files.values():
+            for run, stage, category, usd in entry[key]:
+                costs[run][(stage, category)] += usd
+        return costs
+
+    def run_costs(self):
+        """
+        USD cost per labeled run, stage and category.
+
+        Returns:
+            Dict of run -> dict of (stage, category) -> USD
+        """
+        return self._costs("runs")
+
+    def day_costs(self):
+        """
+        USD cost of the rows without a run label per usage date, stage and category.
+
+        Returns:
+            Dict of usage date -> dict of (stage, category) -> USD
+        """
+        return self._costs("days")
+
+    def latest_run_category_costs(self):
+        """
+        USD cost per chart category of the latest labeled run (the run ids of
+        run_metrics.py sort by start time); empty when no row carries a run label.
+        """
+        return _latest_category_costs(self.run_costs())
+
+    def latest_day_category_costs(self):
+        """USD cost per chart category of the unlabeled rows of the latest usage day, e.g. storage."""
+        return _latest_category_costs(self.day_costs())
+
+
+def _latest_category_costs(costs):
+    if not costs:
+        return {}
+    categories = defaultdict(float)
+    for (_, category), usd in costs[max(costs)].items():
+        categories[category] += usd
+    return dict(categories)
+
+
+def write_daily_csv(report, path):
+    fields = ["usage_date", "service_description", "resource_name", "resource_global_name",
+              "labels_string", "local_currency_cost", "local_currency", "usd_cost"]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attribute GCP billing export costs to pipeline runs and stages")
+    parser.add_argument("ledger", help="JSON ledger of per-file totals (created if missing)")
+    parser.add_argument("exports", nargs="+", help="Billing export files or dirs (.json/.jsonl/.csv/.parquet)")
+    parser.add_argument("--daily-csv", help="Write the daily per-resource cost report to this CSV")
+    parser.add_argument("--forget-missing", action="store_true",
+                        help="Drop the totals of files no longer present in the export dirs")
+    args = parser.parse_args()
+
+    try:
+        ledger = BillingLedger(args.ledger)
+        result = ledger.ingest(args.exports, forget_missing=args.forget_missing, exclude=[args.daily_csv])
+        ledger.save()
+        print(f"Ingested {len(result['ingested'])} files, {result['rows']} rows in {result['seconds']:.2f}s; "
+              f"ledger covers {len(ledger.files)} files")
+        for path in result["ignored"]:
+            print(f"Ignored {path}: not a billing export (no {', '.join(EXPORT_COLUMNS)} columns)")
+        if result["skipped"]:
+            print(f"Skipped {result['skipped']} rows without a cost or a conversion rate to USD")
+
+        for title, run_costs in (("run", ledger.run_costs()), ("unlabeled day", ledger.day_costs())):
+            for run, costs in sorted(run_costs.items()):
+                stages = defaultdict(float)
+                for (stage, _), usd in costs.items():
+                    stages[stage] += usd
+                breakdown = ", ".join(f"{stage} ${usd:.2f}" for stage, usd in sorted(stages.items()))
+                print(f"{title} {run}: ${sum(stages.values()):.2f} ({breakdown})")
+
+        if args.daily_csv:
+            report = ledger.daily_resource_costs()
+            write_daily_csv(report, args.daily_csv)
+            print(f"Wrote {len(report)} daily resource rows to {args.daily_csv}")
+    except Exception as e:
+        print(f"Error attributing billing costs: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Compaction and sort-within-partition layout for hive-partitioned Parquet tables.
+
+The load notebooks write with ``optimizeWrite`` disabled, so tables such as
+``yellow-taxi/`` and ``taxi_trips_mat_view`` keep whatever file count and
+row-group sizes each month produced, with rows in arrival order. Every row
+group's min/max statistics then span most of the month and most of the
+location ids, and a filtered query cannot skip any of them.
+
+This tool rewrites each partition's files to about ``target_file_mb`` each,
+sorted by ``pickup_datetime`` and ``pickup_location_id``, in row groups of
+``row_group_rows`` rows. After sorting, the min/max range of a row group
+covers a few hours of pickups, so predicates on the pickup time (and, within
+equal times, the location) prune most row groups.
+
+Files are compacted per partition and per writer prefix: the parts convert.py
+wrote for one source month (``part-yellow-2016-01-00000.parquet``, ...) are
+merged with each other only, and keep that prefix, so reconverting the month
+still replaces exactly its files. The table's load manifest (manifest.py) is
+updated with the new file names. Compacted files carry a layout marker in
+their Parquet metadata, so a rerun only rewrites groups with new files.
+
+Compaction changes file names and mtimes, so matview.py rebuilds and
+enrich.py re-enriches the affected partitions on their next run. Run it while
+nothing else writes the table.
+
+Usage:
+    python -m NYCTaxi.compact <table_dir> [--target-file-mb 128] [--row-group-rows 131072]
+        [--sort-by pickup_datetime,pickup_location_id] [--predicate "pickup_location_id = 132"]... [--report-only]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import pyarrow.parquet as pq
+
+from .manifest import MANIFEST_FILE_NAME, LoadManifest
+
+DEFAULT_SORT_COLUMNS = ["pickup_datetime", "pickup_location_id"]
+DEFAULT_TARGET_FILE_MB = 128
+DEFAULT_ROW_GROUP_ROWS = 1 << 17
+
+# Predicates the pruning report evaluates when none are given
+DEFAULT_PREDICATES = [
+    "pickup_datetime >= 2016-01-15",
+    "pickup_location_id = 132",
+]
+
+LAYOUT_METADATA_KEY = b"nyctaxi.layout"
+
+_NUMBERED_PART = re.compile(r"^(?P<prefix>.+?)-(?P<number>\d{5})\.parquet$")
+_PREDICATE = re.compile(r"^\s*(?P<column>\w+)\s*(?P<op><=|>=|!=|=|<|>)\s*(?P<value>.+?)\s*$")
+
+
+def find_partition_files(table_dir):
+    """
+    Parquet files of each partition dir of a table, grouped by writer prefix.
+
+    Hidden and underscore-prefixed files and dirs (temp outputs, state files)
+    are skipped.
+
+    Returns:
+        Dict of partition dir to dict of prefix to sorted file paths; files
+        named ``<prefix>-NNNNN.parquet`` share a prefix, any other file is its own group
+    """
+    partitions = defaultdict(lambda: defaultdict(list))
+    for dir_path, dir_names, file_names in os.walk(table_dir):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith((".", "_")))
+        for name in sorted(file_names):
+            if not name.endswith(".parquet") or name.startswith((".", "_")):
+                continue
+            match = _NUMBERED_PART.match(name)
+            prefix = match.group("prefix") if match else name
+            partitions[dir_path][prefix].append(os.path.join(dir_path, name))
+    return {partition_dir: dict(groups) for partition_dir, groups in sorted(partitions.items())}
+
+
+def parse_predicate(text):
+    """
+    Parse a ``column op value`` predicate, e.g. "pickup_datetime >= 2016-01-15".
+
+    Returns:
+        (column, op, value text)
+    """
+    match = _PREDICATE.match(text)
+    if not match:
+        raise ValueError(f"Cannot parse predicate {text!r}; expected 'column op value' with op one of = != < <= > >=")
+    return match.group("column"), match.group("op"), match.group("value").strip("'\"")
+
+
+def _typed_value(text, like):
+    # Convert a predicate value to the type of a column's statistics
+    if isinstance(like, datetime):
+        value = datetime.fromisoformat(text)
+        if like.tzinfo is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+    if isinstance(like, bool):
+        return text.lower() in ("true", "1")
+    if isinstance(like, int):
+        return int(text)
+    if isinstance(like, float):
+        return float(text)
+    return text
+
+
+def _may_match(op, value, low, high):
+    if op == "=":
+        return low <= value <= high
+    if op == "!=":
+        return not (low == high == value)
+    if op == "<":
+        return low < value
+    if op == "<=":
+        return low <= value
+    if op == ">":
+        return high > value
+    return high >= value
+
+
+def row_group_may_match(row_group, column_index, predicate):
+    """
+    Whether a row group's min/max statistics allow rows matching a predicate.
+
+    Row groups without statistics for the column always may match.
+    """
+    _, op, text = predicate
+    if column_index is None:
+        return True
+    statistics = row_group.column(column_index).statistics
+    if statistics is None or not statistics.has_min_max:
+        return True
+    return _may_match(op, _typed_value(text, statistics.min), statistics.min, statistics.max)
+
+
+def layout_stats(paths, predicates=()):
+    """
+    File, row-group and pruning statistics of a set of Parquet files, from their footers.
+
+    Args:
+        paths: Parquet file paths
+        predicates: Predicate strings (see parse_predicate); the report also covers all of them combined
+
+    Returns:
+        Dict with files, row_groups, rows and bytes, and pruning: a list of
+        dicts with the predicate and the files, row groups and rows it keeps
+    """
+    parsed = [(text, parse_predicate(text)) for text in predicates]
+    if len(parsed) > 1:
+        parsed.append((" AND ".join(predicates), None))
+    kept = {text: {"files": 0, "row_groups": 0, "rows": 0} for text, _ in parsed}
+    stats = {"files": len(paths), "row_groups": 0, "rows": 0, "bytes": 0}
+
+    for path in paths:
+        metadata = pq.read_metadata(path)
+        names = metadata.schema.names
+        stats["bytes"] += os.path.getsize(path)
+        stats["rows"] += metadata.num_rows
+        stats["row_groups"] += metadata.num_row_groups
+        file_kept = defaultdict(bool)
+        for index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(index)
+            matches = {}
+            for text, predicate in parsed:
+                if predicate is None:
+                    match = all(matches.values())
+                else:
+                    column_index = names.index(predicate[0]) if predicate[0] in names else None
+                    match = row_group_may_match(row_group, column_index, predicate)
+                matches[text] = match
+                if match:
+                    kept[text]["row_groups"] += 1
+                    kept[text]["rows"] += row_group.num_rows
+                    file_kept[text] = True
+        for text, was_kept in file_kept.items():
+            kept[text]["files"] += was_kept
+
+    stats["pruning"] = [{"predicate": text, **counts} for text, counts in kept.items()]
+    return stats
+
+
+def _layout_marker(sort_columns, target_bytes, row_group_rows):
+    return json.dumps({"sort_by": sort_columns, "target_bytes": target_bytes, "row_group_rows": row_group_rows},
+                      sort_keys=True).encode()
+
+
+def is_compacted(paths, marker):
+    """Whether every file of a group was written by a compaction with this layout."""
+    for path in paths:
+        metadata = pq.read_metadata(path).metadata or {}
+        if metadata.get(LAYOUT_METADATA_KEY) != marker:
+            return False
+    return True
+
+
+def compact_group(paths, prefix, sort_columns, target_bytes, row_group_rows, marker):
+    """
+    Rewrite one group of files as sorted files of about target_bytes.
+
+    The new files are written under hidden names next to the old ones and
+    renamed into place, then old files not overwritten are removed.
+
+    Returns:
+        Sorted list of the new file paths
+    """
+    partition_dir = os.path.dirname(paths[0])
+    # Only the stored columns: the hive trip_year/trip_month values stay in the dir names
+    table = pq.read_table(paths, partitioning=None)
+    input_bytes = sum(os.path.getsize(path) for path in paths)
+    sort_keys = [(name, "ascending") for name in sort_columns if name in table.schema.names]
+    if sort_keys:
+        table = table.sort_by(sort_keys)
+
+    rows_per_file = max(1, table.num_rows * target_bytes // max(input_bytes, 1))
+    numbered = _NUMBERED_PART.match(os.path.basename(paths[0])) is not None
+    if not numbered:
+        # A single-file writer (e.g. enrich.py) expects its one file name back
+        rows_per_file = max(table.num_rows, 1)
+    schema = table.schema.with_metadata({**(table.schema.metadata or {}), LAYOUT_METADATA_KEY: marker})
+    sorting_columns = pq.SortingColumn.from_ordering(schema, sort_keys) if sort_keys else None
+
+    new_paths = []
+    for offset in range(0, max(table.num_rows, 1), rows_per_file):
+        name = f"{prefix}-{len(new_paths):05d}.parquet" if numbered else prefix
+        path = os.path.join(partition_dir, name)
+        tmp_path = os.path.join(partition_dir, f".{name}.tmp")
+        with pq.ParquetWriter(tmp_path, schema, compression="zstd", sorting_columns=sorting_columns) as writer:
+            writer.write_table(table.slice(offset, rows_per_file).replace_schema_metadata(schema.metadata),
+                               row_group_size=row_group_rows)
+        new_paths.append((tmp_path, path))
+
+    for tmp_path, path in new_paths:
+        os.replace(tmp_path, path)
+    new_paths = sorted(path for _, path in new_paths)
+    for path in set(paths) - set(new_paths):
+        os.remove(path)
+    return new_paths
+
+
+def compact_table(table_dir, sort_columns=None, target_file_mb=DEFAULT_TARGET_FILE_MB,
+                  row_group_rows=DEFAULT_ROW_GROUP_ROWS, predicates=None, force=False, report_only=False):
+    """
+    Compact and sort every partition of a hive-partitioned table.
+
+    Args:
+        table_dir: Table dir, e.g. .../yellow-taxi or a local taxi_trips_mat_view
+        sort_columns: Sort order within each partition (default: DEFAULT_SORT_COLUMNS; missing columns are skipped)
+        target_file_mb: Target file size in MB
+        row_group_rows: Rows per row group of the new files
+        predicates: Predicate strings for the pruning report (default: DEFAULT_PREDICATES)
+        force: Rewrite groups already compacted with the same layout
+        report_only: Only report the current layout
+
+    Returns:
+        Dict with the layout stats before and after (see layout_stats), the
+        compacted and skipped group counts and elapsed seconds
+    """
+    start_time = time.time()
+    sort_columns = DEFAULT_SORT_COLUMNS if sort_columns is None else sort_columns
+    predicates = DEFAULT_PREDICATES if predicates is None else predicates
+    target_bytes = target_file_mb * 1024 * 1024
+    marker = _layout_marker(sort_columns, target_bytes, row_group_rows)
+
+    partitions = find_partition_files(table_dir)
+    before_paths = [path for groups in partitions.values() for paths in groups.values() for path in paths]
+    before = layout_stats(before_paths, predicates)
+    if report_only:
+        return {"before": before, "after": None, "compacted": 0, "skipped": 0, "seconds": time.time() - start_time}
+
+    manifest = LoadManifest.load(table_dir) if os.path.exists(os.path.join(table_dir, MANIFEST_FILE_NAME)) else None
+    after_paths, compacted, skipped = [], 0, 0
+    for groups in partitions.values():
+        for prefix, paths in groups.items():
+            if not force and is_compacted(paths, marker):
+                after_paths.extend(paths)
+                skipped += 1
+                continue
+            new_paths = compact_group(paths, prefix, sort_columns, target_bytes, row_group_rows, marker)
+            if manifest:
+                manifest.replace_outputs(paths, new_paths)
+                manifest.save()
+            after_paths.extend(new_paths)
+            compacted += 1
+
+    return {
+        "before": before,
+        "after": layout_stats(after_paths, predicates),
+        "compacted": compacted,
+        "skipped": skipped,
+        "seconds": time.time() - start_time,
+    }
+
+
+def _print_stats(label, stats):
+    print(f"{label}: {stats['files']} files, {stats['row_groups']} row groups, "
+          f"{stats['rows']} rows, {stats['bytes'] / 1024 / 1024:.1f} MB")
+    for pruning in stats["pruning"]:
+        share = pruning["row_groups"] / stats["row_groups"] if stats["row_groups"] else 0.0
+        print(f"  {pruning['predicate']}: reads {pruning['row_groups']}/{stats['row_groups']} row groups "
+              f"({share:.0%}), {pruning['files']} files, {pruning['rows']} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and sort the partitions of a hive-partitioned Parquet table")
+    parser.add_argument("table_dir", help="Table dir, e.g. .../yellow-taxi or a local taxi_trips_mat_view")
+    parser.add_argument("--target-file-mb", type=int, default=DEFAULT_TARGET_FILE_MB,
+                        help=f"Target file size in MB (default: {DEFAULT_TARGET_FILE_MB})")
+    parser.add_argument("--row-group-rows", type=int, default=DEFAULT_ROW_GROUP_ROWS,
+                        help=f"Rows per row group (default: {DEFAULT_ROW_GROUP_ROWS})")
+    parser.add_argument("--sort-by", default=",".join(DEFAULT_SORT_COLUMNS),
+                        help=f"Comma-separated sort columns (default: {','.join(DEFAULT_SORT_COLUMNS)})")
+    parser.add_argument("--predicate", action="append",
+                        help="Predicate for the pruning report, e.g. 'pickup_location_id = 132' (repeatable)")
+    parser.add_argument("--report-only", action="store_true", help="Only report the current layout")
+    parser.add_argument("--force", action="store_true", help="Rewrite partitions already compacted with this layout")
+    args = parser.parse_args()
+
+    try:
+        result = compact_table(
+            args.table_dir,
+            sort_columns=[name for name in args.sort_by.split(",") if name],
+            target_file_mb=args.target_file_mb,
+            row_group_rows=args.row_group_rows,
+            predicates=args.predicate,
+            force=args.force,
+            report_only=args.report_only,
+        )
+        _print_stats("Before", result["before"])
+        if result["after"] is not None:
+            _print_stats("After", result["after"])
+            print(f"Compacted {result['compacted']} file groups, skipped {result['skipped']} "
+                  f"in {result['seconds']:.2f}s")
+    except Exception as e:
+        print(f"Error compacting table: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Convert monthly taxi trip CSVs to hive-partitioned Parquet, in parallel.
+
+Standalone replacement for the month-by-month loop in the load-data notebooks
+(cell "Read CSV, homogenize schema across years, save as parquet"). Each month
+is converted by its own worker process: the CSV is streamed in bounded-size
+blocks, projected onto the canonical column list in a single pass (see
+homogenize.py) and written to
+``trip_year=YYYY/trip_month=MM/`` partitions with zstd compression. Nothing is
+cached, so memory per worker stays close to a few CSV blocks regardless of the
+size of the month.
+
+Reruns are incremental: a load manifest per destination table (see
+manifest.py) records each converted month, so only new or changed source
+CSVs are converted again and only their partitions need refreshing. With
+``--external-table-schema`` the SQL for that is printed, for external
+Parquet tables over the output dirs (Delta tables need none).
+
+With ``--fingerprint-bits 64`` (or 128) each row also gets a row_fingerprint
+column over its raw trip fields (see fingerprint.py), so dedup can run on
+one narrow key instead of a SELECT DISTINCT over every column.
+
+Each month's batches are also profiled as they are written (row and null
+counts, min/max, sums and distinct sketches per partition, see profiles.py),
+so the post-load checks need not scan the table; ``--no-profiles`` skips it.
+
+With ``--zones taxi_zones.geojson`` the zero location ids of months that
+carry coordinates only (before July 2016) are filled from the coordinates
+(see zones.py).
+
+Usage:
+    python -m NYCTaxi.convert <src_data_dir_root> <dest_data_dir_root> [--workers 8] [--memory-per-worker-mb 512] [--fingerprint-bits 64]
+        [--no-profiles] [--zones taxi_zones.geojson] [--external-table-schema nyctaxi]
+        [--metrics-store runs.jsonl --run-id <id>]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from .fingerprint import FINGERPRINT_BITS, fingerprint_field, with_fingerprint
+from .homogenize import Homogenizer
+from .manifest import HashingReader, LoadManifest, file_sha256, partition_refresh_statements
+from .profiles import PartitionProfile, remove_month_profiles, write_month_profiles
+from .run_metrics import MemorySampler, add_metrics_arguments, metrics_from_args
+from .schemas import TAXI_TYPES, iter_trip_months, source_csv_path
+from .zones import assign_zones, cached_zone_index
+
+# Share of the per-worker memory budget used for one CSV block; the rest covers
+# the parsed batch and the Parquet encoder buffers.
+CSV_BLOCK_FRACTION = 0.125
+MIN_CSV_BLOCK_BYTES = 1 << 20
+
+# Directory name Hive/Spark use for rows whose partition value is null
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+DEFAULT_MEMORY_PER_WORKER_MB = 512
+DEFAULT_MAX_ROWS_PER_FILE = 5_000_000
+
+
+def output_file_prefix(taxi_type, trip_year, trip_month):
+    """File name prefix of the Parquet parts written for one source month."""
+    return f"part-{taxi_type}-{trip_year}-{trip_month:02d}"
+
+
+def remove_month_outputs(dest_dir, taxi_type, trip_year, trip_month):
+    """
+    Remove Parquet parts written by a previous conversion of a source month.
+
+    Makes reruns idempotent, like the commented-out ``dbutils.fs.rm`` in the notebooks.
+
+    Returns:
+        List of removed paths
+    """
+    pattern = os.path.join(
+        dest_dir, "trip_year=*", "trip_month=*",
+        output_file_prefix(taxi_type, trip_year, trip_month) + "-*.parquet",
+    )
+    removed = sorted(glob.glob(pattern))
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+class _PartitionWriter:
+    """Parquet writer for one hive partition that rolls over to a new file after max_rows."""
+
+    def __init__(self, partition_dir, prefix, schema, max_rows):
+        self.partition_dir = partition_dir
+        self.prefix = prefix
+        self.schema = schema
+        self.max_rows = max_rows
+        self.paths = []
+        self._writer = None
+        self._rows_in_file = 0
+
+    def write(self, batch):
+        offset = 0
+        while offset < batch.num_rows:
+            if self._writer is None or self._rows_in_file >= self.max_rows:
+                self._open_next()
+            take = min(batch.num_rows - offset, self.max_rows - self._rows_in_file)
+            self._writer.write(batch.slice(offset, take))
+            self._rows_in_file += take
+            offset += take
+
+    def _open_next(self):
+        self.close()
+        os.makedirs(self.partition_dir, exist_ok=True)
+        path = os.path.join(self.partition_dir, f"{self.prefix}-{len(self.paths):05d}.parquet")
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self._rows_in_file = 0
+        self.paths.append(path)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def csv_block_size(memory_per_worker_mb):
+    """CSV block size in bytes for a per-worker memory budget."""
+    return max(MIN_CSV_BLOCK_BYTES, int(memory_per_worker_mb * 1024 ** 2 * CSV_BLOCK_FRACTION))
+
+
+def convert_month(src_data_dir_root, dest_dir, taxi_type, trip_year, trip_month,
+                  memory_per_worker_mb=DEFAULT_MEMORY_PER_WORKER_MB,
+                  max_rows_per_file=DEFAULT_MAX_ROWS_PER_FILE, previous_outputs=None,
+                  fingerprint_bits=None, profile=True, zones_path=None):
+    """
+    Convert one monthly source CSV to hive-partitioned Parquet.
+
+    Args:
+        src_data_dir_root: Root dir for source data
+        dest_dir: Root dir of the destination table (e.g. .../yellow-taxi/)
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+        memory_per_worker_mb: Memory budget used to size CSV blocks
+        max_rows_per_file: Maximum rows per Parquet file
+        previous_outputs: Files of an earlier conversion of the month, from the
+            load manifest; when None they are found by listing every partition
+        fingerprint_bits: Add a 64- or 128-bit row_fingerprint column; None for no fingerprint
+        profile: Write per-partition column profiles of the month (see profiles.py)
+        zones_path: Taxi zone GeoJSON to fill zero location ids from coordinates (see zones.py)
+
+    Returns:
+        Dict with the month, source state, row counts, bytes in/out, output
+        paths and elapsed seconds
+    """
+    start_time = time.time()
+    src_path = source_csv_path(src_data_dir_root, taxi_type, trip_year, trip_month)
+    stat = os.stat(src_path)
+    homogenizer = Homogenizer(taxi_type, trip_year, trip_month)
+    invalid_rows = []
+
+    def skip_invalid_row(row):
+        # Rows with a wrong number of fields are dropped and counted, as in Spark's DROPMALFORMED
+        # mode; the notebooks' default PERMISSIVE mode would keep them with nulls
+        invalid_rows.append(row.number)
+        return "skip"
+
+    source_file = HashingReader(src_path)
+    reader = pacsv.open_csv(
+        source_file,
+        read_options=pacsv.ReadOptions(
+            column_names=homogenizer.read_column_names,
+            skip_rows=1,
+            block_size=csv_block_size(memory_per_worker_mb),
+            use_threads=False,
+        ),
+        parse_options=pacsv.ParseOptions(invalid_row_handler=skip_invalid_row),
+        convert_options=pacsv.ConvertOptions(
+            column_types=homogenizer.read_column_types,
+            include_columns=homogenizer.read_column_types.names,
+            timestamp_parsers=["%Y-%m-%d %H:%M:%S"],
+            strings_can_be_null=True,
+        ),
+    )
+
+    if previous_outputs is None:
+        remove_month_outputs(dest_dir, taxi_type, trip_year, trip_month)
+    else:
+        for path in previous_outputs:
+            if os.path.exists(path):
+                os.remove(path)
+    prefix = output_file_prefix(taxi_type, trip_year, trip_month)
+    schema = homogenizer.data_schema
+    if fingerprint_bits:
+        schema = schema.append(fingerprint_field(fingerprint_bits))
+    writers = {}
+    rows_by_partition = defaultdict(int)
+    profiles = defaultdict(PartitionProfile)
+    zone_index = cached_zone_index(zones_path) if zones_path else None
+    try:
+        for batch in reader:
+            # Rows are routed to the partition of their own pickup date, as partitionBy does
+            for key, part in homogenizer.split(batch):
+                key = tuple(value or HIVE_DEFAULT_PARTITION for value in key)
+                if zone_index is not None:
+                    part = assign_zones(part, zone_index)
+                if profile:
+                    profiles[key].update(part)
+                if fingerprint_bits:
+                    part = with_fingerprint(part, fingerprint_bits)
+                if key not in writers:
+                    partition_dir = os.path.join(dest_dir, f"trip_year={key[0]}", f"trip_month={key[1]}")
+                    writers[key] = _PartitionWriter(partition_dir, prefix, schema, max_rows_per_file)
+                writers[key].write(part)
+                rows_by_partition[key] += part.num_rows
+        sha256 = source_file.hexdigest()
+    finally:
+        for writer in writers.values():
+            writer.close()
+        source_file.close()
+
+    if profile:
+        write_month_profiles(dest_dir, prefix, profiles)
+    else:
+        # A profile of an earlier conversion no longer describes the month's files
+        remove_month_profiles(dest_dir, prefix)
+
+    outputs = sorted(path for writer in writers.values() for path in writer.paths)
+    return {
+        "taxi_type": taxi_type,
+        "trip_year": trip_year,
+        "trip_month": trip_month,
+        "source": {
+            "path": src_path,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+        },
+        "rows": sum(rows_by_partition.values()),
+        "rows_by_partition": dict(rows_by_partition),
+        "invalid_rows": len(invalid_rows),
+        "bytes_in": stat.st_size,
+        "bytes_out": sum(os.path.getsize(path) for path in outputs),
+        "outputs": outputs,
+        "seconds": time.time() - start_time,
+    }
+
+
+def _measured_convert_month(*args):
+    # convert_month with the peak memory of this month alone: a worker process
+    # converts several months, so its lifetime peak would carry over
+    with MemorySampler() as memory:
+        result = convert_month(*args)
+    result["peak_memory_bytes"] = memory.peak_bytes
+    return result
+
+
+def _init_worker():
+    # One process per core already; keep Arrow from spawning its own thread pool in each
+    pa.set_cpu_count(1)
+    pa.set_io_thread_count(1)
+
+
+def destination_dir(dest_data_dir_root, taxi_type):
+    """Destination table dir for a taxi type, e.g. <root>/yellow-taxi/."""
+    return os.path.join(dest_data_dir_root, f"{taxi_type}-taxi")
+
+
+def convert_months(src_data_dir_root, dest_data_dir_root, months, workers=None,
+                   memory_per_worker_mb=DEFAULT_MEMORY_PER_WORKER_MB,
+                   max_rows_per_file=DEFAULT_MAX_ROWS_PER_FILE, incremental=True,
+                   fingerprint_bits=None, profile=True, zones_path=None, metrics=None):
+    """
+    Convert a list of source months in parallel, one worker process per month.
+
+    With incremental=True each destination table's load manifest is consulted
+    first, and months whose source CSV and conversion options are unchanged
+    since their last conversion are skipped. The manifest is updated as each month completes,
+    so an interrupted run resumes where it stopped.
+
+    Args:
+        src_data_dir_root: Root dir for source data
+        dest_data_dir_root: Root dir for consumable data; each taxi type goes to <type>-taxi/
+        months: Iterable of (taxi_type, year, month) tuples
+        workers: Number of worker processes (default: CPU count)
+        memory_per_worker_mb: Memory budget per worker
+        max_rows_per_file: Maximum rows per Parquet file
+        incremental: Skip months the load manifest shows as already converted
+        fingerprint_bits: Add a 64- or 128-bit row_fingerprint column; None for no fingerprint
+        profile: Write per-partition column profiles of each month (see profiles.py)
+        zones_path: Taxi zone GeoJSON to fill zero location ids from coordinates (see zones.py)
+        metrics: RunMetrics to record each converted month in (see run_metrics.py)
+
+    Returns:
+        List of per-month result dicts (see convert_month), in completion order.
+        Each also carries "changed_partitions": the partitions it wrote to or
+        removed files from.
+    """
+    months = list(months)
+    options = {"fingerprint_bits": fingerprint_bits} if fingerprint_bits else {}
+    if zones_path:
+        # Other zone polygons give other ids, so months converted with them are not current
+        options["zones_sha256"] = file_sha256(zones_path)
+    manifests = {}
+    pending = []
+    for taxi_type, year, month in months:
+        dest_dir = destination_dir(dest_data_dir_root, taxi_type)
+        if dest_dir not in manifests:
+            manifests[dest_dir] = LoadManifest.load(dest_dir)
+        manifest = manifests[dest_dir]
+        src_path = source_csv_path(src_data_dir_root, taxi_type, year, month)
+        if incremental and manifest.is_current(year, month, src_path, options):
+            continue
+        pending.append((taxi_type, year, month, dest_dir))
+
+    skipped = len(months) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} months unchanged since their last conversion")
+        for manifest in manifests.values():
+            manifest.save()
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(
+                _measured_convert_month, src_data_dir_root, dest_dir, taxi_type, year, month,
+                memory_per_worker_mb, max_rows_per_file,
+                manifests[dest_dir].output_paths(year, month), fingerprint_bits, profile, zones_path,
+            ): (taxi_type, year, month, dest_dir)
+            for taxi_type, year, month, dest_dir in pending
+        }
+        for future in as_completed(futures):
+            taxi_type, year, month, dest_dir = futures[future]
+            result = future.result()
+            manifest = manifests[dest_dir]
+            result["changed_partitions"] = manifest.partitions(year, month) | set(result["rows_by_partition"])
+            manifest.record(year, month, result["source"], result["outputs"], result["rows_by_partition"], options)
+            manifest.save()
+            if metrics:
+                metrics.add(
+                    "convert", result["seconds"], partition=f"{taxi_type}/{year}-{month:02d}",
+                    rows_in=result["rows"] + result["invalid_rows"], rows_out=result["rows"],
+                    bytes_in=result["bytes_in"], bytes_out=result["bytes_out"],
+                    peak_memory=result["peak_memory_bytes"],
+                )
+            print(
+                f"Type={taxi_type}; Year={year}; Month={month}; rows={result['rows']}; "
+                f"{result['bytes_in'] / 1024 ** 2:.1f} MB -> {result['bytes_out'] / 1024 ** 2:.1f} MB "
+                f"in {result['seconds']:.1f}s"
+            )
+            results.append(result)
+    return results
+
+
+def _parse_year_month(value):
+    year, month = value.split("-")
+    return int(year), int(month)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert taxi trip CSVs to hive-partitioned Parquet")
+    parser.add_argument("src_data_dir_root", help="Root dir for source data")
+    parser.add_argument("dest_data_dir_root", help="Root dir for consumable data")
+    parser.add_argument("--taxi-type", choices=TAXI_TYPES, action="append",
+                        help="Taxi type to convert (repeatable, default: all)")
+    parser.add_argument("--start", type=_parse_year_month, help="First month as YYYY-MM")
+    parser.add_argument("--end", type=_parse_year_month, help="Last month as YYYY-MM")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--memory-per-worker-mb", type=int, default=DEFAULT_MEMORY_PER_WORKER_MB,
+                        help=f"Memory budget per worker (default: {DEFAULT_MEMORY_PER_WORKER_MB})")
+    parser.add_argument("--max-rows-per-file", type=int, default=DEFAULT_MAX_ROWS_PER_FILE,
+                        help=f"Maximum rows per Parquet file (default: {DEFAULT_MAX_ROWS_PER_FILE})")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Reconvert every month, ignoring the load manifest")
+    parser.add_argument("--fingerprint-bits", type=int, choices=FINGERPRINT_BITS,
+                        help="Add a row_fingerprint column of this many bits for dedup (default: none)")
+    parser.add_argument("--no-profiles", action="store_true",
+                        help="Skip the per-partition column profiles (see profiles.py)")
+    parser.add_argument("--zones",
+                        help="Taxi zone GeoJSON; fill the zero location ids of trips with coordinates (see zones.py)")
+    parser.add_argument("--external-table-schema",
+                        help="Print partition refresh SQL for the external Parquet tables "
+                             "<schema>.<type>_taxi_trips_raw over the output dirs; not for Delta tables, "
+                             "such as the load-data notebooks', which reject it")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    months = [
+        (taxi_type, year, month)
+        for taxi_type in args.taxi_type or TAXI_TYPES
+        for year, month in iter_trip_months(taxi_type, args.start, args.end)
+    ]
+
+    try:
+        start_time = time.time()
+        metrics = metrics_from_args(args)
+        with metrics.stage("convert") if metrics else nullcontext({}) as counters:
+            results = convert_months(
+                args.src_data_dir_root, args.dest_data_dir_root, months,
+                workers=args.workers,
+                memory_per_worker_mb=args.memory_per_worker_mb,
+                max_rows_per_file=args.max_rows_per_file,
+                incremental=not args.full_refresh,
+                fingerprint_bits=args.fingerprint_bits,
+                profile=not args.no_profiles,
+                zones_path=args.zones,
+                metrics=metrics,
+            )
+            for name in ("bytes_in", "bytes_out"):
+                counters[name] = sum(result[name] for result in results)
+            counters["rows_out"] = sum(result["rows"] for result in results)
+        total_rows = sum(result["rows"] for result in results)
+        print(f"Converted {len(results)} months, {total_rows} rows in {time.time() - start_time:.1f}s")
+
+        # Refresh only the partitions that changed, and count rows from the manifest
+        for taxi_type in args.taxi_type or TAXI_TYPES:
+            manifest = LoadManifest.load(destination_dir(args.dest_data_dir_root, taxi_type))
+            changed = set().union(*(r["changed_partitions"] for r in results if r["taxi_type"] == taxi_type))
+            table_name = f"{taxi_type}_taxi_trips_raw"
+            if args.external_table_schema:
+                table_name = f"{args.external_table_schema}.{table_name}"
+                for statement in partition_refresh_statements(table_name, changed, manifest.row_counts()):
+                    print(statement)
+            print(f"{table_name}: {manifest.total_rows()} rows")
+    except Exception as e:
+        print(f"Error converting data: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Enrich taxi trips with their lookup descriptions using dense array gathers.
+
+The transform SQL joins every trip to vendor_lookup, trip_month_lookup,
+payment_type_lookup, rate_code_lookup and (twice) taxi_zone_lookup. For
+yellow trips the vendor and payment joins depend on the era - abbreviations
+before 2015, numeric ids after - so the SQL either splits the table with
+``UNION ALL`` or joins on a ``CASE WHEN trip_year < "2015"`` condition that
+rules out hash joins (Q1-Q4 in sql/benchmark/1-join-yellow-taxi.sql).
+
+The lookup tables are tiny, so here each one is loaded once into a
+``DimensionIndex``: a dense array from numeric code to lookup row, plus a
+small value set of the abbreviations (``"CMT"`` is vendor 1). As in the SQL,
+yellow trips before 2015 resolve vendor and payment type by abbreviation and
+all other trips by numeric code, but the era is a row mask rather than a
+second join, and enriching a record batch is one vectorized code -> row step
+per dimension followed by an Arrow ``take`` per output column.
+
+Usage:
+    python -m NYCTaxi.enrich <reference_dir> <src_data_dir_root> <dest_data_dir_root> [--taxi-type yellow]
+        Enrich converted <type>-taxi tables (see convert.py) into the
+        transform tables that taxi_trips_mat_view is built from.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .convert import destination_dir
+from .fingerprint import FINGERPRINT_COLUMN, dedup
+from .reference import load_reference_data
+from .run_metrics import MemorySampler, add_metrics_arguments, metrics_from_args
+from .schemas import TAXI_TYPES
+
+# Lookup columns added to each taxi type, in transform SQL order:
+# output column -> (dimension, trip column, lookup column)
+LOOKUP_COLUMNS = {
+    "yellow": {
+        "vendor_abbreviation": ("vendor", "vendor_id", "abbreviation"),
+        "vendor_description": ("vendor", "vendor_id", "description"),
+        "month_name_short": ("trip_month", "trip_month", "month_name_short"),
+        "month_name_full": ("trip_month", "trip_month", "month_name_full"),
+        "payment_type_description": ("payment_type", "payment_type", "description"),
+        "rate_code_description": ("rate_code", "rate_code_id", "description"),
+        "pickup_borough": ("taxi_zone", "pickup_location_id", "borough"),
+        "pickup_zone": ("taxi_zone", "pickup_location_id", "zone"),
+        "pickup_service_zone": ("taxi_zone", "pickup_location_id", "service_zone"),
+        "dropoff_borough": ("taxi_zone", "dropoff_location_id", "borough"),
+        "dropoff_zone": ("taxi_zone", "dropoff_location_id", "zone"),
+        "dropoff_service_zone": ("taxi_zone", "dropoff_location_id", "service_zone"),
+    },
+}
+LOOKUP_COLUMNS["green"] = dict(
+    list(LOOKUP_COLUMNS["yellow"].items())[:2]
+    + [("trip_type_description", ("trip_type", "trip_type", "description"))]
+    + list(LOOKUP_COLUMNS["yellow"].items())[2:]
+)
+
+# Dimension -> (lookup table, id column, abbreviation column or None)
+DIMENSIONS = {
+    "vendor": ("vendor", "vendor_id", "abbreviation"),
+    "payment_type": ("payment_type", "payment_type", "abbreviation"),
+    "rate_code": ("rate_code", "rate_code_id", None),
+    "trip_type": ("trip_type", "trip_type", None),
+    "trip_month": ("trip_month", "trip_month", None),
+    "taxi_zone": ("taxi_zone", "location_id", None),
+}
+
+# Yellow trips before this year code vendor and payment type by abbreviation
+ABBREVIATION_ERA_END = {"yellow": 2015}
+
+# Trip columns the transform selects as CAST(... AS INT): the lookup id joined
+# on the abbreviation before ABBREVIATION_ERA_END (null when the lookup
+# misses), the code itself from then on. Green selects its codes as they are.
+RESOLVED_CODE_COLUMNS = {
+    "yellow": {"vendor_id": "vendor", "payment_type": "payment_type"},
+    "green": {},
+}
+
+_DATETIME_PARTS = [
+    ("year", pc.year),
+    ("month", pc.month),
+    ("day", pc.day),
+    ("hour", pc.hour),
+    ("minute", pc.minute),
+    ("second", pc.second),
+]
+# Derived columns per taxi type, in transform SQL order; only yellow has the
+# dates and partition_id (unix_millis(pickup_datetime))
+DERIVED_COLUMNS = {
+    "yellow": [
+        name
+        for prefix in ("pickup", "dropoff")
+        for name in [f"{prefix}_{part}" for part, _ in _DATETIME_PARTS] + [f"{prefix}_date"]
+    ] + ["partition_id"],
+    "green": [f"{prefix}_{part}" for prefix in ("pickup", "dropoff") for part, _ in _DATETIME_PARTS],
+}
+
+
+def _integer_codes(codes):
+    """
+    Integer value of every code, as CAST(code AS INT) gives it.
+
+    Args:
+        codes: Array of string or integer codes
+
+    Returns:
+        (numpy int64 values, numpy bool mask of the codes that are integers)
+    """
+    if pa.types.is_string(codes.type) or pa.types.is_large_string(codes.type):
+        trimmed = pc.utf8_trim_whitespace(codes)
+        valid = pc.fill_null(pc.match_substring_regex(trimmed, r"^[+-]?\d{1,9}$"), False)
+        values = pc.cast(pc.if_else(valid, trimmed, "0"), pa.int64())
+    else:
+        valid = pc.is_valid(codes)
+        values = pc.fill_null(pc.cast(codes, pa.int64()), 0)
+    return values.to_numpy(zero_copy_only=False), valid.to_numpy(zero_copy_only=False)
+
+
+class DimensionIndex:
+    """
+    Dense code -> row index of one lookup table.
+
+    Usage:
+        vendor = DimensionIndex(vendor_lookup, "vendor_id", "abbreviation")
+        rows = vendor.rows(batch.column("vendor_id"))  # "1" or 1 -> row of vendor 1
+        rows = vendor.abbreviation_rows(batch.column("vendor_id"))  # "CMT" -> row of vendor 1
+        descriptions = vendor.take("description", rows)
+    """
+
+    def __init__(self, table, id_column, abbreviation_column=None):
+        self.columns = {name: table.column(name).combine_chunks() for name in table.schema.names}
+        ids = self.columns[id_column]
+        numeric_ids = pc.cast(ids, pa.int64()).to_numpy(zero_copy_only=False)
+        self.ids = pa.array(numeric_ids, pa.int32())
+
+        # Numeric codes: dense array indexed by the code itself
+        self.dense = np.full(int(numeric_ids.max(initial=-1)) + 1, -1, dtype=np.int32)
+        self.dense[numeric_ids] = np.arange(len(numeric_ids), dtype=np.int32)
+
+        # Abbreviations, matched exactly like the pre-2015 yellow join
+        keys = {}
+        if abbreviation_column is not None:
+            for row, key in enumerate(self.columns[abbreviation_column].to_pylist()):
+                if key is not None:
+                    keys.setdefault(key, row)
+        self.abbreviation_keys = pa.array(list(keys), pa.string())
+        self.abbreviation_row_index = np.array(list(keys.values()), dtype=np.int32)
+
+    def rows(self, codes):
+        """
+        Lookup row of every numeric code; -1 where the code is null or unknown.
+
+        Args:
+            codes: Array or ChunkedArray of integer codes, or of strings
+                holding them ("1" and "01" are both code 1)
+
+        Returns:
+            numpy int32 array of row indices
+        """
+        if isinstance(codes, pa.ChunkedArray):
+            codes = codes.combine_chunks()
+        values, valid = _integer_codes(codes)
+        known = valid & (values >= 0) & (values < len(self.dense))
+        rows = np.full(len(values), -1, dtype=np.int32)
+        rows[known] = self.dense[values[known]]
+        return rows
+
+    def abbreviation_rows(self, codes):
+        """
+        Lookup row of every abbreviation; -1 where it is null or unknown.
+
+        Args:
+            codes: Array or ChunkedArray of string codes
+
+        Returns:
+            numpy int32 array of row indices
+        """
+        if isinstance(codes, pa.ChunkedArray):
+            codes = codes.combine_chunks()
+        positions = pc.fill_null(pc.index_in(codes.cast(pa.string()), value_set=self.abbreviation_keys), -1)
+        positions = positions.to_numpy(zero_copy_only=False)
+        rows = np.full(len(positions), -1, dtype=np.int32)
+        rows[positions >= 0] = self.abbreviation_row_index[positions[positions >= 0]]
+        return rows
+
+    def take(self, column, rows):
+        """Values of a lookup column for row indices from rows(); null where the row is -1."""
+        indices = pa.array(rows, pa.int32(), mask=rows < 0)
+        if column is None:
+            return self.ids.take(indices)
+        return self.columns[column].take(indices)
+
+
+class Enricher:
+    """
+    Add lookup descriptions and derived date parts to batches of one taxi type.
+
+    Usage:
+        enricher = Enricher(load_reference_data(reference_dir), "yellow")
+        enriched = enricher.enrich(batch, trip_month="07", trip_year="2014")
+    """
+
+    def __init__(self, reference, taxi_type):
+        self.taxi_type = taxi_type
+        self.lookup_columns = LOOKUP_COLUMNS[taxi_type]
+        self.code_columns = RESOLVED_CODE_COLUMNS[taxi_type]
+        self.abbreviation_era_end = ABBREVIATION_ERA_END.get(taxi_type)
+        self.dimensions = {
+            name: DimensionIndex(reference[table], id_column, abbreviation_column)
+            for name, (table, id_column, abbreviation_column) in DIMENSIONS.items()
+            if any(dimension == name for dimension, _, _ in self.lookup_columns.values())
+        }
+
+    def _abbreviated(self, batch, trip_year):
+        """Mask of the rows whose codes are abbreviations, or None if there are none."""
+        if self.abbreviation_era_end is None:
+            return None
+        if "trip_year" in batch.schema.names:
+            values, valid = _integer_codes(batch.column("trip_year"))
+            return valid & (values < self.abbreviation_era_end)
+        if trip_year is None:
+            raise ValueError("Batch has no trip_year column and no trip_year was given")
+        if int(trip_year) >= self.abbreviation_era_end:
+            return None
+        return np.ones(batch.num_rows, dtype=bool)
+
+    def enrich(self, batch, trip_month=None, trip_year=None):
+        """
+        Enrich one record batch of trips.
+
+        Args:
+            batch: RecordBatch with the canonical trip columns
+            trip_month: Trip month ("01"-"12") for batches read from a
+                partition dir, which carry no trip_month column
+            trip_year: Trip year, likewise; needed for yellow trips, whose
+                codes are abbreviations before 2015
+
+        Returns:
+            RecordBatch with the trip columns (yellow vendor_id and
+            payment_type as integers, see RESOLVED_CODE_COLUMNS), then the
+            lookup and derived columns
+        """
+        if "trip_month" in batch.schema.names:
+            trip_months = batch.column("trip_month")
+        elif trip_month is not None:
+            trip_months = pa.array([trip_month] * batch.num_rows, pa.string())
+        else:
+            raise ValueError("Batch has no trip_month column and no trip_month was given")
+        abbreviated = self._abbreviated(batch, trip_year)
+
+        # Resolve each (dimension, trip column) pair once: a zone id is used for three columns
+        rows = {}
+        for dimension, trip_column, _ in self.lookup_columns.values():
+            if (dimension, trip_column) not in rows:
+                index = self.dimensions[dimension]
+                codes = trip_months if trip_column == "trip_month" else batch.column(trip_column)
+                rows[(dimension, trip_column)] = index.rows(codes)
+                if abbreviated is not None and len(index.abbreviation_keys):
+                    rows[(dimension, trip_column)] = np.where(
+                        abbreviated, index.abbreviation_rows(codes), rows[(dimension, trip_column)],
+                    )
+
+        names, arrays = [], []
+        for name in batch.schema.names:
+            if name in self.code_columns:
+                # The code itself where it is numeric, else the id its abbreviation resolved to
+                dimension = self.code_columns[name]
+                values, valid = _integer_codes(batch.column(name))
+                if abbreviated is not None:
+                    id_rows = rows[(dimension, name)]
+                    ids = self.dimensions[dimension].ids.to_numpy()[np.maximum(id_rows, 0)]
+                    values = np.where(abbreviated, ids, values)
+                    valid = np.where(abbreviated, id_rows >= 0, valid)
+                arrays.append(pa.array(values, pa.int32(), mask=~valid))
+            else:
+                arrays.append(batch.column(name))
+            names.append(name)
+        for name, (dimension, trip_column, lookup_column) in self.lookup_columns.items():
+            arrays.append(self.dimensions[dimension].take(lookup_column, rows[(dimension, trip_column)]))
+            names.append(name)
+        for name in DERIVED_COLUMNS[self.taxi_type]:
+            if name == "partition_id":
+                timestamps = pc.cast(batch.column("pickup_datetime"), pa.timestamp("ms"), safe=False)
+                arrays.append(pc.cast(timestamps, pa.int64()))
+            else:
+                prefix, part = name.split("_", 1)
+                timestamps = batch.column(f"{prefix}_datetime")
+                if part == "date":
+                    arrays.append(pc.cast(timestamps, pa.date32()))
+                else:
+                    arrays.append(pc.cast(dict(_DATETIME_PARTS)[part](timestamps), pa.int32()))
+            names.append(name)
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def _partition_values(partition_dir):
+    month_dir = os.path.basename(partition_dir)
+    year_dir = os.path.basename(os.path.dirname(partition_dir))
+    return year_dir.split("=", 1)[1], month_dir.split("=", 1)[1]
+
+
+def enrich_table(reference, taxi_type, src_table_dir, dest_table_dir, incremental=True, metrics=None):
+    """
+    Enrich every trip_year/trip_month partition of a converted table.
+
+    Rows are deduplicated on row_fingerprint first when the table has one
+    (see fingerprint.py). A partition is skipped when its output is newer
+    than all of its source files.
+
+    Args:
+        reference: Dict of lookup table name to pyarrow Table, from load_reference_data()
+        taxi_type: "yellow" or "green"
+        src_table_dir: Converted table dir, e.g. .../yellow-taxi
+        dest_table_dir: Dir of the enriched table
+        incremental: Skip partitions whose output is up to date
+        metrics: RunMetrics to record each enriched partition in (see run_metrics.py)
+
+    Returns:
+        List of per-partition result dicts with rows and bytes in/out and elapsed seconds
+    """
+    enricher = Enricher(reference, taxi_type)
+    results = []
+    for partition_dir in sorted(glob.glob(os.path.join(src_table_dir, "trip_year=*", "trip_month=*"))):
+        src_paths = sorted(glob.glob(os.path.join(partition_dir, "*.parquet")))
+        if not src_paths:
+            continue
+        trip_year, trip_month = _partition_values(partition_dir)
+        dest_dir = os.path.join(dest_table_dir, f"trip_year={trip_year}", f"trip_month={trip_month}")
+        dest_path = os.path.join(dest_dir, f"part-{taxi_type}-enriched.parquet")
+        if incremental and os.path.exists(dest_path):
+            if os.path.getmtime(dest_path) >= max(os.path.getmtime(path) for path in src_paths):
+                continue
+
+        start_time = time.time()
+        with MemorySampler() as memory:
+            table = pq.read_table(src_paths)
+            rows_in = table.num_rows
+            if FINGERPRINT_COLUMN in table.schema.names:
+                table = dedup(table)
+            batches = [enricher.enrich(batch, trip_month, trip_year) for batch in table.to_batches()]
+            os.makedirs(dest_dir, exist_ok=True)
+            tmp_path = os.path.join(dest_dir, f".{os.path.basename(dest_path)}.tmp")
+            if batches:
+                pq.write_table(pa.Table.from_batches(batches), tmp_path, compression="zstd")
+                os.replace(tmp_path, dest_path)
+        result = {
+            "trip_year": trip_year,
+            "trip_month": trip_month,
+            "rows_in": rows_in,
+            "rows": table.num_rows,
+            "bytes_in": sum(os.path.getsize(path) for path in src_paths),
+            "bytes_out": os.path.getsize(dest_path) if batches else 0,
+            "seconds": time.time() - start_time,
+        }
+        if metrics:
+            metrics.add(
+                "transform", result["seconds"], partition=f"{taxi_type}/{trip_year}-{trip_month}",
+                rows_in=rows_in, rows_out=result["rows"],
+                bytes_in=result["bytes_in"], bytes_out=result["bytes_out"],
+                peak_memory=memory.peak_bytes,
+            )
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enrich converted taxi trips with lookup data")
+    parser.add_argument("reference_dir", help="Dir with the reference CSVs")
+    parser.add_argument("src_data_dir_root", help="Root dir of the converted <type>-taxi tables")
+    parser.add_argument("dest_data_dir_root", help="Root dir for the enriched <type>-taxi tables")
+    parser.add_argument("--taxi-type", choices=TAXI_TYPES, action="append",
+                        help="Taxi type to enrich (repeatable, default: all)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Enrich every partition, even if its output is up to date")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        reference = load_reference_data(args.reference_dir)
+        metrics = metrics_from_args(args)
+        with metrics.stage("transform") if metrics else nullcontext({}) as counters:
+            for taxi_type in args.taxi_type or TAXI_TYPES:
+                start_time = time.time()
+                results = enrich_table(
+                    reference, taxi_type,
+                    destination_dir(args.src_data_dir_root, taxi_type),
+                    destination_dir(args.dest_data_dir_root, taxi_type),
+                    incremental=not args.full_refresh,
+                    metrics=metrics,
+                )
+                rows = sum(result["rows"] for result in results)
+                duplicates = sum(result["rows_in"] - result["rows"] for result in results)
+                print(f"Type={taxi_type}; enriched {len(results)} partitions, {rows} rows "
+                      f"({duplicates} duplicates dropped) in {time.time() - start_time:.1f}s")
+                for name, key in (("rows_in", "rows_in"), ("rows_out", "rows"), ("bytes_in", "bytes_in"),
+                                  ("bytes_out", "bytes_out")):
+                    counters[name] = counters.get(name, 0) + sum(result[key] for result in results)
+    except Exception as e:
+        print(f"Error enriching data: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Local stand-in for a SQL warehouse, for testing report execution.
+
+``FakeWarehouse`` implements the adapter interface of report_runner.py
+(submit / poll / cancel) without any network: each statement "runs" for a
+simulated latency, queues while all of the warehouse's slots are busy, and
+then returns the result of an optional local ``execute`` function (e.g.
+DuckDB over a local mat view) or an empty DataFrame.
+
+Latency is either fixed per query or drawn deterministically from the SQL
+text, so runs are reproducible.
+
+With ``chunk_rows`` set, results are served like the Databricks statement
+execution API's ``ARROW_STREAM`` format: a succeeded poll returns the list of
+result chunks (index, row count, byte count) instead of a DataFrame, and
+``fetch_chunk`` returns each chunk as Arrow IPC stream bytes, after an
+optional simulated download time. ``execute`` may then return a pyarrow
+Table, so large results never go through pandas (see result_stream.py).
+"""
+
+import hashlib
+import itertools
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+from .report_runner import CANCELED, FAILED, PENDING, RUNNING, SUCCEEDED
+
+
+class FakeWarehouse:
+    """
+    Simulated warehouse with a fixed number of concurrent query slots.
+
+    Usage:
+        warehouse = FakeWarehouse(min_latency_seconds=0.2, max_latency_seconds=2.0, slots=4)
+        runner = ReportRunner(warehouse, max_concurrency=8)
+    """
+
+    def __init__(self, min_latency_seconds=0.5, max_latency_seconds=3.0, slots=4,
+                 latency=None, execute=None, clock=time.monotonic, chunk_rows=None,
+                 chunk_latency_seconds=0.0, sleep=time.sleep):
+        """
+        Args:
+            min_latency_seconds: Shortest simulated run time
+            max_latency_seconds: Longest simulated run time
+            slots: Statements that run at once; later ones queue as PENDING
+            latency: Optional function of the SQL text returning its run time in seconds
+            execute: Optional function of the SQL text returning a pandas
+                DataFrame (or, with chunk_rows, a pyarrow Table)
+            clock: Time source, monotonic seconds
+            chunk_rows: Serve results as Arrow chunks of this many rows
+            chunk_latency_seconds: Simulated download time per chunk
+            sleep: Sleep function for the chunk download time
+        """
+        self.min_latency_seconds = min_latency_seconds
+        self.max_latency_seconds = max_latency_seconds
+        self.slots = slots
+        self.latency = latency or self._hashed_latency
+        self.execute = execute
+        self.clock = clock
+        self.chunk_rows = chunk_rows
+        self.chunk_latency_seconds = chunk_latency_seconds
+        self.sleep = sleep
+        self.chunks_fetched = 0
+        self.statements = {}
+        self.polls = 0
+        self._ids = itertools.count(1)
+
+    def _hashed_latency(self, sql):
+        fraction = int(hashlib.sha256(sql.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return self.min_latency_seconds + fraction * (self.max_latency_seconds - self.min_latency_seconds)
+
+    def _advance(self):
+        # Start queued statements, oldest first, as slots free up
+        now = self.clock()
+        running = [s for s in self.statements.values() if s["state"] == RUNNING]
+        for statement in running:
+            if now >= statement["finish_at"]:
+                self._finish(statement)
+        busy = sum(1 for s in self.statements.values() if s["state"] == RUNNING)
+        for statement in self.statements.values():
+            if busy >= self.slots:
+                break
+            if statement["state"] == PENDING:
+                statement["state"] = RUNNING
+                statement["started_at"] = now
+                statement["finish_at"] = now + statement["latency"]
+                busy += 1
+
+    def _finish(self, statement):
+        try:
+            statement["result"] = self.execute(statement["sql"]) if self.execute else pd.DataFrame()
+            if self.chunk_rows:
+                result = statement["result"]
+                if isinstance(result, pd.DataFrame):
+                    result = pa.Table.from_pandas(result, preserve_index=False)
+                statement["result"] = result
+                statement["chunks"] = [
+                    {
+                        "chunk_index": index,
+                        "row_offset": offset,
+                        "row_count": min(self.chunk_rows, result.num_rows - offset),
+                        "byte_count": result.slice(offset, self.chunk_rows).nbytes,
+                    }
+                    for index, offset in enumerate(range(0, max(result.num_rows, 1), self.chunk_rows))
+                ]
+            statement["state"] = SUCCEEDED
+        except Exception as e:
+            statement["error"] = str(e)
+            statement["state"] = FAILED
+
+    def submit(self, sql):
+        """Queue a statement; returns its id."""
+        statement_id = f"fake-{next(self._ids)}"
+        self.statements[statement_id] = {
+            "sql": sql,
+            "state": PENDING,
+            "latency": self.latency(sql),
+            "submitted_at": self.clock(),
+            "result": None,
+            "error": None,
+        }
+        self._advance()
+        return statement_id
+
+    def poll(self, statement_id):
+        """
+        Current state of a statement.
+
+        Returns:
+            (state, result): result is a DataFrame (with chunk_rows, the list
+            of result chunks) when SUCCEEDED, an error message when FAILED,
+            otherwise None
+        """
+        self.polls += 1
+        self._advance()
+        statement = self.statements[statement_id]
+        if statement["state"] == SUCCEEDED:
+            if self.chunk_rows:
+                return SUCCEEDED, [dict(chunk) for chunk in statement["chunks"]]
+            return SUCCEEDED, statement["result"]
+        if statement["state"] == FAILED:
+            return FAILED, statement["error"]
+        return statement["state"], None
+
+    def fetch_chunk(self, statement_id, chunk_index):
+        """One result chunk of a succeeded statement, as Arrow IPC stream bytes."""
+        statement = self.statements[statement_id]
+        if statement["state"] != SUCCEEDED or "chunks" not in statement:
+            raise ValueError(f"Statement {statement_id} has no chunked result")
+        chunk = statement["chunks"][chunk_index]
+        if self.chunk_latency_seconds:
+            self.sleep(self.chunk_latency_seconds)
+        table = statement["result"].slice(chunk["row_offset"], chunk["row_count"])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        self.chunks_fetched += 1
+        return sink.getvalue()
+
+    def cancel(self, statement_id):
+        statement = self.statements[statement_id]
+        if statement["state"] in (PENDING, RUNNING):
+            statement["state"] = CANCELED
+        self._advance()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Compact row fingerprints for deduplicating taxi trips.
+
+The transform SQL and taxi_trips_mat_view deduplicate with ``SELECT DISTINCT``
+over about 50 columns: the raw trip fields, the joined lookup descriptions
+and the derived pickup/dropoff year...second columns. Everything after the
+raw fields is a function of them, so two rows of the same partition are
+duplicates exactly when their raw fields are equal. A fingerprint of the raw
+fields, computed once at load time, lets dedup hash and shuffle 8 (or 16)
+bytes per row before the lookup joins instead of the full wide row after
+them.
+
+Fingerprints are computed over Arrow record batches with numpy: each column
+is reduced to 64 bits (strings with a vectorized FNV-1a over their distinct
+values, numbers and timestamps to their bit patterns, nulls to a fixed value) and
+the column hashes are folded together with the splitmix64 finalizer.
+
+The 128-bit variant adds a second, independent 64-bit half: its string
+columns are hashed again by a seeded hash that runs every byte through
+splitmix64, so its collisions are unrelated to those of FNV-1a, and its
+nulls get a seeded value. Two rows colliding in one half almost never collide
+in the other. Numbers and timestamps need no second hash: their bit patterns
+are exact.
+
+Usage:
+    python -m NYCTaxi.fingerprint <table_dir> [--reps 3]
+        Benchmark the wide SELECT DISTINCT against dedup on row_fingerprint
+        on DuckDB, over a table converted with ``--fingerprint-bits``.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+FINGERPRINT_COLUMN = "row_fingerprint"
+FINGERPRINT_BITS = (64, 128)
+
+# Columns that never take part in the fingerprint: partition values are the
+# same for every row a dedup compares
+EXCLUDED_COLUMNS = {FINGERPRINT_COLUMN, "trip_year", "trip_month"}
+
+_SEEDS = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F))
+_NULL_HASH = np.uint64(0x5BD1E9955BD1E995)
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+_COMBINE_MULTIPLIER = np.uint64(31)
+
+
+def _splitmix64(x):
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _seed_hash(seed):
+    return _splitmix64(np.array([seed], dtype=np.uint64))[0]
+
+
+def _string_hash(array, seed=None):
+    # FNV-1a over the bytes of every value at once: one vectorized step per
+    # byte position, and taxi strings are short (coordinates are the longest).
+    # With a seed, each step is a splitmix64 of the state and the byte instead
+    offset_type = np.int64 if pa.types.is_large_string(array.type) else np.int32
+    offsets = np.frombuffer(array.buffers()[1], dtype=offset_type)[array.offset:array.offset + len(array) + 1]
+    offsets = offsets.astype(np.int64)
+    data = array.buffers()[2]
+    data = np.frombuffer(data, dtype=np.uint8) if data is not None else np.empty(0, dtype=np.uint8)
+    starts = offsets[:-1]
+    lengths = offsets[1:] - starts
+    basis = _FNV_OFFSET if seed is None else _seed_hash(seed)
+    hashes = np.full(len(array), basis, dtype=np.uint64) ^ lengths.astype(np.uint64)
+    for position in range(int(lengths.max(initial=0))):
+        rows = np.nonzero(lengths > position)[0]
+        mixed = hashes[rows] ^ data[starts[rows] + position]
+        hashes[rows] = mixed * _FNV_PRIME if seed is None else _splitmix64(mixed)
+    return hashes
+
+
+def column_hash(array, seed=None):
+    """
+    64-bit hash of every value of an Arrow array.
+
+    Args:
+        array: Array or ChunkedArray of strings, integers, floats or timestamps
+        seed: None for the default hash, or a uint64 seed for an independent
+            one (strings and nulls hash differently, other values as without)
+
+    Returns:
+        numpy uint64 array with one hash per value
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        # Hash each distinct value once; most string columns are codes or flags
+        encoded = pc.dictionary_encode(array)
+        indices = pc.fill_null(encoded.indices, 0).to_numpy()
+        if len(encoded.dictionary):
+            hashes = _string_hash(encoded.dictionary, seed)[indices]
+        else:
+            hashes = np.zeros(len(array), np.uint64)
+    elif pa.types.is_timestamp(array.type):
+        hashes = pc.fill_null(array.cast(pa.int64()), 0).to_numpy().view(np.uint64)
+    elif pa.types.is_floating(array.type):
+        # +0.0 and -0.0 are DISTINCT-equal, so they must hash equally
+        values = pc.fill_null(array.cast(pa.float64()), 0.0).to_numpy() + 0.0
+        hashes = values.view(np.uint64)
+    elif pa.types.is_integer(array.type):
+        hashes = pc.fill_null(array.cast(pa.int64()), 0).to_numpy().view(np.uint64)
+    else:
+        raise TypeError(f"Cannot fingerprint column of type {array.type}")
+    # Raw bit patterns are fine here: the fold mixes each column in with splitmix64
+    hashes = hashes.astype(np.uint64, copy=True)
+    if array.null_count:
+        null_hash = _NULL_HASH if seed is None else _NULL_HASH ^ _seed_hash(seed)
+        hashes[array.is_null().to_numpy(zero_copy_only=False)] = null_hash
+    return hashes
+
+
+def fingerprint_columns(schema):
+    """Names of the columns a fingerprint covers, in schema order."""
+    return [name for name in schema.names if name not in EXCLUDED_COLUMNS]
+
+
+def _fold(column_hashes, seed, num_rows):
+    fingerprint = np.full(num_rows, seed, dtype=np.uint64)
+    for hashes in column_hashes:
+        fingerprint = _splitmix64(fingerprint * _COMBINE_MULTIPLIER + hashes)
+    return fingerprint
+
+
+def fingerprint_array(batch, bits=64):
+    """
+    Fingerprint of the raw trip fields of every row of a record batch.
+
+    Args:
+        batch: RecordBatch or Table of trip rows
+        bits: 64 for an int64 fingerprint, 128 for a fixed_size_binary(16) one
+
+    Returns:
+        pyarrow array with one fingerprint per row
+    """
+    if bits not in FINGERPRINT_BITS:
+        raise ValueError(f"Unsupported fingerprint size: {bits} bits")
+    names = fingerprint_columns(batch.schema)
+    low = _fold([column_hash(batch.column(name)) for name in names], _SEEDS[0], batch.num_rows)
+    if bits == 64:
+        # Stored signed: Spark, BigQuery and Snowflake have no unsigned 64-bit type
+        return pa.array(low.view(np.int64), pa.int64())
+    # Independent column hashes, so a string collision in the low half is not one in the high half
+    high = _fold([column_hash(batch.column(name), _SEEDS[1]) for name in names], _SEEDS[1], batch.num_rows)
+    data = np.column_stack([low, high]).tobytes()
+    return pa.FixedSizeBinaryArray.from_buffers(pa.binary(16), batch.num_rows, [None, pa.py_buffer(data)])
+
+
+def fingerprint_field(bits=64):
+    """Schema field of the fingerprint column."""
+    return pa.field(FINGERPRINT_COLUMN, pa.int64() if bits == 64 else pa.binary(16))
+
+
+def with_fingerprint(batch, bits=64):
+    """Append the row_fingerprint column to a record batch."""
+    return pa.RecordBatch.from_arrays(
+        batch.columns + [fingerprint_array(batch, bits)],
+        schema=batch.schema.append(fingerprint_field(bits)),
+    )
+
+
+def dedup(table, column=FINGERPRINT_COLUMN):
+    """
+    Drop rows whose fingerprint already occurred, keeping the first occurrence.
+
+    The table is expected to hold one (taxi_type, trip_year, trip_month)
+    partition, the scope in which the SQL deduplicates.
+
+    Args:
+        table: Table with a fingerprint column
+        column: Name of the fingerprint column
+
+    Returns:
+        Table with one row per distinct fingerprint, in original order
+    """
+    fingerprints = table.column(column).combine_chunks()
+    if pa.types.is_fixed_size_binary(fingerprints.type):
+        values = np.frombuffer(fingerprints.buffers()[1], dtype=np.uint64)
+        values = values[2 * fingerprints.offset:2 * (fingerprints.offset + len(fingerprints))]
+        keys = values.view([("low", np.uint64), ("high", np.uint64)])
+    else:
+        keys = fingerprints.to_numpy()
+    _, first = np.unique(keys, return_index=True)
+    if len(first) == table.num_rows:
+        return table
+    return table.take(pa.array(np.sort(first)))
+
+
+DERIVED_COLUMNS_SQL = """
+      year(pickup_datetime) AS pickup_year,
+      month(pickup_datetime) AS pickup_month,
+      day(pickup_datetime) AS pickup_day,
+      hour(pickup_datetime) AS pickup_hour,
+      minute(pickup_datetime) AS pickup_minute,
+      second(pickup_datetime) AS pickup_second,
+      year(dropoff_datetime) AS dropoff_year,
+      month(dropoff_datetime) AS dropoff_month,
+      day(dropoff_datetime) AS dropoff_day,
+      hour(dropoff_datetime) AS dropoff_hour,
+      minute(dropoff_datetime) AS dropoff_minute,
+      second(dropoff_datetime) AS dropoff_second"""
+
+
+def benchmark_queries(table_dir):
+    """
+    The two dedup variants, as DuckDB SQL over a converted table dir.
+
+    Returns:
+        Dict of query name to SQL; both return the same rows
+    """
+    # Imported here so the fingerprint functions work without DuckDB installed
+    import duckdb
+
+    source = f"read_parquet('{table_dir}/*/*/*.parquet', hive_partitioning = true)"
+    columns = [
+        name for name in duckdb.sql(f"DESCRIBE SELECT * FROM {source}").fetchall()
+        if name[0] != FINGERPRINT_COLUMN
+    ]
+    select_list = ",\n      ".join(f'"{name[0]}"' for name in columns)
+    return {
+        "distinct": f"""
+            SELECT DISTINCT
+              {select_list},{DERIVED_COLUMNS_SQL}
+            FROM {source}""",
+        "fingerprint": f"""
+            SELECT
+              {select_list},{DERIVED_COLUMNS_SQL}
+            FROM (
+              SELECT DISTINCT ON (taxi_type, trip_year, trip_month, {FINGERPRINT_COLUMN}) *
+              FROM {source}
+            )""",
+    }
+
+
+def run_benchmark(table_dir, reps=3):
+    """
+    Time the wide SELECT DISTINCT against dedup on row_fingerprint.
+
+    Each query's result is counted inside DuckDB so the timing excludes
+    fetching rows into Python.
+
+    Returns:
+        Dict of query name to {"rows", "seconds": [per rep], "median"}
+    """
+    import duckdb
+
+    con = duckdb.connect()
+    results = {}
+    for name, query in benchmark_queries(table_dir).items():
+        timings = []
+        for _ in range(reps):
+            start_time = time.time()
+            rows = con.execute(f"SELECT count(1) FROM ({query})").fetchone()[0]
+            timings.append(time.time() - start_time)
+        results[name] = {"rows": rows, "seconds": timings, "median": statistics.median(timings)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wide SELECT DISTINCT against fingerprint dedup")
+    parser.add_argument("table_dir", help="Table converted with --fingerprint-bits (e.g. .../yellow-taxi)")
+    parser.add_argument("--reps", type=int, default=3, help="Runs per query (default: 3)")
+    args = parser.parse_args()
+
+    try:
+        results = run_benchmark(args.table_dir, args.reps)
+        for name, result in results.items():
+            print(f"{name}: {result['rows']} rows, median {result['median']:.2f}s "
+                  f"({', '.join(f'{s:.2f}' for s in result['seconds'])})")
+        if results["distinct"]["rows"] != results["fingerprint"]["rows"]:
+            print("Warning: row counts differ between the two dedup variants")
+        print(f"Speedup: {results['distinct']['median'] / results['fingerprint']['median']:.1f}x")
+    except Exception as e:
+        print(f"Error running benchmark: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
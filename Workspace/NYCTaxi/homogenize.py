@@ -0,0 +1,240 @@
+"""
+Single-pass schema homogenization for taxi trip record batches.
+
+``getSchemaHomogenizedDataframe`` in the load-data notebooks reaches the
+canonical column list through a chain of withColumn/drop/withColumnRenamed
+calls per era, adding junk1/junk2 fillers and casting coordinates to strings.
+Here each era is a declarative mapping from canonical column to one of:
+
+- ``Source(name)``: a CSV column, parsed straight into the canonical type
+  (coordinates are read as text, so there is no double -> string cast)
+- ``Constant(value)``: a literal, built once per batch length and reused
+- ``Derived(name)``: computed from the pickup timestamp (trip_year / trip_month)
+
+``Homogenizer`` applies the mapping to each Arrow record batch as one
+projection: source columns are passed through by reference, so every value
+is touched once, by the CSV parser.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .schemas import CANONICAL_COLUMNS, get_schema_era, get_taxi_schema
+
+ARROW_TYPES = {
+    "string": pa.string(),
+    "integer": pa.int32(),
+    "double": pa.float64(),
+    "timestamp": pa.timestamp("us"),
+}
+
+PARTITION_COLUMNS = ["trip_year", "trip_month"]
+
+Source = namedtuple("Source", ["name"])
+Constant = namedtuple("Constant", ["value"])
+Derived = namedtuple("Derived", ["name"])
+
+COORDINATE_COLUMNS = ["pickup_longitude", "pickup_latitude", "dropoff_longitude", "dropoff_latitude"]
+LOCATION_ID_COLUMNS = ["pickup_location_id", "dropoff_location_id"]
+
+_YELLOW_TYPES = {
+    "taxi_type": "string",
+    "vendor_id": "string",
+    "pickup_datetime": "timestamp",
+    "dropoff_datetime": "timestamp",
+    "store_and_fwd_flag": "string",
+    "rate_code_id": "integer",
+    "pickup_location_id": "integer",
+    "dropoff_location_id": "integer",
+    "pickup_longitude": "string",
+    "pickup_latitude": "string",
+    "dropoff_longitude": "string",
+    "dropoff_latitude": "string",
+    "passenger_count": "integer",
+    "trip_distance": "double",
+    "fare_amount": "double",
+    "extra": "double",
+    "mta_tax": "double",
+    "tip_amount": "double",
+    "tolls_amount": "double",
+    "improvement_surcharge": "double",
+    "total_amount": "double",
+    "payment_type": "string",
+    "trip_year": "string",
+    "trip_month": "string",
+}
+
+_GREEN_TYPES = dict(
+    _YELLOW_TYPES,
+    vendor_id="integer",
+    ehail_fee="double",
+    payment_type="integer",
+    trip_type="integer",
+)
+
+# Canonical (name, type name) schema per taxi type, in canonical column order
+CANONICAL_SCHEMAS = {
+    taxi_type: [(name, types[name]) for name in CANONICAL_COLUMNS[taxi_type]]
+    for taxi_type, types in (("yellow", _YELLOW_TYPES), ("green", _GREEN_TYPES))
+}
+
+
+def arrow_schema(fields):
+    """Build a pyarrow schema from a list of (name, type name) tuples."""
+    return pa.schema([(name, ARROW_TYPES[type_name]) for name, type_name in fields])
+
+
+def era_mapping(taxi_type, trip_year, trip_month):
+    """
+    Declarative mapping from canonical column to its source for one month.
+
+    Equivalent to the per-era branches of ``getSchemaHomogenizedDataframe``:
+    eras with raw coordinates get location ids of 0, later eras get empty
+    coordinate strings, pre-2015 gets an improvement surcharge of 0.0, and
+    junk1/junk2 are never read.
+
+    Args:
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+
+    Returns:
+        Dict of canonical column name to Source, Constant or Derived
+    """
+    source_schema = get_taxi_schema(taxi_type, trip_year, trip_month)
+    if source_schema is None:
+        raise ValueError(f"No {taxi_type} schema for {trip_year}-{trip_month:02d}")
+    source_columns = {name for name, _ in source_schema}
+
+    mapping = {}
+    for name in CANONICAL_COLUMNS[taxi_type]:
+        if name in PARTITION_COLUMNS:
+            mapping[name] = Derived(name)
+        elif name == "taxi_type":
+            mapping[name] = Constant(taxi_type)
+        elif name in source_columns:
+            mapping[name] = Source(name)
+        elif name in LOCATION_ID_COLUMNS:
+            mapping[name] = Constant(0)
+        elif name in COORDINATE_COLUMNS:
+            mapping[name] = Constant("")
+        elif name == "improvement_surcharge":
+            mapping[name] = Constant(0.0)
+        else:
+            raise ValueError(f"No source for column {name} in {taxi_type} {get_schema_era(taxi_type, trip_year, trip_month)}")
+    return mapping
+
+
+class Homogenizer:
+    """
+    Project record batches of one source month onto the canonical schema.
+
+    Usage:
+        homogenizer = Homogenizer("yellow", 2014, 6)
+        # read the CSV with homogenizer.read_column_names / read_column_types
+        for key, batch in homogenizer.split(csv_batch):
+            ...
+    """
+
+    def __init__(self, taxi_type, trip_year, trip_month):
+        self.taxi_type = taxi_type
+        self.trip_year = trip_year
+        self.trip_month = trip_month
+        self.mapping = era_mapping(taxi_type, trip_year, trip_month)
+        self.canonical_schema = arrow_schema(CANONICAL_SCHEMAS[taxi_type])
+        self.data_schema = pa.schema(
+            [field for field in self.canonical_schema if field.name not in PARTITION_COLUMNS]
+        )
+
+        # CSV columns in file order; all are named so positions line up with the
+        # header, but only mapped ones are read, already in their canonical type
+        self.read_column_names = [name for name, _ in get_taxi_schema(taxi_type, trip_year, trip_month)]
+        sources = {spec.name for spec in self.mapping.values() if isinstance(spec, Source)}
+        self.read_column_types = pa.schema(
+            [field for field in self.canonical_schema if field.name in sources]
+        )
+        self.source_partition = (str(trip_year), f"{trip_month:02d}")
+        next_year, next_month = (trip_year + 1, 1) if trip_month == 12 else (trip_year, trip_month + 1)
+        self._month_start = pa.scalar(datetime(trip_year, trip_month, 1), pa.timestamp("us")).value
+        self._month_end = pa.scalar(datetime(next_year, next_month, 1), pa.timestamp("us")).value
+        self._constants = {}
+
+    def _constant(self, name, value, length):
+        # One array per (column, value), grown to the longest batch so far and
+        # sliced (zero-copy) to each batch's length
+        key = (name, value)
+        array = self._constants.get(key)
+        if array is None or len(array) < length:
+            array = pa.array([value] * length, self.canonical_schema.field(name).type)
+            self._constants[key] = array
+        return array.slice(0, length)
+
+    def _in_source_month(self, pickup):
+        # Fast path: every pickup falls inside the source month, so the derived
+        # partition columns are constant and need not be computed row by row
+        if pickup.null_count > 0 or len(pickup) == 0:
+            return False
+        bounds = pc.min_max(pickup)
+        return bounds["min"].value >= self._month_start and bounds["max"].value < self._month_end
+
+    def _project(self, batch, names, partition=None):
+        arrays = []
+        for name in names:
+            spec = self.mapping[name]
+            if isinstance(spec, Source):
+                arrays.append(batch.column(name))
+            elif isinstance(spec, Constant):
+                arrays.append(self._constant(name, spec.value, batch.num_rows))
+            elif partition is not None:
+                arrays.append(self._constant(name, partition[PARTITION_COLUMNS.index(name)], batch.num_rows))
+            else:
+                fmt = "%Y" if name == "trip_year" else "%m"
+                arrays.append(pc.strftime(batch.column("pickup_datetime"), fmt))
+        return arrays
+
+    def apply(self, batch):
+        """
+        Project a source record batch onto the full canonical schema.
+
+        Args:
+            batch: RecordBatch read with read_column_names / read_column_types
+
+        Returns:
+            RecordBatch with the canonical columns, in canonical order
+        """
+        pickup = batch.column("pickup_datetime")
+        partition = self.source_partition if self._in_source_month(pickup) else None
+        arrays = self._project(batch, self.canonical_schema.names, partition)
+        return pa.RecordBatch.from_arrays(arrays, schema=self.canonical_schema)
+
+    def split(self, batch):
+        """
+        Project a source record batch and split it by (trip_year, trip_month).
+
+        Args:
+            batch: RecordBatch read with read_column_names / read_column_types
+
+        Yields:
+            ((trip_year, trip_month), RecordBatch of the non-partition canonical columns)
+        """
+        if batch.num_rows == 0:
+            return
+        if self._in_source_month(batch.column("pickup_datetime")):
+            arrays = self._project(batch, self.data_schema.names)
+            yield self.source_partition, pa.RecordBatch.from_arrays(arrays, schema=self.data_schema)
+            return
+
+        canonical = pa.Table.from_batches([self.apply(batch)])
+        partitions = canonical.group_by(PARTITION_COLUMNS).aggregate([]).to_pylist()
+        for partition in partitions:
+            key = (partition["trip_year"], partition["trip_month"])
+            mask = pc.and_kleene(
+                pc.equal(canonical["trip_year"], key[0]) if key[0] is not None else pc.is_null(canonical["trip_year"]),
+                pc.equal(canonical["trip_month"], key[1]) if key[1] is not None else pc.is_null(canonical["trip_month"]),
+            )
+            part = canonical.filter(mask).select(self.data_schema.names)
+            for part_batch in part.to_batches():
+                yield key, part_batch
@@ -0,0 +1,257 @@
+"""
+Incremental load manifest for converted taxi trip tables.
+
+Records, per source month of a destination table, the source CSV's size,
+mtime and content hash together with the Parquet files written for it and
+their row counts. The converter consults it to reconvert only new or changed
+months, and the row counts answer ``COUNT(1)`` without scanning the table.
+
+The manifest is a JSON file in the table directory (``_load_manifest.json``);
+the leading underscore keeps Spark and Hive from treating it as data.
+"""
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+MANIFEST_FILE_NAME = "_load_manifest.json"
+MANIFEST_VERSION = 1
+
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def file_sha256(path):
+    """Content hash of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingReader:
+    """
+    Binary file wrapper that hashes content as it is read.
+
+    Lets the converter hash the source CSV in the same pass that parses it.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._digest = hashlib.sha256()
+        self.closed = False
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._digest.update(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def hexdigest(self):
+        """Hash of everything read so far; the whole file once reading is done."""
+        # Hash any remainder the reader did not consume, e.g. trailing skipped rows
+        for chunk in iter(lambda: self._file.read(HASH_CHUNK_BYTES), b""):
+            self._digest.update(chunk)
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._file.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def month_key(trip_year, trip_month):
+    """Manifest key of a source month, e.g. "2016-07"."""
+    return f"{trip_year}-{trip_month:02d}"
+
+
+def partition_of(path):
+    """(trip_year, trip_month) partition values from a hive-partitioned file path."""
+    values = dict(
+        part.split("=", 1) for part in path.replace(os.sep, "/").split("/") if "=" in part
+    )
+    return values["trip_year"], values["trip_month"]
+
+
+class LoadManifest:
+    """
+    Manifest of converted source months for one destination table.
+
+    Usage:
+        manifest = LoadManifest.load(dest_dir)
+        if not manifest.is_current(2016, 7, src_path):
+            ...convert...
+            manifest.record(2016, 7, source, outputs, rows_by_partition)
+        manifest.save()
+    """
+
+    def __init__(self, table_dir, entries=None):
+        self.table_dir = table_dir
+        self.path = os.path.join(table_dir, MANIFEST_FILE_NAME)
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, table_dir):
+        """Load the manifest of a table dir, or start an empty one."""
+        path = os.path.join(table_dir, MANIFEST_FILE_NAME)
+        if not os.path.exists(path):
+            return cls(table_dir)
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            print(f"Ignoring manifest {path} with unsupported version {manifest.get('version')}")
+            return cls(table_dir)
+        return cls(table_dir, manifest["entries"])
+
+    def save(self):
+        """Write the manifest atomically so an interrupted run never leaves it half written."""
+        os.makedirs(self.table_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, trip_year, trip_month):
+        """Manifest entry of a source month, or None."""
+        return self.entries.get(month_key(trip_year, trip_month))
+
+    def is_current(self, trip_year, trip_month, src_path, options=None):
+        """
+        Check whether a source month was already converted from identical content
+        with the same conversion options.
+
+        Size and mtime are compared first; the content hash is only computed
+        when they differ in mtime alone (e.g. the file was copied again).
+
+        Args:
+            trip_year: Trip year
+            trip_month: Trip month (1-12)
+            src_path: Path of the source CSV
+            options: Dict of conversion options that change the output (e.g. fingerprint_bits)
+
+        Returns:
+            True if the month's outputs are up to date with the source
+        """
+        entry = self.get(trip_year, trip_month)
+        if entry is None or not os.path.exists(src_path):
+            return False
+        if entry.get("options", {}) != (options or {}):
+            return False
+        if not all(os.path.exists(os.path.join(self.table_dir, path)) for path in entry["outputs"]):
+            return False
+
+        stat = os.stat(src_path)
+        source = entry["source"]
+        if stat.st_size != source["size"]:
+            return False
+        if stat.st_mtime_ns == source["mtime_ns"]:
+            return True
+
+        if file_sha256(src_path) != source["sha256"]:
+            return False
+        # Same content with a new mtime: remember the mtime to skip hashing next time
+        source["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def record(self, trip_year, trip_month, source, outputs, rows_by_partition, options=None):
+        """
+        Record a converted source month.
+
+        Args:
+            trip_year: Trip year
+            trip_month: Trip month (1-12)
+            source: Dict with the source CSV's path, size, mtime_ns and sha256,
+                taken when the conversion started
+            outputs: Paths of the Parquet files written for the month
+            rows_by_partition: Dict of (trip_year, trip_month) partition values to row count
+            options: Dict of conversion options the outputs were written with
+        """
+        self.entries[month_key(trip_year, trip_month)] = {
+            "source": dict(source),
+            "outputs": sorted(os.path.relpath(path, self.table_dir) for path in outputs),
+            "rows": {
+                f"trip_year={year}/trip_month={month}": count
+                for (year, month), count in sorted(rows_by_partition.items())
+            },
+            "options": dict(options or {}),
+        }
+
+    def replace_outputs(self, old_paths, new_paths):
+        """
+        Swap rewritten Parquet files in the entries that recorded them, e.g. after
+        compact.py merged a month's parts, so the month is not reconverted.
+        """
+        old = {os.path.relpath(path, self.table_dir) for path in old_paths}
+        new = [os.path.relpath(path, self.table_dir) for path in new_paths]
+        for entry in self.entries.values():
+            if old & set(entry["outputs"]):
+                entry["outputs"] = sorted((set(entry["outputs"]) - old) | set(new))
+
+    def output_paths(self, trip_year, trip_month):
+        """Absolute paths of the Parquet files recorded for a source month."""
+        entry = self.get(trip_year, trip_month)
+        if entry is None:
+            return None
+        return [os.path.join(self.table_dir, path) for path in entry["outputs"]]
+
+    def partitions(self, trip_year, trip_month):
+        """Set of (trip_year, trip_month) partitions a source month wrote to."""
+        entry = self.get(trip_year, trip_month)
+        if entry is None:
+            return set()
+        return {partition_of(partition) for partition in entry["rows"]}
+
+    def row_counts(self):
+        """Row count per (trip_year, trip_month) partition across all source months."""
+        counts = defaultdict(int)
+        for entry in self.entries.values():
+            for partition, count in entry["rows"].items():
+                counts[partition_of(partition)] += count
+        return dict(counts)
+
+    def total_rows(self):
+        """Total rows in the table, the answer to ``select COUNT(1)``."""
+        return sum(self.row_counts().values())
+
+
+def partition_refresh_statements(table_name, changed_partitions, row_counts):
+    """
+    SQL to refresh only the changed partitions of an external Parquet table.
+
+    Replaces ``FSCK REPAIR TABLE`` / ``MSCK REPAIR TABLE``, which list every
+    partition of the table. Only for tables created ``USING parquet
+    PARTITIONED BY (trip_year, trip_month)`` over the converted dir: Delta
+    tables, like the ones the load-data notebooks create, have no partitions
+    to add or drop and reject these statements; their files are tracked in the
+    Delta log, which plain Parquet output never updates.
+
+    Args:
+        table_name: Fully qualified table name
+        changed_partitions: Iterable of (trip_year, trip_month) partitions that were rewritten
+        row_counts: Current row count per partition, from LoadManifest.row_counts()
+
+    Returns:
+        List of SQL statements
+    """
+    statements = []
+    for year, month in sorted(changed_partitions):
+        spec = f"trip_year='{year}', trip_month='{month}'"
+        if row_counts.get((year, month)):
+            statements.append(f"ALTER TABLE {table_name} ADD IF NOT EXISTS PARTITION ({spec});")
+        else:
+            statements.append(f"ALTER TABLE {table_name} DROP IF EXISTS PARTITION ({spec});")
+    if statements:
+        # Drop cached file listings so the rewritten partitions are read again
+        statements.append(f"REFRESH TABLE {table_name};")
+    return statements
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Partition-level incremental refresh of taxi_trips_mat_view, locally on DuckDB.
+
+``3-transform-create-materialize-view.sql`` rebuilds the whole mat view with
+``CREATE OR REPLACE TABLE ... AS SELECT DISTINCT`` over every yellow and green
+row. ``4-refresh-materialize-view-partitions.sql`` instead compares a
+signature per source (taxi_type, trip_year, trip_month) partition with the one
+recorded at the last refresh and rebuilds only the partitions that differ.
+
+This module is the local stand-in for that script, over hive-partitioned
+Parquet tables such as the ones written by convert.py. The signature of a
+source partition is taken from its file listing (names, sizes, mtimes), so
+finding the changed partitions reads no data. Each changed partition is
+rebuilt with the same ``SELECT DISTINCT`` on DuckDB, written to a hidden
+directory and swapped in; partitions gone from the source are removed.
+
+The refresh state is a JSON file in the mat view directory
+(``_refresh_state.json``).
+
+With ``virtual_columns`` the derived pickup/dropoff date parts are not
+stored; readers compute them from the timestamps (see virtual_columns.py).
+The layout is recorded per partition in the refresh state, and a refresh
+rebuilds the partitions of the given sources whose layout differs. The
+partitions of other sources keep theirs until refreshed, and the readers in
+virtual_columns.py read a mat view with both layouts.
+
+Usage:
+    python -m NYCTaxi.matview <mat_view_dir> --source yellow=<dir> --source green=<dir> [--full-refresh] [--rollup-cube]
+        [--virtual-columns]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+import duckdb
+import pyarrow.parquet as pq
+
+from .run_metrics import MemorySampler, add_metrics_arguments, metrics_from_args
+from .schemas import TAXI_TYPES
+from .virtual_columns import VIRTUAL_COLUMNS
+
+STATE_FILE_NAME = "_refresh_state.json"
+STATE_VERSION = 1
+
+MAT_VIEW_PARTITION_COLUMNS = ["taxi_type", "trip_year", "trip_month"]
+
+# Column order of taxi_trips_mat_view, as in 3-transform-create-materialize-view.sql
+MAT_VIEW_COLUMNS = [
+    "taxi_type",
+    "vendor_id",
+    "pickup_datetime",
+    "dropoff_datetime",
+    "store_and_fwd_flag",
+    "rate_code_id",
+    "pickup_location_id",
+    "dropoff_location_id",
+    "pickup_longitude",
+    "pickup_latitude",
+    "dropoff_longitude",
+    "dropoff_latitude",
+    "passenger_count",
+    "trip_distance",
+    "fare_amount",
+    "extra",
+    "mta_tax",
+    "tip_amount",
+    "tolls_amount",
+    "ehail_fee",
+    "improvement_surcharge",
+    "total_amount",
+    "payment_type",
+    "trip_type",
+    "vendor_abbreviation",
+    "vendor_description",
+    "trip_type_description",
+    "month_name_short",
+    "month_name_full",
+    "payment_type_description",
+    "rate_code_description",
+    "pickup_borough",
+    "pickup_zone",
+    "pickup_service_zone",
+    "dropoff_borough",
+    "dropoff_zone",
+    "dropoff_service_zone",
+    "pickup_year",
+    "pickup_month",
+    "pickup_day",
+    "pickup_hour",
+    "pickup_minute",
+    "pickup_second",
+    "dropoff_year",
+    "dropoff_month",
+    "dropoff_day",
+    "dropoff_hour",
+    "dropoff_minute",
+    "dropoff_second",
+    "trip_year",
+    "trip_month",
+]
+
+# Columns yellow trips lack, added inline by the mat view SQL
+INLINE_DEFAULTS = {
+    "ehail_fee": "0.0",
+    "trip_type": "0",
+    "trip_type_description": "''",
+}
+
+
+def partition_key(taxi_type, trip_year, trip_month):
+    """State key of a mat view partition, e.g. "taxi_type=yellow/trip_year=2016/trip_month=07"."""
+    return f"taxi_type={taxi_type}/trip_year={trip_year}/trip_month={trip_month}"
+
+
+def list_source_partitions(taxi_type, table_dir):
+    """
+    Parquet files of each (trip_year, trip_month) partition of a source table.
+
+    Returns:
+        Dict of partition key to sorted list of file paths
+    """
+    partitions = {}
+    pattern = os.path.join(table_dir, "trip_year=*", "trip_month=*", "*.parquet")
+    for path in sorted(glob.glob(pattern)):
+        month_dir = os.path.dirname(path)
+        trip_month = os.path.basename(month_dir).split("=", 1)[1]
+        trip_year = os.path.basename(os.path.dirname(month_dir)).split("=", 1)[1]
+        partitions.setdefault(partition_key(taxi_type, trip_year, trip_month), []).append(path)
+    return partitions
+
+
+def partition_signature(paths):
+    """Signature of a source partition from its file names, sizes and mtimes; reads no data."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def select_list(source_columns, virtual_columns=False):
+    """
+    SELECT list of the mat view's data columns for a source table.
+
+    Partition columns are left out since they are encoded in the directory
+    names, and so are the derived date parts with virtual_columns; columns
+    missing from the source get the mat view's inline defaults.
+    """
+    items = []
+    for name in MAT_VIEW_COLUMNS:
+        if name in MAT_VIEW_PARTITION_COLUMNS or (virtual_columns and name in VIRTUAL_COLUMNS):
+            continue
+        if name in source_columns:
+            items.append(f'"{name}"')
+        elif name in INLINE_DEFAULTS:
+            items.append(f'{INLINE_DEFAULTS[name]} AS "{name}"')
+    return ",\n  ".join(items)
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+class MatView:
+    """
+    Hive-partitioned local copy of taxi_trips_mat_view with its refresh state.
+
+    Usage:
+        mat_view = MatView(mat_view_dir)
+        result = mat_view.refresh({"yellow": yellow_dir, "green": green_dir})
+    """
+
+    def __init__(self, mat_view_dir, virtual_columns=False):
+        self.mat_view_dir = mat_view_dir
+        self.state_path = os.path.join(mat_view_dir, STATE_FILE_NAME)
+        self.virtual_columns = virtual_columns
+        self.partitions = self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r") as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            print(f"Ignoring refresh state {self.state_path} with unsupported version {state.get('version')}")
+            return {}
+        partitions = state["partitions"]
+        # States written before the layout was recorded per partition have one flag for all
+        for partition in partitions.values():
+            partition.setdefault("virtual_columns", state.get("virtual_columns", False))
+        return partitions
+
+    def save(self):
+        """Write the refresh state atomically."""
+        os.makedirs(self.mat_view_dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": STATE_VERSION,
+                "partitions": self.partitions,
+            }, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def partition_dir(self, key):
+        return os.path.join(self.mat_view_dir, *key.split("/"))
+
+    def changed_partitions(self, source_partitions):
+        """
+        Partitions that are new, changed, of the other layout or no longer present in the source.
+
+        Args:
+            source_partitions: Dict of partition key to source file paths
+
+        Returns:
+            (changed, removed): sorted lists of partition keys to rebuild and to drop
+        """
+        changed = sorted(
+            key for key, paths in source_partitions.items()
+            if self.partitions.get(key, {}).get("signature") != partition_signature(paths)
+            or self.partitions[key].get("virtual_columns", False) != self.virtual_columns
+            or not os.path.isdir(self.partition_dir(key))
+        )
+        removed = sorted(set(self.partitions) - set(source_partitions))
+        return changed, removed
+
+    def rebuild_partition(self, con, key, paths):
+        """
+        Rebuild one mat view partition with SELECT DISTINCT over its source files.
+
+        The new files are written to a hidden directory, which Spark and DuckDB
+        skip, and swapped in once complete.
+
+        Returns:
+            Number of rows in the rebuilt partition
+        """
+        source_columns = set(pq.read_schema(paths[0]).names)
+        final_dir = self.partition_dir(key)
+        parent_dir = os.path.dirname(final_dir)
+        tmp_dir = os.path.join(parent_dir, "." + os.path.basename(final_dir) + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        files = ", ".join(_sql_string(path) for path in paths)
+        output_path = os.path.join(tmp_dir, "part-00000.parquet")
+        con.execute(f"""
+            COPY (
+                SELECT DISTINCT
+                  {select_list(source_columns, self.virtual_columns)}
+                FROM read_parquet([{files}], hive_partitioning = false)
+            ) TO {_sql_string(output_path)} (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+        rows = pq.read_metadata(output_path).num_rows
+
+        old_dir = os.path.join(parent_dir, "." + os.path.basename(final_dir) + ".old")
+        if os.path.isdir(final_dir):
+            os.replace(final_dir, old_dir)
+        os.replace(tmp_dir, final_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return rows
+
+    def remove_partition(self, key):
+        shutil.rmtree(self.partition_dir(key), ignore_errors=True)
+        self.partitions.pop(key, None)
+
+    def refresh(self, sources, full_refresh=False, con=None, metrics=None):
+        """
+        Bring the mat view up to date with its source tables.
+
+        Args:
+            sources: Dict of taxi type to source table dir (hive-partitioned by trip_year/trip_month)
+            full_refresh: Rebuild every partition, like 3-transform-create-materialize-view.sql
+            con: DuckDB connection (default: a new in-memory one)
+            metrics: RunMetrics to record each rebuilt partition in (see run_metrics.py)
+
+        Returns:
+            Dict with the rebuilt and removed partition keys, rows written and elapsed seconds
+        """
+        start_time = time.time()
+        source_partitions = {}
+        for taxi_type, table_dir in sources.items():
+            source_partitions.update(list_source_partitions(taxi_type, table_dir))
+        # Only the given taxi types are refreshed; partitions of other types are left alone
+        known = {key for key in self.partitions if key.split("/", 1)[0].split("=", 1)[1] in sources}
+
+        if full_refresh:
+            changed, removed = sorted(source_partitions), sorted(known - set(source_partitions))
+        else:
+            changed, removed = self.changed_partitions(source_partitions)
+            removed = [key for key in removed if key in known]
+
+        con = con or duckdb.connect()
+        rows = 0
+        for key in changed:
+            paths = source_partitions[key]
+            partition_start_time = time.time()
+            with MemorySampler() as memory:
+                partition_rows = self.rebuild_partition(con, key, paths)
+            if metrics:
+                output_dir = self.partition_dir(key)
+                metrics.add(
+                    "materialize", time.time() - partition_start_time, partition=key,
+                    rows_out=partition_rows,
+                    bytes_in=sum(os.path.getsize(path) for path in paths),
+                    bytes_out=sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir)),
+                    peak_memory=memory.peak_bytes,
+                )
+            self.partitions[key] = {
+                "signature": partition_signature(paths),
+                "rows": partition_rows,
+                "virtual_columns": self.virtual_columns,
+                "refreshed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            # Save as we go so an interrupted refresh resumes where it stopped
+            self.save()
+            rows += partition_rows
+        for key in removed:
+            self.remove_partition(key)
+        self.save()
+
+        return {
+            "changed": changed,
+            "removed": removed,
+            "rows": rows,
+            "seconds": time.time() - start_time,
+        }
+
+    def total_rows(self):
+        """Rows in the mat view, from the refresh state."""
+        return sum(partition["rows"] for partition in self.partitions.values())
+
+
+def _parse_source(value):
+    taxi_type, table_dir = value.split("=", 1)
+    if taxi_type not in TAXI_TYPES:
+        raise argparse.ArgumentTypeError(f"Unknown taxi type: {taxi_type}")
+    return taxi_type, table_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally refresh a local taxi_trips_mat_view")
+    parser.add_argument("mat_view_dir", help="Dir of the mat view (hive-partitioned by taxi_type/trip_year/trip_month)")
+    parser.add_argument("--source", type=_parse_source, action="append", required=True,
+                        help="Source table as <taxi_type>=<dir> (repeatable)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Rebuild every partition, ignoring the refresh state")
+    parser.add_argument("--rollup-cube", action="store_true",
+                        help="Also update the rollup cube of the refreshed partitions (see rollup_cube.py)")
+    parser.add_argument("--virtual-columns", action="store_true",
+                        help="Do not store the derived pickup/dropoff date parts; read them with virtual_columns.py")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        mat_view = MatView(args.mat_view_dir, virtual_columns=args.virtual_columns)
+        metrics = metrics_from_args(args)
+        with metrics.stage("materialize") if metrics else nullcontext({}) as counters:
+            result = mat_view.refresh(dict(args.source), full_refresh=args.full_refresh, metrics=metrics)
+            counters["rows_out"] = result["rows"]
+        for key in result["changed"]:
+            print(f"Rebuilt {key}")
+        for key in result["removed"]:
+            print(f"Removed {key}")
+        print(
+            f"Refreshed {len(result['changed'])} partitions, removed {len(result['removed'])}, "
+            f"{result['rows']} rows in {result['seconds']:.1f}s; mat view has {mat_view.total_rows()} rows"
+        )
+        if args.rollup_cube:
+            from .rollup_cube import RollupCube
+
+            cube_result = RollupCube(args.mat_view_dir).refresh()
+            print(f"Updated {len(cube_result['updated'])} rollup cube cells, removed {len(cube_result['removed'])}")
+    except Exception as e:
+        print(f"Error refreshing mat view: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
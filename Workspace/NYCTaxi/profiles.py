@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Mergeable column profiles of converted taxi trip tables.
+
+After each load the notebooks run ``select COUNT(1)`` and ``select *``
+against the new table to sanity-check it, a full scan each. convert.py
+instead profiles every batch as it streams through: per (trip_year,
+trip_month) partition it keeps the row count and, per column, the null
+count, min, max, sum (numeric columns) and a HyperLogLog sketch of the
+distinct values.
+
+Every part of a profile merges: counts and sums add up, min/max take the
+min/max, and sketches take the register-wise max. Profiles are written per
+source month next to the table, in ``_profiles/<file prefix>.json`` (the
+file prefix of the month's Parquet parts, see convert.output_file_prefix),
+so reconverting a month replaces exactly its profile. A partition's profile
+is the merge of the profiles of the source months that wrote to it.
+
+Row counts, null counts, value ranges and approximate distinct counts are
+then answered from the profiles without reading the data, and ``--validate``
+checks them against the load manifest.
+
+Usage:
+    python -m NYCTaxi.profiles <table_dir> [--partition trip_year=2016/trip_month=01] [--validate]
+"""
+
+import argparse
+import base64
+import glob
+import json
+import math
+import os
+import sys
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .fingerprint import FINGERPRINT_COLUMN, _splitmix64, column_hash
+from .manifest import LoadManifest
+
+PROFILES_DIR_NAME = "_profiles"
+PROFILE_VERSION = 1
+
+# 2^12 registers: about 1.6% standard error on distinct counts
+HLL_PRECISION = 12
+_HLL_SEED = np.uint64(0x2545F4914F6CDD1D)
+
+
+class DistinctSketch:
+    """
+    HyperLogLog sketch of the distinct values of a column.
+
+    Usage:
+        sketch = DistinctSketch()
+        sketch.add(array)
+        sketch.merge(other)
+        sketch.estimate()
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, array):
+        """Add the non-null values of an Arrow array."""
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        if array.null_count:
+            array = array.drop_null()
+        if len(array) == 0:
+            return
+        # column_hash returns raw bit patterns for numbers; mix them so every bit is uniform
+        hashes = _splitmix64(column_hash(array) ^ _HLL_SEED)
+        index_bits = np.uint64(64 - self.precision)
+        indices = (hashes >> index_bits).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1 bit in the remaining 64 - precision bits
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        ranks = (64 - self.precision - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, indices, ranks)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """Approximate number of distinct values."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_json(self):
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(zlib.compress(self.registers.tobytes())).decode(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        registers = np.frombuffer(zlib.decompress(base64.b64decode(data["registers"])), dtype=np.uint8).copy()
+        return cls(data["precision"], registers)
+
+
+def _json_value(value):
+    # Timestamps as ISO strings, which order like the timestamps themselves
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def _merge_bound(a, b, function):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return function(a, b)
+
+
+class ColumnProfile:
+    """Null count, min, max, sum and distinct sketch of one column."""
+
+    def __init__(self, null_count=0, min=None, max=None, sum=None, sketch=None):
+        self.null_count = null_count
+        self.min = min
+        self.max = max
+        self.sum = sum
+        self.sketch = sketch or DistinctSketch()
+
+    def update(self, array):
+        """Add the values of an Arrow array."""
+        self.null_count += array.null_count
+        if array.null_count == len(array):
+            return
+        bounds = pc.min_max(array)
+        self.min = _merge_bound(self.min, _json_value(bounds["min"].as_py()), min)
+        self.max = _merge_bound(self.max, _json_value(bounds["max"].as_py()), max)
+        if pa.types.is_integer(array.type) or pa.types.is_floating(array.type):
+            self.sum = _merge_bound(self.sum, pc.sum(array).as_py(), lambda a, b: a + b)
+        self.sketch.add(array)
+
+    def merge(self, other):
+        self.null_count += other.null_count
+        self.min = _merge_bound(self.min, other.min, min)
+        self.max = _merge_bound(self.max, other.max, max)
+        self.sum = _merge_bound(self.sum, other.sum, lambda a, b: a + b)
+        self.sketch.merge(other.sketch)
+
+    def to_json(self):
+        return {
+            "null_count": self.null_count,
+            "min": self.min,
+            "max": self.max,
+            "sum": self.sum,
+            "sketch": self.sketch.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["null_count"], data["min"], data["max"], data["sum"],
+                   DistinctSketch.from_json(data["sketch"]))
+
+
+class PartitionProfile:
+    """
+    Row count and column profiles of one partition (or of any set of rows).
+
+    Usage:
+        profile = PartitionProfile()
+        for batch in batches:
+            profile.update(batch)
+        profile.merge(other)
+    """
+
+    def __init__(self, rows=0, columns=None):
+        self.rows = rows
+        self.columns = columns or {}
+
+    def update(self, batch):
+        """Add the rows of a RecordBatch."""
+        self.rows += batch.num_rows
+        for name, array in zip(batch.schema.names, batch.columns):
+            if name == FINGERPRINT_COLUMN:
+                continue
+            self.columns.setdefault(name, ColumnProfile()).update(array)
+
+    def merge(self, other):
+        self.rows += other.rows
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = ColumnProfile.from_json(column.to_json())
+
+    def to_json(self):
+        return {"rows": self.rows, "columns": {name: column.to_json() for name, column in self.columns.items()}}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["rows"], {name: ColumnProfile.from_json(column) for name, column in data["columns"].items()})
+
+    def summary(self):
+        """
+        Quick stats of every column.
+
+        Returns:
+            List of dicts with column, null_count, min, max, sum, mean and approx_distinct
+        """
+        rows = []
+        for name, column in self.columns.items():
+            non_null = self.rows - column.null_count
+            rows.append({
+                "column": name,
+                "null_count": column.null_count,
+                "min": column.min,
+                "max": column.max,
+                "sum": column.sum,
+                "mean": column.sum / non_null if column.sum is not None and non_null else None,
+                "approx_distinct": column.sketch.estimate(),
+            })
+        return rows
+
+
+def profile_path(table_dir, prefix):
+    """Profile file of the source month whose Parquet parts start with prefix."""
+    return os.path.join(table_dir, PROFILES_DIR_NAME, f"{prefix}.json")
+
+
+def partition_name(trip_year, trip_month):
+    """Partition key as in the load manifest, e.g. "trip_year=2016/trip_month=01"."""
+    return f"trip_year={trip_year}/trip_month={trip_month}"
+
+
+def write_month_profiles(table_dir, prefix, profiles):
+    """
+    Write the partition profiles of one converted source month atomically.
+
+    Args:
+        table_dir: Table dir
+        prefix: File prefix of the month's Parquet parts
+        profiles: Dict of (trip_year, trip_month) to PartitionProfile
+    """
+    path = profile_path(table_dir, prefix)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "version": PROFILE_VERSION,
+            "partitions": {partition_name(*key): profile.to_json() for key, profile in sorted(profiles.items())},
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def remove_month_profiles(table_dir, prefix):
+    path = profile_path(table_dir, prefix)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_table_profiles(table_dir):
+    """
+    Profile of every partition of a table, merged over the source months that wrote to it.
+
+    Returns:
+        Dict of partition key to PartitionProfile
+    """
+    partitions = {}
+    for path in sorted(glob.glob(os.path.join(table_dir, PROFILES_DIR_NAME, "*.json"))):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != PROFILE_VERSION:
+            print(f"Ignoring profile {path} with unsupported version {data.get('version')}")
+            continue
+        for key, profile in data["partitions"].items():
+            profile = PartitionProfile.from_json(profile)
+            if key in partitions:
+                partitions[key].merge(profile)
+            else:
+                partitions[key] = profile
+    return partitions
+
+
+def merged_profile(partitions, keys=None):
+    """Profile of a set of partitions (default: all), e.g. of a whole table."""
+    profile = PartitionProfile()
+    for key, partition in partitions.items():
+        if keys is None or key in keys:
+            profile.merge(partition)
+    return profile
+
+
+def validate_table(table_dir):
+    """
+    Check a table's profiles against its load manifest, reading no data.
+
+    Checks that every partition's profiled row count equals the manifest's,
+    and that pickup_datetime has no nulls and stays within the partition's
+    month.
+
+    Returns:
+        List of problem descriptions (empty when the table checks out)
+    """
+    problems = []
+    partitions = load_table_profiles(table_dir)
+    manifest = LoadManifest.load(table_dir)
+    expected = {}
+    for entry in manifest.entries.values():
+        for key, rows in entry["rows"].items():
+            expected[key] = expected.get(key, 0) + rows
+
+    for key in sorted(set(expected) | set(partitions)):
+        profile = partitions.get(key)
+        if profile is None:
+            problems.append(f"{key}: no profile")
+            continue
+        if key not in expected:
+            problems.append(f"{key}: profiled but not in the load manifest")
+        elif profile.rows != expected[key]:
+            problems.append(f"{key}: {profile.rows} profiled rows, {expected[key]} in the load manifest")
+
+        pickup = profile.columns.get("pickup_datetime")
+        if pickup is None:
+            continue
+        if pickup.null_count:
+            problems.append(f"{key}: {pickup.null_count} rows without pickup_datetime")
+        values = dict(part.split("=", 1) for part in key.split("/"))
+        month_prefix = f"{values['trip_year']}-{values['trip_month']}"
+        if pickup.min is not None and not (pickup.min.startswith(month_prefix) and pickup.max.startswith(month_prefix)):
+            problems.append(f"{key}: pickup_datetime from {pickup.min} to {pickup.max} outside {month_prefix}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print or validate the column profiles of a converted table")
+    parser.add_argument("table_dir", help="Converted table dir, e.g. .../yellow-taxi")
+    parser.add_argument("--partition", action="append",
+                        help="Partition key, e.g. trip_year=2016/trip_month=01 (repeatable, default: whole table)")
+    parser.add_argument("--validate", action="store_true", help="Check the profiles against the load manifest")
+    args = parser.parse_args()
+
+    try:
+        partitions = load_table_profiles(args.table_dir)
+        if not partitions:
+            raise ValueError(f"No profiles under {os.path.join(args.table_dir, PROFILES_DIR_NAME)}")
+        profile = merged_profile(partitions, set(args.partition) if args.partition else None)
+        print(f"{len(args.partition) if args.partition else len(partitions)} partitions, {profile.rows} rows")
+        for column in profile.summary():
+            mean = f"{column['mean']:.4g}" if column["mean"] is not None else "-"
+            print(f"  {column['column']}: nulls={column['null_count']} min={column['min']} max={column['max']} "
+                  f"mean={mean} distinct~{column['approx_distinct']}")
+
+        if args.validate:
+            problems = validate_table(args.table_dir)
+            for problem in problems:
+                print(f"Problem: {problem}")
+            print(f"Validation {'failed' if problems else 'passed'}: {len(problems)} problems")
+            if problems:
+                sys.exit(1)
+    except Exception as e:
+        print(f"Error reading profiles: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Persistent result cache for the analytics report queries.
+
+The Report notebooks send every query to the warehouse on every run, even
+when ``taxi_trips_mat_view`` has not changed since the last one. Here a
+query result is stored as Parquet under a key made of
+
+- the SQL text, normalized (comments dropped, whitespace collapsed,
+  keywords and identifiers lowercased outside quotes), so reformatting a
+  cell does not miss the cache
+- the current version of every table the query reads, so refreshing the mat
+  view (a new Delta version, a new BigQuery modification time, a new local
+  refresh state) makes its cached results unreachable
+- the catalog/schema or project/dataset the query runs in
+
+Entries are evicted when older than ``max_age_seconds`` and, least recently
+used first, when the cache grows past ``max_bytes``.
+
+Usage (in a Report notebook, after execute_sql_query is defined):
+    cache = ResultCache("/dbfs/tmp/nyctaxi/report-cache")
+    execute_sql_query = cached_sql_query(
+        execute_sql_query, cache, databricks_table_version(w, warehouse_id, catalog, schema)
+    )
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+INDEX_FILE_NAME = "_index.json"
+INDEX_VERSION = 1
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+DEFAULT_VERSION_TTL_SECONDS = 60
+
+# Keyword arguments of execute_sql_query that change what a table name resolves to
+CONTEXT_ARGUMENTS = ("catalog", "schema", "project_id", "dataset_id")
+
+_SQL_TOKEN = re.compile(
+    r"""(?P<quoted>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`)"""
+    r"""|(?P<comment>--[^\n]*|/\*.*?\*/)"""
+    r"""|(?P<space>\s+)"""
+    r"""|(?P<word>[A-Za-z0-9_.$]+)"""
+    r"""|(?P<punct>.)""",
+    re.DOTALL,
+)
+# Tokens of normalized SQL for finding table references: string literals
+# (skipped), names (identifier chains such as `catalog`.schema.table) and
+# single punctuation characters
+_REFERENCE_TOKEN = re.compile(
+    r"""(?P<literal>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")"""
+    r"""|(?P<name>(?:`[^`]*`|[a-z0-9_.$])+)"""
+    r"""|(?P<punct>\S)"""
+)
+# Functions whose arguments use FROM as a keyword, e.g. extract(hour from pickup_datetime)
+_FROM_ARGUMENT_FUNCTIONS = {"extract", "substring", "trim", "position", "overlay"}
+# Words that end a table reference instead of being its alias
+_CLAUSE_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "lateral", "on", "using",
+    "group", "order", "having", "limit", "union", "intersect", "except", "minus", "window", "qualify",
+    "tablesample", "pivot", "unpivot", "select", "for", "with",
+}
+
+
+def normalize_sql(sql):
+    """
+    Canonical form of a SQL statement for cache keys.
+
+    Comments are dropped, whitespace is kept only where it separates two
+    words or literals, text outside quotes is lowercased and a trailing
+    semicolon is removed. Quoted strings and identifiers are kept verbatim.
+    """
+    parts = []
+    separated = False
+    previous_kind = None
+    for match in _SQL_TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            separated = True
+            continue
+        text = match.group()
+        if kind != "quoted":
+            text = text.lower()
+        if separated and previous_kind in ("word", "quoted") and kind in ("word", "quoted"):
+            parts.append(" ")
+        parts.append(text)
+        previous_kind = kind
+        separated = False
+    return "".join(parts).rstrip(";")
+
+
+def referenced_tables(sql):
+    """
+    Names of the tables a query reads (FROM / JOIN targets), as written, sorted.
+
+    Every table of a comma-separated FROM list counts. FROM inside the
+    arguments of extract/substring/trim/position/overlay, subqueries, table
+    functions and the names of WITH queries are not tables.
+    """
+    tokens = [
+        (match.lastgroup, match.group())
+        for match in _REFERENCE_TOKEN.finditer(normalize_sql(sql))
+        if match.lastgroup != "literal"
+    ]
+    names, common_table_names = set(), set()
+    # One entry per open parenthesis: whether FROM inside it is a function argument keyword
+    parentheses = []
+    # expect: "table" after FROM / JOIN or a comma of a FROM list, "alias" after a table name
+    expect, pending = None, None
+    for position, (kind, text) in enumerate(tokens):
+        following = tokens[position + 1][1] if position + 1 < len(tokens) else None
+        if expect == "alias":
+            if kind == "name" and text == "as":
+                continue
+            if kind == "name" and text not in _CLAUSE_KEYWORDS and pending != "aliased":
+                pending = "aliased"
+                continue
+            expect = "table" if text == "," else None
+            if expect:
+                continue
+        if kind == "punct":
+            if text == "(":
+                previous = tokens[position - 1][1] if position else None
+                parentheses.append(previous in _FROM_ARGUMENT_FUNCTIONS)
+            elif text == ")" and parentheses:
+                parentheses.pop()
+            expect = None
+            continue
+        if expect == "table":
+            if following == "(":
+                # A table function, e.g. unnest(...)
+                expect = None
+            else:
+                names.add(text.replace("`", ""))
+                expect, pending = "alias", None
+            continue
+        if text == "join" or (text == "from" and not (parentheses and parentheses[-1])):
+            expect = "table"
+        elif following == "as" and position + 2 < len(tokens) and tokens[position + 2][1] == "(":
+            # A WITH query: name as (...)
+            common_table_names.add(text.replace("`", ""))
+    return sorted(names - common_table_names)
+
+
+def cache_key(sql, table_versions, context=None):
+    """Cache key of a query from its normalized SQL, table versions and context."""
+    payload = json.dumps(
+        {"sql": normalize_sql(sql), "tables": table_versions, "context": context or {}},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Query results on local disk, one Parquet file per entry plus a JSON index.
+
+    Usage:
+        cache = ResultCache(cache_dir, max_bytes=256 * 1024 ** 2)
+        df = cache.get(key)
+        if df is None:
+            df = run_query()
+            cache.put(key, df, tables=["taxi_trips_mat_view"])
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        self.entries = self._load_index()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r") as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            return {}
+        return index["entries"]
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "entries": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def get(self, key):
+        """Cached result as a pandas DataFrame, or None on a miss or an expired entry."""
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry["created"] > self.max_age_seconds:
+            self._remove(key)
+            self._save_index()
+            entry = None
+        if entry is None or not os.path.exists(self._path(key)):
+            self.misses += 1
+            return None
+        entry["last_access"] = time.time()
+        self._save_index()
+        self.hits += 1
+        return pq.read_table(self._path(key)).to_pandas()
+
+    def put(self, key, df, tables=(), sql=None):
+        """
+        Store a query result and evict entries past the age or size limit.
+
+        Args:
+            key: Cache key, from cache_key()
+            df: Result as a pandas DataFrame
+            tables: Tables the query reads, for invalidate()
+            sql: Query text, kept in the index for inspection
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+        now = time.time()
+        self.entries[key] = {
+            "bytes": os.path.getsize(path),
+            "created": now,
+            "last_access": now,
+            "tables": sorted(tables),
+            "sql": sql,
+        }
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until the cache fits max_bytes."""
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.max_age_seconds]:
+            self._remove(key)
+        total = sum(entry["bytes"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries[key]["bytes"]
+            self._remove(key)
+        self._save_index()
+
+    def invalidate(self, table=None):
+        """Drop every entry reading a table (matched on its unqualified name), or all entries."""
+        for key in list(self.entries):
+            tables = self.entries[key]["tables"]
+            if table is None or any(name.split(".")[-1] == table.split(".")[-1] for name in tables):
+                self._remove(key)
+        self._save_index()
+
+    def size_bytes(self):
+        return sum(entry["bytes"] for entry in self.entries.values())
+
+
+def cached_sql_query(execute, cache, table_version, version_ttl_seconds=DEFAULT_VERSION_TTL_SECONDS):
+    """
+    Wrap a report's execute_sql_query with the result cache.
+
+    The wrapper takes the same arguments as ``execute``. Table versions are
+    looked up once per table every version_ttl_seconds, so a report run pays
+    one version lookup per table, not per query. A query whose table
+    versions cannot be looked up is executed without the cache. Only
+    DataFrame results are cached; the error strings execute_sql_query
+    returns on failure are not.
+
+    Args:
+        execute: execute_sql_query of the Databricks or BigQuery Report notebook
+        cache: ResultCache
+        table_version: Function of a table name returning its current version string
+        version_ttl_seconds: How long a looked-up table version is reused
+
+    Returns:
+        Function with the signature of execute, with the cache as ``.cache``
+        and ``.entry_key(query, context)`` returning a query's (key, tables)
+    """
+    versions = {}
+
+    def current_version(table):
+        version, looked_up = versions.get(table, (None, 0.0))
+        if time.time() - looked_up > version_ttl_seconds:
+            version = str(table_version(table))
+            versions[table] = (version, time.time())
+        return version
+
+    def entry_key(query, context):
+        tables = referenced_tables(query)
+        return cache_key(query, {table: current_version(table) for table in tables}, context), tables
+
+    def cached_execute(*args, **kwargs):
+        query = kwargs["query"] if "query" in kwargs else args[1]
+        context = {name: kwargs[name] for name in CONTEXT_ARGUMENTS if kwargs.get(name) is not None}
+        try:
+            key, tables = entry_key(query, context)
+        except Exception as e:
+            print(f"Not caching query, table version lookup failed: {e}")
+            return execute(*args, **kwargs)
+        df = cache.get(key)
+        if df is None:
+            df = execute(*args, **kwargs)
+            if hasattr(df, "columns"):
+                cache.put(key, df, tables, query)
+        return df
+
+    cached_execute.cache = cache
+    # (key, tables) of a query in a context, for callers that run queries
+    # themselves (report_runner.CachedAdapter)
+    cached_execute.entry_key = entry_key
+    return cached_execute
+
+
+def databricks_table_version(w, warehouse_id, catalog=None, schema=None):
+    """
+    Table version function for Databricks: the latest Delta commit version.
+
+    ``DESCRIBE HISTORY ... LIMIT 1`` reads only the Delta log, so it costs a
+    fraction of the queries it saves.
+    """
+    def table_version(table):
+        response = w.statement_execution.execute_statement(
+            statement=f"DESCRIBE HISTORY {table} LIMIT 1",
+            warehouse_id=warehouse_id, catalog=catalog, schema=schema,
+        )
+        statement = w.statement_execution.get_statement(statement_id=response.statement_id)
+        if statement.result is None or not statement.result.data_array:
+            # Unknown version (e.g. a view): never reuse a cached result
+            return f"unversioned-{time.time()}"
+        return statement.result.data_array[0][0]
+
+    return table_version
+
+
+def bigquery_table_version(client, project_id, dataset_id):
+    """Table version function for BigQuery: the table's last modification time (a metadata call)."""
+    def table_version(table):
+        parts = table.split(".")
+        table_id = ".".join([project_id, dataset_id][:3 - len(parts)] + parts)
+        return client.get_table(table_id).modified.isoformat()
+
+    return table_version
+
+
+def local_table_version(mat_view_dir):
+    """Table version function for a local mat view: a hash of its refresh state (see matview.py)."""
+    from .matview import STATE_FILE_NAME
+
+    def table_version(table):
+        state_path = os.path.join(mat_view_dir, STATE_FILE_NAME)
+        if not os.path.exists(state_path):
+            return "empty"
+        with open(state_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    return table_version
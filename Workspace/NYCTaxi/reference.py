@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Reference (lookup) data for taxi trips: schemas, loading and synthetic files.
+
+Mirrors the load-reference-data notebooks: each lookup table is a small
+delimited file with a header row, read with a fixed schema and delimiter
+(see ``loadReferenceData``). ``write_reference_data`` writes the same files
+with standard TLC codes and synthetic zone names, so the local pipeline can
+run end to end next to synthetic_data.py.
+
+Parsing the CSVs again in every job and worker process is avoidable: each
+table is compiled once into an uncompressed Arrow IPC file in a cache dir
+(``_arrow_cache/`` next to the CSVs by default) and memory-mapped from
+there, so processes on one machine share the same pages instead of holding
+their own parsed copies. Each cache file records the cache format version,
+the table schema and the size, mtime and hash of its source CSV; a changed
+CSV or schema recompiles the table on the next load. Cache files are
+written to a temporary name and renamed into place, so concurrent workers
+never map a partial file.
+
+Usage:
+    python -m NYCTaxi.reference <output_dir>
+        Write the synthetic reference CSVs to <output_dir>
+    python -m NYCTaxi.reference <reference_dir> --compile [--cache-dir DIR]
+        Compile the reference CSVs in <reference_dir> into the Arrow cache
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from .homogenize import ARROW_TYPES
+from .manifest import file_sha256
+
+# Lookup table -> (source file, delimiter, schema), as in loadReferenceData
+REFERENCE_TABLES = {
+    "taxi_zone": ("taxi_zone_lookup.csv", ",", [
+        ("location_id", "string"),
+        ("borough", "string"),
+        ("zone", "string"),
+        ("service_zone", "string"),
+    ]),
+    "trip_month": ("trip_month_lookup.csv", ",", [
+        ("trip_month", "string"),
+        ("month_name_short", "string"),
+        ("month_name_full", "string"),
+    ]),
+    "rate_code": ("rate_code_lookup.csv", "|", [
+        ("rate_code_id", "integer"),
+        ("description", "string"),
+    ]),
+    "payment_type": ("payment_type_lookup.csv", "|", [
+        ("payment_type", "integer"),
+        ("abbreviation", "string"),
+        ("description", "string"),
+    ]),
+    "trip_type": ("trip_type_lookup.csv", "|", [
+        ("trip_type", "integer"),
+        ("description", "string"),
+    ]),
+    "vendor": ("vendor_lookup.csv", "|", [
+        ("vendor_id", "integer"),
+        ("abbreviation", "string"),
+        ("description", "string"),
+    ]),
+}
+
+# Standard TLC codes; vendor and payment type carry both the pre-2015
+# abbreviations and the numeric ids used from 2015
+_VENDORS = [
+    (1, "CMT", "Creative Mobile Technologies, LLC"),
+    (2, "VTS", "VeriFone Inc."),
+    (3, "DDS", "Digital Dispatch Systems"),
+]
+_PAYMENT_TYPES = [
+    (1, "CRD", "Credit card"),
+    (2, "CSH", "Cash"),
+    (3, "NOC", "No charge"),
+    (4, "DIS", "Dispute"),
+    (5, "UNK", "Unknown"),
+    (6, "VOD", "Voided trip"),
+]
+_RATE_CODES = [
+    (1, "Standard rate"),
+    (2, "JFK"),
+    (3, "Newark"),
+    (4, "Nassau or Westchester"),
+    (5, "Negotiated fare"),
+    (6, "Group ride"),
+]
+_TRIP_TYPES = [
+    (1, "Street-hail"),
+    (2, "Dispatch"),
+]
+_MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+_BOROUGHS = ["Manhattan", "Brooklyn", "Queens", "Bronx", "Staten Island"]
+NUM_TAXI_ZONES = 265
+
+REFERENCE_CACHE_DIR_NAME = "_arrow_cache"
+REFERENCE_CACHE_VERSION = 1
+REFERENCE_CACHE_METADATA_KEY = b"nyctaxi.reference"
+
+
+def reference_rows(name):
+    """Rows of a synthetic lookup table, in its schema's column order."""
+    if name == "vendor":
+        return _VENDORS
+    if name == "payment_type":
+        return _PAYMENT_TYPES
+    if name == "rate_code":
+        return _RATE_CODES
+    if name == "trip_type":
+        return _TRIP_TYPES
+    if name == "trip_month":
+        return [(f"{month:02d}", full[:3], full) for month, full in enumerate(_MONTH_NAMES, start=1)]
+    if name == "taxi_zone":
+        rows = []
+        for location_id in range(1, NUM_TAXI_ZONES + 1):
+            borough = _BOROUGHS[location_id % len(_BOROUGHS)]
+            # Zone 1 is Newark Airport (EWR) and the last two are Unknown, as in the real file
+            if location_id == 1:
+                rows.append((str(location_id), "EWR", "Newark Airport", "EWR"))
+            elif location_id > NUM_TAXI_ZONES - 2:
+                rows.append((str(location_id), "Unknown", "NV", "N/A"))
+            else:
+                service_zone = "Yellow Zone" if borough == "Manhattan" else "Boro Zone"
+                rows.append((str(location_id), borough, f"{borough} Zone {location_id}", service_zone))
+        return rows
+    raise ValueError(f"Unknown reference table: {name}")
+
+
+def reference_schema(name):
+    """pyarrow schema of a lookup table."""
+    _, _, fields = REFERENCE_TABLES[name]
+    return pa.schema([(field_name, ARROW_TYPES[type_name]) for field_name, type_name in fields])
+
+
+def load_reference_table(src_dir, name):
+    """
+    Read one lookup table CSV with its schema and delimiter.
+
+    Args:
+        src_dir: Dir with the reference CSVs
+        name: Lookup table name, a key of REFERENCE_TABLES
+
+    Returns:
+        pyarrow Table
+    """
+    file_name, delimiter, _ = REFERENCE_TABLES[name]
+    schema = reference_schema(name)
+    return pacsv.read_csv(
+        os.path.join(src_dir, file_name),
+        read_options=pacsv.ReadOptions(column_names=schema.names, skip_rows=1),
+        parse_options=pacsv.ParseOptions(delimiter=delimiter),
+        convert_options=pacsv.ConvertOptions(column_types=schema),
+    )
+
+
+def reference_cache_path(src_dir, name, cache_dir=None):
+    """Arrow IPC cache file of a lookup table."""
+    return os.path.join(cache_dir or os.path.join(src_dir, REFERENCE_CACHE_DIR_NAME), f"{name}.arrow")
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _cache_metadata(table):
+    metadata = (table.schema.metadata or {}).get(REFERENCE_CACHE_METADATA_KEY)
+    return json.loads(metadata) if metadata else None
+
+
+def compile_reference_table(src_dir, name, cache_dir=None):
+    """
+    Parse one lookup table CSV and write it to its Arrow IPC cache file.
+
+    Returns:
+        Path of the cache file
+    """
+    file_name, _, fields = REFERENCE_TABLES[name]
+    source_path = os.path.join(src_dir, file_name)
+    signature = _source_signature(source_path)
+    table = load_reference_table(src_dir, name)
+    table = table.replace_schema_metadata({REFERENCE_CACHE_METADATA_KEY: json.dumps({
+        "version": REFERENCE_CACHE_VERSION,
+        "fields": fields,
+        "source": dict(signature, sha256=file_sha256(source_path)),
+    })})
+
+    path = reference_cache_path(src_dir, name, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _map_reference_table(path):
+    # Zero-copy read: the table's buffers point into the mapped file
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def cached_reference_table(src_dir, name, cache_dir=None):
+    """
+    A lookup table memory-mapped from its Arrow cache, recompiled first when
+    missing or out of date.
+
+    The cache is current when it has this module's cache version and schema
+    and its source CSV still has the recorded size and mtime, or, failing
+    that, the recorded hash.
+
+    Returns:
+        pyarrow Table
+    """
+    file_name, _, fields = REFERENCE_TABLES[name]
+    source_path = os.path.join(src_dir, file_name)
+    path = reference_cache_path(src_dir, name, cache_dir)
+    if os.path.exists(path):
+        table = _map_reference_table(path)
+        metadata = _cache_metadata(table)
+        if (
+            metadata is not None
+            and metadata.get("version") == REFERENCE_CACHE_VERSION
+            and [tuple(field) for field in metadata.get("fields", [])] == [tuple(field) for field in fields]
+        ):
+            source = metadata["source"]
+            if {key: source[key] for key in ("size", "mtime_ns")} == _source_signature(source_path):
+                return table
+            if source["sha256"] == file_sha256(source_path):
+                # Touched but unchanged: record the new mtime so the next load skips the hash
+                compile_reference_table(src_dir, name, cache_dir)
+                return _map_reference_table(path)
+    compile_reference_table(src_dir, name, cache_dir)
+    return _map_reference_table(path)
+
+
+def load_reference_data(src_dir, cache=True, cache_dir=None):
+    """
+    Load every lookup table.
+
+    Args:
+        src_dir: Dir with the reference CSVs
+        cache: Memory-map the tables from the Arrow cache (see
+            cached_reference_table); when the cache dir is not writable the
+            CSVs are parsed instead
+        cache_dir: Cache dir (default: <src_dir>/_arrow_cache)
+
+    Returns:
+        Dict of table name to pyarrow Table
+    """
+    if cache:
+        try:
+            return {name: cached_reference_table(src_dir, name, cache_dir) for name in REFERENCE_TABLES}
+        except OSError:
+            # e.g. a read-only reference dir
+            pass
+    return {name: load_reference_table(src_dir, name) for name in REFERENCE_TABLES}
+
+
+def write_reference_data(dest_dir):
+    """
+    Write synthetic reference CSVs in the layout loadReferenceData reads.
+
+    Returns:
+        List of written file paths
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    paths = []
+    for name, (file_name, delimiter, fields) in REFERENCE_TABLES.items():
+        path = os.path.join(dest_dir, file_name)
+        with open(path, "w") as f:
+            f.write(delimiter.join(field_name for field_name, _ in fields) + "\n")
+            for row in reference_rows(name):
+                f.write(delimiter.join(str(value) for value in row) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic taxi reference CSVs")
+    parser.add_argument("output_dir", help="Dir for the reference CSVs")
+    parser.add_argument("--compile", action="store_true",
+                        help="Compile the existing CSVs in output_dir into the Arrow cache instead")
+    parser.add_argument("--cache-dir", help=f"Arrow cache dir (default: <output_dir>/{REFERENCE_CACHE_DIR_NAME})")
+    args = parser.parse_args()
+
+    try:
+        if args.compile:
+            for name in REFERENCE_TABLES:
+                path = compile_reference_table(args.output_dir, name, args.cache_dir)
+                print(f"Compiled {name} to {path}")
+        else:
+            for path in write_reference_data(args.output_dir):
+                print(f"Wrote {path}")
+    except Exception as e:
+        print(f"Error writing reference data: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+The analytics report queries, as run by the Report notebooks.
+
+One entry per report cell, in notebook order, with the SQL exactly as in the
+Azure Report notebook, so local tools that run the report (report_runner.py)
+send the same text as the notebooks.
+"""
+
+# Report name -> (notebook heading, SQL)
+REPORT_QUERIES = {
+    "trip_count_by_taxi_type": (
+        "1.  Trip count by taxi type",
+        """
+select 
+  taxi_type,
+  count(1) as trip_count
+from 
+  taxi_trips_mat_view
+group by taxi_type
+""",
+    ),
+    "revenue_by_taxi_type": (
+        "2.  Revenue including tips by taxi type",
+        """
+select 
+  taxi_type, sum(total_amount) revenue
+from 
+  taxi_trips_mat_view
+group by taxi_type
+""",
+    ),
+    "trip_count_by_month_2016": (
+        "5.  Trip count trend by month, by taxi type, for 2016",
+        """
+select 
+  taxi_type,
+  trip_month as month,
+  count(1) as trip_count
+from 
+  taxi_trips_mat_view
+where 
+  trip_year=2016
+group by taxi_type,trip_month
+order by trip_month
+""",
+    ),
+    "avg_trip_distance_by_taxi_type": (
+        "6.  Average trip distance by taxi type",
+        """
+select 
+  taxi_type, round(avg(trip_distance),2) as trip_distance_miles
+from 
+  taxi_trips_mat_view
+group by taxi_type
+""",
+    ),
+    "avg_total_amount_by_taxi_type": (
+        "7.  Average trip amount by taxi type",
+        """
+select 
+  taxi_type, round(avg(total_amount),2) as avg_total_amount
+from 
+  taxi_trips_mat_view
+group by taxi_type
+""",
+    ),
+    "tipless_trips_by_taxi_type": (
+        "8.  Trips with no tip, by taxi type",
+        """
+select 
+  taxi_type, count(1) tipless_count
+from 
+  synapse_nyc_reference.nyctaxi.taxi_trips_mat_view
+where tip_amount=0
+group by taxi_type
+""",
+    ),
+    "no_charge_trips_by_taxi_type": (
+        "9.  Trips with no charge, by taxi type",
+        """
+select 
+  taxi_type, count(*) as transactions
+from 
+  synapse_nyc_reference.nyctaxi.taxi_trips_mat_view
+where
+  payment_type_description='No charge'
+  and total_amount=0.0
+group by taxi_type
+""",
+    ),
+    "trips_by_payment_type": (
+        "10.  Trips by payment type",
+        """
+select 
+  payment_type_description as Payment_type, count(*) as transactions
+from 
+  synapse_nyc_reference.nyctaxi.taxi_trips_mat_view
+group by payment_type_description
+""",
+    ),
+    "yellow_trips_by_pickup_hour_2016": (
+        "11.  Trip trend by pickup hour for yellow taxi in 2016",
+        """
+select pickup_hour,count(*) as trip_count
+from synapse_nyc_reference.nyctaxi.yellow_taxi_trips_transform
+where trip_year=2016
+group by pickup_hour
+order by pickup_hour
+""",
+    ),
+    "top_yellow_zone_pairs_2016": (
+        "12.  Top 3 yellow taxi pickup-dropoff zones for 2016",
+        """
+select * from 
+  (
+  select 
+    pickup_zone,dropoff_zone,count(*) as trip_count
+  from 
+    yellow_taxi_trips_transform
+  where 
+    trip_year=2016
+  and
+    pickup_zone is not null and pickup_zone<>'NV'
+  and 
+    dropoff_zone is not null and dropoff_zone<>'NV'
+  group by pickup_zone,dropoff_zone
+  order by trip_count desc
+  ) x
+limit 3
+""",
+    ),
+}
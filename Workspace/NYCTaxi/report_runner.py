@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Run report queries concurrently, with adaptive polling.
+
+``execute_sql_query`` in the Report notebooks submits one statement, sleeps a
+fixed ``poll_interval_seconds`` between status checks and returns before the
+next cell submits anything, so a report runs strictly in series and even a
+sub-second aggregate costs a full poll interval.
+
+``ReportRunner`` submits up to ``max_concurrency`` statements at once and
+polls each one on its own schedule: the first check comes after
+``initial_poll_seconds`` (sub-second) and the interval grows by ``backoff``
+up to ``max_poll_seconds``, so short queries are picked up quickly and long
+ones are not polled in a tight loop. Results are yielded as they complete.
+
+Warehouses plug in through a small adapter interface:
+
+- ``submit(sql)`` starts a statement without waiting and returns a handle;
+  ``submit(sql, parameters)`` binds named parameters (``:name`` on
+  Databricks, ``@name`` on BigQuery) instead of pasting values into the SQL
+- ``poll(handle)`` returns ``(state, result)``, with result a DataFrame when
+  SUCCEEDED and an error message when FAILED
+- ``cancel(handle)``
+
+``DatabricksAdapter`` (statement execution API) and ``BigQueryAdapter``
+(query jobs) wrap the clients the Report notebooks already create;
+``fake_warehouse.FakeWarehouse`` simulates latency locally. ``CachedAdapter``
+puts the notebook's result cache (query_cache.py) in front of any of them, and
+``CubeAdapter`` the rollup cube (rollup_cube.py) in front of that.
+
+Usage:
+    python -m NYCTaxi.report_runner [--concurrency 4] [--min-latency 0.2] [--max-latency 3]
+        Run the report queries against the fake warehouse and compare with
+        serial execution at a fixed 5 s poll interval.
+"""
+
+import argparse
+import heapq
+import math
+import sys
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from .query_cache import CONTEXT_ARGUMENTS
+from .report_queries import REPORT_QUERIES
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+CANCELED = "CANCELED"
+TIMED_OUT = "TIMED_OUT"
+
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELED)
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_INITIAL_POLL_SECONDS = 0.25
+DEFAULT_MAX_POLL_SECONDS = 5.0
+DEFAULT_BACKOFF = 1.5
+DEFAULT_TIMEOUT_SECONDS = 300
+
+QueryResult = namedtuple("QueryResult", ["name", "state", "df", "error", "seconds", "polls"])
+
+
+class ReportRunner:
+    """
+    Submit a batch of queries within a concurrency limit and collect results as they complete.
+
+    Usage:
+        runner = ReportRunner(DatabricksAdapter(w, warehouse_id, catalog, schema), max_concurrency=4)
+        for result in runner.run({"trip_count": sql_1, "revenue": sql_2}):
+            display(result.df)
+    """
+
+    def __init__(self, adapter, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 initial_poll_seconds=DEFAULT_INITIAL_POLL_SECONDS,
+                 max_poll_seconds=DEFAULT_MAX_POLL_SECONDS, backoff=DEFAULT_BACKOFF,
+                 timeout_seconds=DEFAULT_TIMEOUT_SECONDS, clock=time.monotonic, sleep=time.sleep):
+        self.adapter = adapter
+        self.max_concurrency = max_concurrency
+        self.initial_poll_seconds = initial_poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+        self.backoff = backoff
+        self.timeout_seconds = timeout_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+    def run(self, queries, parameters=None):
+        """
+        Run queries concurrently.
+
+        Args:
+            queries: Dict of name to SQL, submitted in order
+            parameters: Dict of name to the statement parameters ({parameter name: value})
+                of the queries that take them
+
+        Yields:
+            QueryResult per query, in completion order
+        """
+        parameters = parameters or {}
+        pending = list(queries.items())
+        pending.reverse()
+        # Heap of (next poll time, sequence, name, handle, submitted at, interval, polls)
+        in_flight = []
+        sequence = 0
+
+        while pending or in_flight:
+            while pending and len(in_flight) < self.max_concurrency:
+                name, sql = pending.pop()
+                submitted_at = self.clock()
+                try:
+                    if name in parameters:
+                        handle = self.adapter.submit(sql, parameters[name])
+                    else:
+                        handle = self.adapter.submit(sql)
+                except Exception as e:
+                    yield QueryResult(name, FAILED, None, str(e), self.clock() - submitted_at, 0)
+                    continue
+                heapq.heappush(in_flight, (
+                    submitted_at + self.initial_poll_seconds, sequence, name, handle,
+                    submitted_at, self.initial_poll_seconds, 0,
+                ))
+                sequence += 1
+            if not in_flight:
+                continue
+
+            poll_at, _, name, handle, submitted_at, interval, polls = heapq.heappop(in_flight)
+            delay = poll_at - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            try:
+                state, result = self.adapter.poll(handle)
+            except Exception as e:
+                state, result = FAILED, str(e)
+            polls += 1
+            elapsed = self.clock() - submitted_at
+
+            if state in FINAL_STATES:
+                if state == SUCCEEDED:
+                    yield QueryResult(name, state, result, None, elapsed, polls)
+                else:
+                    yield QueryResult(name, state, None, result, elapsed, polls)
+            elif self.timeout_seconds is not None and elapsed > self.timeout_seconds:
+                error = f"Timed out after {self.timeout_seconds} seconds"
+                try:
+                    self.adapter.cancel(handle)
+                except Exception as e:
+                    # Still a timeout; the statement may run on, so say so
+                    print(f"Error canceling {name}: {e}")
+                    error += f" (cancel failed: {e})"
+                yield QueryResult(name, TIMED_OUT, None, error, elapsed, polls)
+            else:
+                interval = min(interval * self.backoff, self.max_poll_seconds)
+                heapq.heappush(in_flight, (
+                    self.clock() + interval, sequence, name, handle, submitted_at, interval, polls,
+                ))
+                sequence += 1
+
+    def run_all(self, queries, parameters=None):
+        """Run queries concurrently and return a dict of name to QueryResult, in input order."""
+        results = {result.name: result for result in self.run(queries, parameters)}
+        return {name: results[name] for name in queries}
+
+
+def databricks_parameters(parameters):
+    """Statement parameters for the Databricks statement execution API, or None."""
+    if not parameters:
+        return None
+    from databricks.sdk.service.sql import StatementParameterListItem
+
+    return [StatementParameterListItem(name=name, value=str(value)) for name, value in parameters.items()]
+
+
+def bigquery_parameters(parameters):
+    """Scalar query parameters for a BigQuery job, typed from the Python values."""
+    from google.cloud import bigquery
+
+    types = {bool: "BOOL", int: "INT64", float: "FLOAT64"}
+    return [
+        bigquery.ScalarQueryParameter(name, types.get(type(value), "STRING"), value)
+        for name, value in (parameters or {}).items()
+    ]
+
+
+def _state_name(state):
+    # SDK enums (StatementState.SUCCEEDED) and plain strings alike
+    return getattr(state, "value", state)
+
+
+class DatabricksAdapter:
+    """Adapter for a Databricks SQL warehouse, through the databricks-sdk statement execution API."""
+
+    def __init__(self, w, warehouse_id, catalog=None, schema=None):
+        self.w = w
+        self.warehouse_id = warehouse_id
+        self.catalog = catalog
+        self.schema = schema
+
+    def submit(self, sql, parameters=None):
+        # wait_timeout="0s" returns at once with the statement id; the runner does the waiting
+        response = self.w.statement_execution.execute_statement(
+            statement=sql, warehouse_id=self.warehouse_id,
+            catalog=self.catalog, schema=self.schema, wait_timeout="0s",
+            parameters=databricks_parameters(parameters),
+        )
+        return response.statement_id
+
+    def poll(self, statement_id):
+        statement = self.w.statement_execution.get_statement(statement_id=statement_id)
+        state = _state_name(statement.status.state)
+        if state == SUCCEEDED:
+            return SUCCEEDED, self._to_dataframe(statement_id, statement)
+        if state in (FAILED, CANCELED, "CLOSED"):
+            error = statement.status.error
+            message = f"{error.error_code} - {error.message}" if error else f"Statement {state.lower()}"
+            return (CANCELED if state == CANCELED else FAILED), message
+        return state, None
+
+    def _to_dataframe(self, statement_id, statement):
+        columns = []
+        if statement.manifest and statement.manifest.schema and statement.manifest.schema.columns:
+            columns = [column.name for column in statement.manifest.schema.columns]
+        rows = []
+        chunk = statement.result
+        while chunk is not None:
+            rows.extend(chunk.data_array or [])
+            if chunk.next_chunk_index is None:
+                break
+            chunk = self.w.statement_execution.get_statement_result_chunk_n(
+                statement_id=statement_id, chunk_index=chunk.next_chunk_index,
+            )
+        return pd.DataFrame(rows, columns=columns or None)
+
+    def cancel(self, statement_id):
+        self.w.statement_execution.cancel_execution(statement_id=statement_id)
+
+
+class BigQueryAdapter:
+    """Adapter for BigQuery query jobs; job options as in the GCP Report notebook's execute_sql_query."""
+
+    def __init__(self, client, project_id=None, dataset_id=None, location="asia-southeast1",
+                 maximum_bytes_billed=10**10, labels=None):
+        self.client = client
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.location = location
+        self.maximum_bytes_billed = maximum_bytes_billed
+        self.labels = labels or {}
+
+    def submit(self, sql, parameters=None):
+        from google.cloud import bigquery
+
+        job_config = bigquery.QueryJobConfig(
+            use_legacy_sql=False,
+            maximum_bytes_billed=self.maximum_bytes_billed,
+            labels=self.labels,
+            query_parameters=bigquery_parameters(parameters),
+        )
+        if self.dataset_id:
+            job_config.default_dataset = f"{self.project_id}.{self.dataset_id}" if self.project_id else self.dataset_id
+        return self.client.query(sql, job_config=job_config, location=self.location, project=self.project_id)
+
+    def poll(self, job):
+        job.reload()
+        if job.state != "DONE":
+            return job.state, None
+        if job.error_result:
+            return FAILED, f"{job.error_result.get('reason', 'Unknown reason')} - {job.error_result.get('message', 'Unknown error')}"
+        return SUCCEEDED, job.result().to_dataframe()
+
+    def cancel(self, job):
+        job.cancel()
+
+
+# Statement of a CachedAdapter: the cached DataFrame, or the wrapped adapter's handle
+_CachedHandle = namedtuple("_CachedHandle", ["key", "tables", "sql", "df", "handle"])
+# Statement of a CubeAdapter: the cube's answer, or the wrapped adapter's handle
+_CubeHandle = namedtuple("_CubeHandle", ["df", "handle"])
+
+
+class CachedAdapter:
+    """
+    Adapter answering queries from a result cache before submitting them to another adapter.
+
+    Takes the cache and table versions from an execute_sql_query wrapped by
+    query_cache.cached_sql_query, and the catalog/schema or project/dataset
+    from the wrapped adapter, so the runner and the notebook cells share
+    cache entries. A cached query succeeds on its first poll without reaching
+    the warehouse; a submitted one is cached when it succeeds, and one whose
+    table versions cannot be looked up is submitted without the cache. A
+    streamed result (result_stream.ResultStream) is read into a DataFrame to
+    be cached, so it fails the query when it is larger than its memory budget.
+
+    Usage:
+        runner = ReportRunner(CachedAdapter(DatabricksAdapter(w, warehouse_id, catalog, schema), execute_sql_query))
+    """
+
+    def __init__(self, adapter, cached_execute):
+        self.adapter = adapter
+        self.cache = cached_execute.cache
+        self.entry_key = cached_execute.entry_key
+        self.context = {
+            name: getattr(adapter, name) for name in CONTEXT_ARGUMENTS
+            if getattr(adapter, name, None) is not None
+        }
+        self.hits = 0
+
+    def submit(self, sql):
+        try:
+            key, tables = self.entry_key(sql, self.context)
+        except Exception as e:
+            print(f"Not caching query, table version lookup failed: {e}")
+            return _CachedHandle(None, None, sql, None, self.adapter.submit(sql))
+        df = self.cache.get(key)
+        if df is not None:
+            self.hits += 1
+            return _CachedHandle(key, tables, sql, df, None)
+        return _CachedHandle(key, tables, sql, None, self.adapter.submit(sql))
+
+    def poll(self, handle):
+        if handle.df is not None:
+            return SUCCEEDED, handle.df
+        state, result = self.adapter.poll(handle.handle)
+        if state == SUCCEEDED and hasattr(result, "iter_pandas"):
+            result = result.to_pandas()
+        if state == SUCCEEDED and hasattr(result, "columns") and handle.key is not None:
+            self.cache.put(handle.key, result, handle.tables, handle.sql)
+        return state, result
+
+    def cancel(self, handle):
+        if handle.df is None:
+            self.adapter.cancel(handle.handle)
+
+
+class CubeAdapter:
+    """
+    Adapter answering queries from a rollup cube before submitting them to another adapter.
+
+    Queries the cube can answer (rollup_cube.RollupCube.answer) succeed on
+    their first poll without reaching the warehouse; any other query is
+    submitted to the wrapped adapter.
+
+    Usage:
+        runner = ReportRunner(CubeAdapter(cube, CachedAdapter(adapter, execute_sql_query)))
+    """
+
+    def __init__(self, cube, adapter):
+        self.cube = cube
+        self.adapter = adapter
+        self.hits = 0
+
+    def submit(self, sql):
+        df = self.cube.answer(sql)
+        if df is not None:
+            self.hits += 1
+            return _CubeHandle(df, None)
+        return _CubeHandle(None, self.adapter.submit(sql))
+
+    def poll(self, handle):
+        if handle.df is not None:
+            return SUCCEEDED, handle.df
+        return self.adapter.poll(handle.handle)
+
+    def cancel(self, handle):
+        if handle.df is None:
+            self.adapter.cancel(handle.handle)
+
+
+def serial_fixed_poll_seconds(latencies, poll_interval_seconds=5):
+    """Wall time of running queries one after another, checking every poll_interval_seconds."""
+    return sum(math.ceil(latency / poll_interval_seconds) * poll_interval_seconds for latency in latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the report queries concurrently against a fake warehouse")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f"Queries in flight at once (default: {DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument("--slots", type=int, default=4, help="Queries the fake warehouse runs at once (default: 4)")
+    parser.add_argument("--min-latency", type=float, default=0.2, help="Shortest simulated query time in seconds")
+    parser.add_argument("--max-latency", type=float, default=3.0, help="Longest simulated query time in seconds")
+    args = parser.parse_args()
+
+    from .fake_warehouse import FakeWarehouse
+
+    try:
+        warehouse = FakeWarehouse(args.min_latency, args.max_latency, slots=args.slots)
+        runner = ReportRunner(warehouse, max_concurrency=args.concurrency)
+        queries = {name: sql for name, (_, sql) in REPORT_QUERIES.items()}
+        start_time = time.time()
+        for result in runner.run(queries):
+            print(f"{result.name}: {result.state} in {result.seconds:.2f}s after {result.polls} polls")
+        elapsed = time.time() - start_time
+        serial = serial_fixed_poll_seconds([warehouse.latency(sql) for sql in queries.values()])
+        print(f"Ran {len(queries)} queries in {elapsed:.2f}s with {warehouse.polls} polls; "
+              f"serial with a fixed 5 s poll: {serial:.0f}s")
+    except Exception as e:
+        print(f"Error running report: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
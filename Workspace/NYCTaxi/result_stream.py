@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Stream large query results as Arrow record batches, within a memory budget.
+
+``execute_sql_query`` in the Report notebooks turns the whole JSON result
+into a pandas DataFrame. That is fine for ``group by taxi_type``, but a
+drill-down query returning millions of trip rows from
+``taxi_trips_mat_view`` runs out of memory, and nothing is shown until every
+row has arrived.
+
+``ResultStream`` reads a result as Arrow chunks instead. These are the
+``ARROW_STREAM`` external links of the Databricks statement execution API,
+the Arrow pages of a BigQuery job, or the chunks of
+``fake_warehouse.FakeWarehouse(chunk_rows=...)``. It yields them as record
+batches:
+
+- chunks are downloaded in a background thread while the caller consumes
+  earlier ones, and only as long as the chunks held stay within
+  ``memory_budget_bytes``; one chunk is always allowed, however large
+- batches point into the downloaded chunk (no copy); a chunk counts against
+  the budget until the caller moves on to the next one
+- pandas conversion happens only on request: per batch with
+  ``iter_pandas``, or for the whole result with ``to_pandas``, which refuses
+  results larger than the budget
+
+The adapters plug into report_runner.ReportRunner like the DataFrame ones,
+with a ResultStream as the result.
+
+Usage (in the Databricks Report notebook):
+    runner = ReportRunner(DatabricksStreamAdapter(w, warehouse_id, catalog, schema))
+    for result in runner.run({"drill_down": "select * from taxi_trips_mat_view"}):
+        for df in result.df.iter_pandas():
+            ...
+
+    python -m NYCTaxi.result_stream <mat_view_dir> [--sql "select * from taxi_trips_mat_view"]
+        [--chunk-rows 100000] [--memory-budget-mb 64] [--chunk-latency 0.05] [--pandas]
+        Stream a query over a local mat view from the fake warehouse
+"""
+
+import argparse
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque, namedtuple
+from functools import partial
+
+import pyarrow as pa
+
+from .report_runner import FAILED, SUCCEEDED, BigQueryAdapter, DatabricksAdapter, ReportRunner, databricks_parameters
+
+DEFAULT_MEMORY_BUDGET_BYTES = 256 * 1024 ** 2
+DEFAULT_BIGQUERY_PAGE_SIZE = 100_000
+
+# fetch() returns the chunk as Arrow IPC stream bytes (or a pyarrow Buffer or RecordBatch);
+# row_count and byte_count may be None when the source does not say
+ResultChunk = namedtuple("ResultChunk", ["index", "row_count", "byte_count", "fetch"])
+
+
+def _chunk_size(data):
+    return data.nbytes if isinstance(data, pa.RecordBatch) else data.size
+
+
+class ResultStream:
+    """
+    One-pass iterator over the record batches of a chunked query result.
+
+    Usage:
+        stream = ResultStream(chunks, memory_budget_bytes=64 * 1024 ** 2)
+        for batch in stream:
+            ...
+    """
+
+    def __init__(self, chunks, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, prefetch=True):
+        """
+        Args:
+            chunks: Iterable of ResultChunk, in result order
+            memory_budget_bytes: Most bytes of downloaded chunks to hold at once
+            prefetch: Download the next chunks in a background thread
+        """
+        self.chunks = chunks
+        self.memory_budget_bytes = memory_budget_bytes
+        self.prefetch = prefetch
+        self.schema = None
+        self.rows = 0
+        self.batches = 0
+        self.chunks_read = 0
+        self.bytes_fetched = 0
+        self.peak_buffered_bytes = 0
+        self._started = False
+
+    @classmethod
+    def from_batches(cls, batches, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, prefetch=True):
+        """Stream over an iterable of record batches that downloads lazily, e.g. a BigQuery to_arrow_iterable()."""
+        chunks = (
+            ResultChunk(index, batch.num_rows, None, lambda batch=batch: batch)
+            for index, batch in enumerate(batches)
+        )
+        return cls(chunks, memory_budget_bytes, prefetch)
+
+    def _sequential(self):
+        for chunk in self.chunks:
+            data = chunk.fetch()
+            data = pa.py_buffer(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+            self.bytes_fetched += _chunk_size(data)
+            self.peak_buffered_bytes = max(self.peak_buffered_bytes, _chunk_size(data))
+            yield data
+
+    def _prefetched(self):
+        condition = threading.Condition()
+        ready = deque()
+        state = {"buffered": 0, "last_size": 0, "done": False, "closed": False, "error": None}
+
+        def produce():
+            try:
+                for chunk in self.chunks:
+                    with condition:
+                        expected = chunk.byte_count if chunk.byte_count is not None else state["last_size"]
+                        while (not state["closed"] and state["buffered"]
+                               and state["buffered"] + expected > self.memory_budget_bytes):
+                            condition.wait()
+                        if state["closed"]:
+                            return
+                    data = chunk.fetch()
+                    data = pa.py_buffer(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+                    with condition:
+                        state["buffered"] += _chunk_size(data)
+                        state["last_size"] = _chunk_size(data)
+                        self.bytes_fetched += _chunk_size(data)
+                        self.peak_buffered_bytes = max(self.peak_buffered_bytes, state["buffered"])
+                        ready.append(data)
+                        condition.notify_all()
+            except Exception as e:
+                with condition:
+                    state["error"] = e
+            finally:
+                with condition:
+                    state["done"] = True
+                    condition.notify_all()
+
+        thread = threading.Thread(target=produce, name="result-stream-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                with condition:
+                    while not ready and not state["done"]:
+                        condition.wait()
+                    if ready:
+                        data = ready.popleft()
+                    elif state["error"] is not None:
+                        raise state["error"]
+                    else:
+                        return
+                yield data
+                # The caller has moved on from this chunk's batches
+                with condition:
+                    state["buffered"] -= _chunk_size(data)
+                    condition.notify_all()
+        finally:
+            with condition:
+                state["closed"] = True
+                condition.notify_all()
+
+    def __iter__(self):
+        if self._started:
+            raise ValueError("A ResultStream can only be iterated once")
+        self._started = True
+        for data in self._prefetched() if self.prefetch else self._sequential():
+            self.chunks_read += 1
+            if isinstance(data, pa.RecordBatch):
+                batches = [data]
+                self.schema = self.schema or data.schema
+            else:
+                reader = pa.ipc.open_stream(data)
+                self.schema = self.schema or reader.schema
+                batches = reader
+            for batch in batches:
+                self.rows += batch.num_rows
+                self.batches += 1
+                yield batch
+
+    def iter_pandas(self, **kwargs):
+        """DataFrame per record batch, converted as it is reached (kwargs go to RecordBatch.to_pandas)."""
+        for batch in self:
+            yield batch.to_pandas(**kwargs)
+
+    def to_arrow(self):
+        """
+        The whole result as a pyarrow Table.
+
+        Raises:
+            ValueError: if the result is larger than the memory budget
+        """
+        batches, total = [], 0
+        for batch in self:
+            total += batch.nbytes
+            if total > self.memory_budget_bytes:
+                raise ValueError(
+                    f"Result exceeds the memory budget of {self.memory_budget_bytes} bytes after {self.rows} rows; "
+                    "iterate over the stream or raise memory_budget_bytes"
+                )
+            batches.append(batch)
+        return pa.Table.from_batches(batches, schema=self.schema)
+
+    def to_pandas(self, **kwargs):
+        """
+        The whole result as a DataFrame, within the memory budget.
+
+        Arrow buffers are released column by column as they are converted,
+        and numeric columns without nulls are not copied.
+        """
+        options = {"split_blocks": True, "self_destruct": True}
+        options.update(kwargs)
+        return self.to_arrow().to_pandas(**options)
+
+
+def _download(url):
+    # External links are pre-signed: no Databricks credentials may be sent with them
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def databricks_chunks(w, statement_id, result):
+    """ResultChunks of a Databricks statement run with format ARROW_STREAM and disposition EXTERNAL_LINKS."""
+    while result is not None:
+        links = result.external_links or []
+        for link in links:
+            yield ResultChunk(link.chunk_index, link.row_count, link.byte_count, partial(_download, link.external_link))
+        next_chunk_index = links[-1].next_chunk_index if links else result.next_chunk_index
+        if next_chunk_index is None:
+            break
+        result = w.statement_execution.get_statement_result_chunk_n(
+            statement_id=statement_id, chunk_index=next_chunk_index,
+        )
+
+
+class DatabricksStreamAdapter(DatabricksAdapter):
+    """DatabricksAdapter whose results are ResultStreams over Arrow external links."""
+
+    def __init__(self, w, warehouse_id, catalog=None, schema=None,
+                 memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES):
+        super().__init__(w, warehouse_id, catalog, schema)
+        self.memory_budget_bytes = memory_budget_bytes
+
+    def submit(self, sql, parameters=None):
+        from databricks.sdk.service.sql import Disposition, Format
+
+        response = self.w.statement_execution.execute_statement(
+            statement=sql, warehouse_id=self.warehouse_id,
+            catalog=self.catalog, schema=self.schema, wait_timeout="0s",
+            format=Format.ARROW_STREAM, disposition=Disposition.EXTERNAL_LINKS,
+            parameters=databricks_parameters(parameters),
+        )
+        return response.statement_id
+
+    def _to_dataframe(self, statement_id, statement):
+        # Called by DatabricksAdapter.poll on success; the stream replaces the DataFrame
+        return ResultStream(databricks_chunks(self.w, statement_id, statement.result), self.memory_budget_bytes)
+
+
+class BigQueryStreamAdapter(BigQueryAdapter):
+    """BigQueryAdapter whose results are ResultStreams over the job's Arrow pages."""
+
+    def __init__(self, client, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES,
+                 page_size=DEFAULT_BIGQUERY_PAGE_SIZE, **kwargs):
+        super().__init__(client, **kwargs)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.page_size = page_size
+
+    def poll(self, job):
+        job.reload()
+        if job.state != "DONE":
+            return job.state, None
+        if job.error_result:
+            return FAILED, f"{job.error_result.get('reason', 'Unknown reason')} - {job.error_result.get('message', 'Unknown error')}"
+        batches = job.result(page_size=self.page_size).to_arrow_iterable()
+        return SUCCEEDED, ResultStream.from_batches(batches, self.memory_budget_bytes)
+
+
+class ChunkedResultAdapter:
+    """
+    Adapter for endpoints whose succeeded poll returns a list of chunk dicts
+    (chunk_index, row_count, byte_count) and that serve each chunk with
+    fetch_chunk(handle, chunk_index), such as FakeWarehouse(chunk_rows=...).
+    """
+
+    def __init__(self, endpoint, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, prefetch=True):
+        self.endpoint = endpoint
+        self.memory_budget_bytes = memory_budget_bytes
+        self.prefetch = prefetch
+
+    def submit(self, sql):
+        return self.endpoint.submit(sql)
+
+    def poll(self, handle):
+        state, result = self.endpoint.poll(handle)
+        if state != SUCCEEDED:
+            return state, result
+        chunks = [
+            ResultChunk(chunk["chunk_index"], chunk.get("row_count"), chunk.get("byte_count"),
+                        partial(self.endpoint.fetch_chunk, handle, chunk["chunk_index"]))
+            for chunk in result
+        ]
+        return SUCCEEDED, ResultStream(chunks, self.memory_budget_bytes, self.prefetch)
+
+    def cancel(self, handle):
+        self.endpoint.cancel(handle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a query result from the fake warehouse as Arrow chunks")
+    parser.add_argument("mat_view_dir", help="Local taxi_trips_mat_view dir (see matview.py)")
+    parser.add_argument("--sql", default="select * from taxi_trips_mat_view", help="Query to stream")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Rows per result chunk (default: 100000)")
+    parser.add_argument("--memory-budget-mb", type=float, default=DEFAULT_MEMORY_BUDGET_BYTES / 1024 ** 2,
+                        help=f"Memory budget for downloaded chunks (default: {DEFAULT_MEMORY_BUDGET_BYTES // 1024 ** 2})")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Simulated download seconds per chunk")
+    parser.add_argument("--pandas", action="store_true", help="Convert each batch to a DataFrame as it arrives")
+    args = parser.parse_args()
+
+    import duckdb
+
+    from .fake_warehouse import FakeWarehouse
+    from .run_metrics import peak_memory_bytes
+    from .virtual_columns import create_duckdb_view
+
+    try:
+        con = duckdb.connect()
+        create_duckdb_view(con, "taxi_trips_mat_view", args.mat_view_dir)
+
+        def execute(sql):
+            # .arrow() returns a Table on older DuckDB versions and a RecordBatchReader on newer ones
+            result = con.execute(sql).arrow()
+            return result.read_all() if isinstance(result, pa.RecordBatchReader) else result
+
+        warehouse = FakeWarehouse(
+            0.1, 0.1, execute=execute,
+            chunk_rows=args.chunk_rows, chunk_latency_seconds=args.chunk_latency,
+        )
+        adapter = ChunkedResultAdapter(warehouse, int(args.memory_budget_mb * 1024 ** 2))
+        result = next(ReportRunner(adapter).run({"drill_down": args.sql}))
+        if result.state != SUCCEEDED:
+            raise ValueError(result.error)
+
+        stream = result.df
+        start_time = time.time()
+        first_batch_seconds = None
+        for batch in stream.iter_pandas() if args.pandas else stream:
+            if first_batch_seconds is None:
+                first_batch_seconds = time.time() - start_time
+        elapsed = time.time() - start_time
+        print(f"Streamed {stream.rows} rows in {stream.batches} batches from {stream.chunks_read} chunks "
+              f"({stream.bytes_fetched / 1024 ** 2:.1f} MiB) in {elapsed:.2f}s, first batch after "
+              f"{first_batch_seconds or 0:.2f}s; at most {stream.peak_buffered_bytes / 1024 ** 2:.1f} MiB of chunks held, "
+              f"process peak memory {peak_memory_bytes() / 1024 ** 2:.0f} MiB")
+    except Exception as e:
+        print(f"Error streaming result: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Rollup cube of taxi_trips_mat_view for the standard report aggregates.
+
+Most Report notebook queries group the whole mat view by ``taxi_type``
+(sometimes with ``trip_year``/``trip_month``) and compute counts, sums and
+averages, so each one scans every row. The cube keeps, per
+(taxi_type, trip_year, trip_month) cell,
+
+- the trip count, and the counts of tipless and no-charge trips
+- for each of MEASURE_COLUMNS, the non-null count, sum and sum of squares
+
+These partial aggregates are mergeable: a coarser group (taxi_type, a year,
+the whole table) is the sum of its cells, and avg/variance/stddev follow from
+count, sum and sum of squares.
+
+A cell is exactly one mat view partition, so the cube is maintained like the
+mat view itself (see matview.py): each partition's file listing is signed,
+and only new or changed partitions are re-aggregated on refresh.
+
+Against a warehouse, ``CELLS_SQL`` computes the same cells in one scan of the
+mat view and ``RollupCube.from_dataframe`` builds the cube from its result.
+The Report notebooks run it through the result cache (query_cache.py), so
+the scan is repeated only when the mat view changes, and put the cube in
+front of the warehouse with report_runner.CubeAdapter.
+
+``RollupCube.answer`` recognizes the report query shapes (a restricted SQL
+grammar: dimension columns, count/sum/avg/stddev/variance with optional
+round, trip_year/trip_month filters, the tipless and no-charge filters,
+group by and order by) and returns None for anything else, so the report
+layer can fall back to the warehouse.
+
+Usage:
+    python -m NYCTaxi.rollup_cube <mat_view_dir> [--full-refresh] [--check]
+        Refresh the cube of a local mat view and answer the report queries
+        from it; --check also runs them on DuckDB over the mat view and
+        compares.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .matview import list_source_partitions, partition_signature
+from .report_queries import REPORT_QUERIES
+from .schemas import TAXI_TYPES
+
+CUBE_FILE_NAME = "_rollup_cube.json"
+CUBE_VERSION = 1
+
+CUBE_TABLE = "taxi_trips_mat_view"
+DIMENSIONS = ["taxi_type", "trip_year", "trip_month"]
+MEASURE_COLUMNS = ["total_amount", "trip_distance", "tip_amount", "fare_amount"]
+
+# Row filters the cube keeps a count for: set of predicates -> count measure
+ROW_FILTERS = {
+    frozenset(): "trip_count",
+    frozenset(["tip_amount=0"]): "tipless_count",
+    frozenset(["payment_type_description='No charge'", "total_amount=0"]): "no_charge_count",
+}
+
+# The cube's cells computed by the warehouse, in the columns of RollupCube.to_dataframe
+CELLS_SQL = """
+select
+  taxi_type,
+  cast(trip_year as int) as trip_year,
+  cast(trip_month as int) as trip_month,
+  count(1) as trip_count,
+  sum(case when tip_amount = 0 then 1 else 0 end) as tipless_count,
+  sum(case when payment_type_description = 'No charge' and total_amount = 0 then 1 else 0 end) as no_charge_count,
+{measures}
+from {table}
+group by 1, 2, 3
+""".format(
+    measures=",\n".join(
+        f"  count({name}) as {name}_count,\n  sum({name}) as {name}_sum,\n  sum({name} * {name}) as {name}_sumsq"
+        for name in MEASURE_COLUMNS
+    ),
+    table=CUBE_TABLE,
+)
+
+_QUERY = re.compile(
+    r"^select (?P<items>.+?) ?from (?P<table>[\w.`]+)"
+    r"(?: where (?P<where>.+?))?"
+    r"(?: ?group by (?P<group>.+?))?"
+    r"(?: ?order by (?P<order>.+?))?$",
+    re.IGNORECASE,
+)
+_COLUMN_ITEM = re.compile(r"^(?P<column>\w+)(?:(?: as)? (?P<alias>\w+))?$", re.IGNORECASE)
+_AGGREGATE_ITEM = re.compile(
+    r"^(?P<round>round\()?"
+    r"(?P<function>count|sum|avg|stddev|stddev_samp|variance|var_samp)\((?P<argument>\*|1|\w+)\)"
+    r"(?:,(?P<digits>\d+)\))?"
+    r"(?: ?(?:as )?(?P<alias>\w+))?$",
+    re.IGNORECASE,
+)
+_DIMENSION_FILTER = re.compile(r"^(?P<column>trip_year|trip_month)=(?P<value>\d+|'\d+')$", re.IGNORECASE)
+_ORDER_ITEM = re.compile(r"^(?P<name>\w+)(?: (?P<direction>asc|desc))?$", re.IGNORECASE)
+
+
+def partial_aggregates(table):
+    """
+    Mergeable aggregates of a set of mat view rows.
+
+    Args:
+        table: pyarrow Table with MEASURE_COLUMNS, tip_amount and payment_type_description
+
+    Returns:
+        Dict of measure name to value
+    """
+    aggregates = {"trip_count": table.num_rows}
+    for name in MEASURE_COLUMNS:
+        values = table.column(name).cast(pa.float64())
+        aggregates[f"{name}_count"] = pc.count(values).as_py()
+        aggregates[f"{name}_sum"] = pc.sum(values).as_py() or 0.0
+        aggregates[f"{name}_sumsq"] = pc.sum(pc.multiply(values, values)).as_py() or 0.0
+    tipless = pc.equal(table.column("tip_amount"), 0)
+    aggregates["tipless_count"] = pc.sum(tipless).as_py() or 0
+    no_charge = pc.and_(
+        pc.equal(table.column("payment_type_description"), "No charge"),
+        pc.equal(table.column("total_amount"), 0),
+    )
+    aggregates["no_charge_count"] = pc.sum(no_charge).as_py() or 0
+    return aggregates
+
+
+# A string literal, or a run of SQL outside literals
+_LITERAL_OR_CODE = re.compile(r"'(?:[^']|'')*'|[^']+|'")
+
+
+def _outside_literals(sql, function):
+    # Apply function to the SQL between string literals, keeping the literals as written
+    return "".join(
+        part if part.startswith("'") else function(part)
+        for part in _LITERAL_OR_CODE.findall(sql)
+    )
+
+
+def _compact_sql(sql):
+    # Drop comments and semicolons, collapse whitespace and remove it around punctuation
+    sql = re.sub(r"('(?:[^']|'')*')|--[^\n]*|/\*.*?\*/", lambda m: m.group(1) or " ", sql, flags=re.DOTALL)
+    sql = _outside_literals(sql, lambda code: re.sub(r"\s+", " ", code)).rstrip(";").strip()
+    return _outside_literals(sql, lambda code: re.sub(r" ?([(),=]) ?", r"\1", code))
+
+
+def _split_items(text):
+    # Split on commas outside parentheses
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    items.append(text[start:].strip())
+    return items
+
+
+def _round_half_up(values, digits):
+    # Spark's round() rounds half away from zero, numpy's rounds half to even
+    scale = 10 ** digits
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+class RollupCube:
+    """
+    Per-partition partial aggregates of a local taxi_trips_mat_view.
+
+    Usage:
+        cube = RollupCube(mat_view_dir)
+        cube.refresh()
+        df = cube.answer("select taxi_type, count(1) as trip_count from taxi_trips_mat_view group by taxi_type")
+    """
+
+    def __init__(self, mat_view_dir, cube_path=None):
+        self.mat_view_dir = mat_view_dir
+        self.cube_path = cube_path or os.path.join(mat_view_dir, CUBE_FILE_NAME)
+        self.cells = self._load()
+
+    @classmethod
+    def from_dataframe(cls, cells):
+        """
+        Cube of precomputed cells, e.g. the result of CELLS_SQL on the warehouse.
+
+        Args:
+            cells: DataFrame with the columns of to_dataframe(), one row per cell
+
+        Returns:
+            RollupCube that answers queries but has no mat view dir to refresh from
+        """
+        cube = cls.__new__(cls)
+        cube.mat_view_dir = None
+        cube.cube_path = None
+        cube.cells = {}
+        measures = [name for name in cells.columns if name not in DIMENSIONS]
+        for row in cells.fillna({name: 0 for name in measures}).to_dict("records"):
+            key = f"taxi_type={row['taxi_type']}/trip_year={int(row['trip_year'])}/trip_month={int(row['trip_month']):02d}"
+            cube.cells[key] = {name: row[name] for name in measures}
+        return cube
+
+    def _load(self):
+        if not os.path.exists(self.cube_path):
+            return {}
+        with open(self.cube_path, "r") as f:
+            cube = json.load(f)
+        if cube.get("version") != CUBE_VERSION:
+            print(f"Ignoring rollup cube {self.cube_path} with unsupported version {cube.get('version')}")
+            return {}
+        return cube["cells"]
+
+    def save(self):
+        """Write the cube atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.cube_path)), exist_ok=True)
+        tmp_path = self.cube_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CUBE_VERSION, "cells": self.cells}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.cube_path)
+
+    def mat_view_partitions(self):
+        """Parquet files of each mat view partition, keyed like the mat view's refresh state."""
+        partitions = {}
+        for taxi_type in TAXI_TYPES:
+            partitions.update(list_source_partitions(
+                taxi_type, os.path.join(self.mat_view_dir, f"taxi_type={taxi_type}")
+            ))
+        return partitions
+
+    def refresh(self, full_refresh=False):
+        """
+        Re-aggregate new and changed mat view partitions and drop removed ones.
+
+        Returns:
+            Dict with the updated and removed partition keys and elapsed seconds
+        """
+        start_time = time.time()
+        partitions = self.mat_view_partitions()
+        columns = sorted(set(MEASURE_COLUMNS) | {"tip_amount", "payment_type_description"})
+        updated = []
+        for key, paths in sorted(partitions.items()):
+            signature = partition_signature(paths)
+            if not full_refresh and self.cells.get(key, {}).get("signature") == signature:
+                continue
+            table = pa.concat_tables([pq.read_table(path, columns=columns) for path in paths])
+            self.cells[key] = {
+                "signature": signature,
+                "refreshed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                **partial_aggregates(table),
+            }
+            updated.append(key)
+        removed = sorted(set(self.cells) - set(partitions))
+        for key in removed:
+            del self.cells[key]
+        self.save()
+        return {"updated": updated, "removed": removed, "seconds": time.time() - start_time}
+
+    def to_dataframe(self):
+        """The cube's cells as a pandas DataFrame, one row per (taxi_type, trip_year, trip_month)."""
+        rows = []
+        for key, cell in self.cells.items():
+            dimensions = dict(part.split("=", 1) for part in key.split("/"))
+            row = {name: value for name, value in cell.items() if name not in ("signature", "refreshed_at")}
+            row.update(taxi_type=dimensions["taxi_type"], trip_year=int(dimensions["trip_year"]),
+                       trip_month=dimensions["trip_month"])
+            rows.append(row)
+        columns = DIMENSIONS + ["trip_count", "tipless_count", "no_charge_count"] + [
+            f"{name}_{suffix}" for name in MEASURE_COLUMNS for suffix in ("count", "sum", "sumsq")
+        ]
+        return pd.DataFrame(rows, columns=columns)
+
+    def answer(self, sql):
+        """
+        Answer a report query from the cube.
+
+        Args:
+            sql: Query over taxi_trips_mat_view
+
+        Returns:
+            pandas DataFrame, or None when the query is not one the cube can answer
+        """
+        match = _QUERY.match(_compact_sql(sql))
+        if not match or match.group("table").replace("`", "").split(".")[-1].lower() != CUBE_TABLE:
+            return None
+
+        group_by = [name.lower() for name in _split_items(match.group("group"))] if match.group("group") else []
+        if any(name not in DIMENSIONS for name in group_by):
+            return None
+
+        # Filters: dimension equalities pick cells, the rest must be a row filter the cube counts
+        cells = self.to_dataframe()
+        row_filter = set()
+        for predicate in re.split(r" and ", match.group("where") or "", flags=re.IGNORECASE):
+            if not predicate:
+                continue
+            dimension = _DIMENSION_FILTER.match(predicate)
+            if dimension:
+                column, value = dimension.group("column").lower(), dimension.group("value").strip("'")
+                if column == "trip_year":
+                    cells = cells[cells["trip_year"] == int(value)]
+                else:
+                    cells = cells[cells["trip_month"].astype(int) == int(value)]
+                continue
+            # Identifiers and keywords are case-insensitive, string literals are not
+            row_filter.add(re.sub(r"=0\.0+$", "=0", _outside_literals(predicate, str.lower)))
+        count_measure = ROW_FILTERS.get(frozenset(row_filter))
+        if count_measure is None:
+            return None
+
+        if group_by:
+            grouped = cells.groupby(group_by, sort=True).sum(numeric_only=True).reset_index()
+            # A group with no matching rows has no row in the query's result
+            grouped = grouped[grouped[count_measure] > 0].reset_index(drop=True)
+        else:
+            grouped = pd.DataFrame({name: [cells[name].sum()] for name in cells.columns if name not in DIMENSIONS})
+
+        result = {}
+        for item in _split_items(match.group("items")):
+            column = _COLUMN_ITEM.match(item)
+            if column and column.group("column").lower() in DIMENSIONS:
+                name = column.group("column").lower()
+                if name not in group_by:
+                    return None
+                result[column.group("alias") or name] = grouped[name].to_numpy()
+                continue
+            aggregate = _AGGREGATE_ITEM.match(item)
+            if not aggregate or bool(aggregate.group("round")) != bool(aggregate.group("digits")):
+                return None
+            values = self._aggregate(grouped, aggregate.group("function").lower(),
+                                     aggregate.group("argument").lower(), count_measure)
+            if values is None:
+                return None
+            if aggregate.group("digits"):
+                values = _round_half_up(values, int(aggregate.group("digits")))
+            result[aggregate.group("alias") or item] = values
+        df = pd.DataFrame(result)
+
+        if match.group("order"):
+            # Order by output names, or by grouped dimensions under their own name
+            keys = df.copy()
+            names, ascending = [], []
+            for item in _split_items(match.group("order")):
+                order = _ORDER_ITEM.match(item)
+                if not order:
+                    return None
+                name = next((column for column in df.columns if column.lower() == order.group("name").lower()), None)
+                if name is None and order.group("name").lower() in group_by:
+                    name = f"__{order.group('name').lower()}"
+                    keys[name] = grouped[order.group("name").lower()].to_numpy()
+                if name is None:
+                    return None
+                names.append(name)
+                ascending.append((order.group("direction") or "asc").lower() == "asc")
+            positions = keys.sort_values(names, ascending=ascending, kind="stable").index
+            df = df.loc[positions].reset_index(drop=True)
+        return df
+
+    @staticmethod
+    def _aggregate(grouped, function, argument, count_measure):
+        if function == "count" and argument in ("*", "1"):
+            return grouped[count_measure].to_numpy()
+        # Sums and averages are only kept over all rows of a cell
+        if count_measure != "trip_count" or argument not in MEASURE_COLUMNS:
+            return None
+        count = grouped[f"{argument}_count"].to_numpy(dtype=np.float64)
+        total = grouped[f"{argument}_sum"].to_numpy(dtype=np.float64)
+        squares = grouped[f"{argument}_sumsq"].to_numpy(dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if function == "count":
+                return grouped[f"{argument}_count"].to_numpy()
+            if function == "sum":
+                return np.where(count > 0, total, np.nan)
+            if function == "avg":
+                return np.where(count > 0, total / count, np.nan)
+            # Sample variance, as Spark's variance/var_samp and stddev/stddev_samp
+            variance = np.where(count > 1, np.maximum(squares - total * total / count, 0.0) / (count - 1), np.nan)
+            return np.sqrt(variance) if function.startswith("stddev") else variance
+
+
+def cube_sql_query(execute, cube):
+    """
+    Wrap a report's execute_sql_query so queries the rollup cube can answer skip the warehouse.
+
+    Args:
+        execute: execute_sql_query of a Report notebook (or a cached_sql_query wrapper)
+        cube: RollupCube, refreshed
+
+    Returns:
+        Function with the signature of execute
+    """
+    def cube_execute(*args, **kwargs):
+        query = kwargs["query"] if "query" in kwargs else args[1]
+        df = cube.answer(query)
+        return df if df is not None else execute(*args, **kwargs)
+
+    cube_execute.cube = cube
+    return cube_execute
+
+
+def _same_result(expected, actual):
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    expected = expected.sort_values(list(expected.columns)).reset_index(drop=True)
+    actual = actual.sort_values(list(actual.columns)).reset_index(drop=True)
+    for name in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[name]) and pd.api.types.is_numeric_dtype(actual[name]):
+            if not np.allclose(expected[name].astype(float), actual[name].astype(float), rtol=1e-9, equal_nan=True):
+                return False
+        elif not (expected[name].astype(str) == actual[name].astype(str)).all():
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain a rollup cube of a local taxi_trips_mat_view")
+    parser.add_argument("mat_view_dir", help="Dir of the mat view, as written by matview.py")
+    parser.add_argument("--full-refresh", action="store_true", help="Re-aggregate every partition")
+    parser.add_argument("--check", action="store_true",
+                        help="Also run the report queries on DuckDB over the mat view and compare")
+    args = parser.parse_args()
+
+    try:
+        cube = RollupCube(args.mat_view_dir)
+        result = cube.refresh(full_refresh=args.full_refresh)
+        print(f"Updated {len(result['updated'])} cells, removed {len(result['removed'])} "
+              f"in {result['seconds']:.2f}s; cube has {len(cube.cells)} cells")
+
+        con = None
+        if args.check:
+            import duckdb
+
+            con = duckdb.connect()
+            files = os.path.join(args.mat_view_dir, "taxi_type=*", "trip_year=*", "trip_month=*", "*.parquet")
+            con.execute(f"""
+                CREATE VIEW {CUBE_TABLE} AS
+                SELECT * FROM read_parquet('{files}', hive_partitioning = true,
+                                           hive_types = {{'trip_year': INTEGER, 'trip_month': VARCHAR}})
+            """)
+
+        for name, (_, sql) in REPORT_QUERIES.items():
+            start_time = time.time()
+            df = cube.answer(sql)
+            cube_seconds = time.time() - start_time
+            if df is None:
+                print(f"{name}: not answerable from the cube")
+                continue
+            line = f"{name}: {len(df)} rows from the cube in {cube_seconds * 1000:.1f}ms"
+            if con is not None:
+                start_time = time.time()
+                expected = con.execute(re.sub(r"[\w.`]*taxi_trips_mat_view", CUBE_TABLE, sql)).fetchdf()
+                scan_seconds = time.time() - start_time
+                match = "matches" if _same_result(expected, df) else "DIFFERS from"
+                line += f", {match} the mat view scan ({scan_seconds * 1000:.1f}ms)"
+            print(line)
+    except Exception as e:
+        print(f"Error maintaining rollup cube: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
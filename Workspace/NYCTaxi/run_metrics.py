@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Run metrics for the pipeline stages, in an append-only JSONL store.
+
+Every stage (``convert``, ``transform``, ``materialize``) and every month
+partition it processes appends one record: wall time, rows and bytes in and
+out, and peak memory. A stage record has the process's peak since it
+started; a partition record has the peak sampled while that partition was
+processed (``MemorySampler``), since the process peak only ever grows and
+would repeat the largest partition's on every later one. Records of one pipeline run share a
+``run_id``, so separate commands (convert, then enrich, then matview) add
+up to one run when given the same ``--run-id``. Timings of cloud runs (a
+Databricks job, a BigQuery script) go in with ``record``.
+
+The store is plain JSONL, one record per line, appended with a single
+``O_APPEND`` write per record so parallel writers never interleave. It is
+read by scripts/create_cost_performance_charts.py for the stage timings and
+the trend charts.
+
+Usage:
+    python -m NYCTaxi.convert ... --metrics-store runs.jsonl --run-id 2025-06-01
+        Record a pipeline step (convert.py, enrich.py and matview.py take the same flags)
+    python -m NYCTaxi.run_metrics record --platform azure --stage convert --wall-seconds 7239 [--run-id ...]
+        Record a stage measured elsewhere
+    python -m NYCTaxi.run_metrics summary [--platform azure]
+        Print the stage times of each run
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+STORE_ENV_VARIABLE = "NYCTAXI_RUN_METRICS"
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nyctaxi", "run_metrics.jsonl")
+
+DEFAULT_SAMPLE_SECONDS = 0.01
+
+STAGES = ["convert", "transform", "materialize"]
+PLATFORMS = ["local", "azure", "gcp", "snowflake"]
+
+COUNTER_FIELDS = ["rows_in", "rows_out", "bytes_in", "bytes_out"]
+
+
+def peak_memory_bytes():
+    """High-water mark of this process's resident memory since it started."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_memory_bytes():
+    """This process's resident memory now, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class MemorySampler:
+    """
+    Peak resident memory of this process while a block runs.
+
+    The resident size is sampled on a background thread every
+    sample_seconds, so a spike shorter than that can be missed. Most of the
+    pipeline's memory is Arrow and DuckDB buffers, which tracemalloc does not
+    see, hence the resident size rather than Python allocations.
+
+    Usage:
+        with MemorySampler() as memory:
+            ...
+        metrics.add("convert", seconds, partition=..., peak_memory=memory.peak_bytes)
+    """
+
+    def __init__(self, sample_seconds=DEFAULT_SAMPLE_SECONDS):
+        self.sample_seconds = sample_seconds
+        self.peak_bytes = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        current = current_memory_bytes()
+        if current is not None and (self.peak_bytes is None or current > self.peak_bytes):
+            self.peak_bytes = current
+
+    def _run(self):
+        while not self._stop.wait(self.sample_seconds):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        if self.peak_bytes is not None:
+            self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        self._sample()
+        return False
+
+
+def new_run_id():
+    """Run id sortable by start time, e.g. 20250601T120000Z-3f2a9c."""
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:6]}"
+
+
+def append_record(store_path, record):
+    """Append one record to the store with a single O_APPEND write."""
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    line = (json.dumps(record, sort_keys=True) + "\n").encode()
+    fd = os.open(store_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def load_records(store_path=None, platform=None, stage=None):
+    """
+    Records of the store, oldest first.
+
+    A torn last line (a writer killed mid-write) is skipped.
+
+    Args:
+        store_path: JSONL store (default: $NYCTAXI_RUN_METRICS or DEFAULT_STORE_PATH)
+        platform: Only records of this platform
+        stage: Only records of this stage
+    """
+    store_path = store_path or os.environ.get(STORE_ENV_VARIABLE, DEFAULT_STORE_PATH)
+    if not os.path.exists(store_path):
+        return []
+    records = []
+    with open(store_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if platform and record.get("platform") != platform:
+                continue
+            if stage and record.get("stage") != stage:
+                continue
+            records.append(record)
+    return records
+
+
+class RunMetrics:
+    """
+    Recorder for the stages of one pipeline run.
+
+    Usage:
+        metrics = RunMetrics(store_path, platform="local")
+        with metrics.stage("convert") as counters:
+            ...
+            counters["rows_out"] = rows
+        with MemorySampler() as memory:
+            ...
+        metrics.add("convert", seconds, partition="yellow/2016-01", rows_out=rows, peak_memory=memory.peak_bytes)
+    """
+
+    def __init__(self, store_path=None, run_id=None, platform="local", labels=None):
+        self.store_path = store_path or os.environ.get(STORE_ENV_VARIABLE, DEFAULT_STORE_PATH)
+        self.run_id = run_id or new_run_id()
+        self.platform = platform
+        self.labels = labels or {}
+
+    def add(self, stage, wall_seconds, partition=None, started_at=None, status="ok", error=None,
+            peak_memory=None, **counters):
+        """
+        Append a record for a stage, or for one partition of it.
+
+        Args:
+            stage: Stage name, one of STAGES for the charts
+            wall_seconds: Elapsed wall time
+            partition: Partition the record covers, e.g. "yellow/2016-01"; None for the whole stage
+            started_at: ISO start time (default: now minus wall_seconds)
+            status: "ok" or "failed"
+            error: Error message of a failed stage
+            peak_memory: Peak resident bytes of the process that did the work: for a
+                partition, a MemorySampler's peak_bytes over its processing; for a
+                stage, peak_memory_bytes()
+            counters: rows_in, rows_out, bytes_in, bytes_out
+
+        Returns:
+            The record
+        """
+        if started_at is None:
+            started_at = datetime.fromtimestamp(time.time() - wall_seconds, timezone.utc).isoformat(timespec="seconds")
+        record = {
+            "run_id": self.run_id,
+            "platform": self.platform,
+            "stage": stage,
+            "partition": partition,
+            "started_at": started_at,
+            "wall_seconds": round(wall_seconds, 3),
+            "peak_memory_bytes": peak_memory,
+            "status": status,
+        }
+        record.update({name: counters.get(name) for name in COUNTER_FIELDS})
+        if error:
+            record["error"] = error
+        if self.labels:
+            record["labels"] = self.labels
+        append_record(self.store_path, record)
+        return record
+
+    @contextmanager
+    def stage(self, stage, partition=None):
+        """
+        Time a block as a stage; the yielded dict takes the block's counters.
+
+        A block that raises is recorded with status "failed" and the error re-raised.
+        """
+        counters = {}
+        started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        start_time = time.time()
+        try:
+            yield counters
+        except Exception as e:
+            self.add(stage, time.time() - start_time, partition, started_at, status="failed", error=str(e),
+                     peak_memory=peak_memory_bytes(), **counters)
+            raise
+        self.add(stage, time.time() - start_time, partition, started_at, peak_memory=peak_memory_bytes(), **counters)
+
+
+def add_metrics_arguments(parser):
+    """Add the --metrics-store/--run-id/--platform flags shared by the pipeline CLIs."""
+    parser.add_argument("--metrics-store",
+                        help=f"Append run metrics to this JSONL store (also enabled by ${STORE_ENV_VARIABLE})")
+    parser.add_argument("--run-id", help="Run id to record under, to group several steps into one run")
+    parser.add_argument("--platform", choices=PLATFORMS, default="local",
+                        help="Platform to record the run under (default: local)")
+
+
+def metrics_from_args(args):
+    """RunMetrics for parsed add_metrics_arguments flags, or None when recording is off."""
+    store_path = args.metrics_store or os.environ.get(STORE_ENV_VARIABLE)
+    if not store_path:
+        return None
+    return RunMetrics(store_path, run_id=args.run_id, platform=args.platform)
+
+
+def run_summaries(records):
+    """
+    Stage times of each run.
+
+    A stage's time is that of its whole-stage record; when it only has
+    partition records (e.g. an interrupted run), their sum.
+
+    Returns:
+        List of dicts with run_id, platform, started_at and stages (stage -> seconds), oldest first
+    """
+    runs = {}
+    partition_seconds = defaultdict(lambda: defaultdict(float))
+    for record in records:
+        if record.get("status") != "ok":
+            continue
+        run = runs.setdefault(record["run_id"], {
+            "run_id": record["run_id"],
+            "platform": record["platform"],
+            "started_at": record["started_at"],
+            "stages": {},
+        })
+        run["started_at"] = min(run["started_at"], record["started_at"])
+        if record.get("partition") is None:
+            run["stages"][record["stage"]] = run["stages"].get(record["stage"], 0.0) + record["wall_seconds"]
+        else:
+            partition_seconds[record["run_id"]][record["stage"]] += record["wall_seconds"]
+    for run_id, stages in partition_seconds.items():
+        for stage, seconds in stages.items():
+            runs[run_id]["stages"].setdefault(stage, seconds)
+    return sorted(runs.values(), key=lambda run: run["started_at"])
+
+
+def latest_stage_minutes(records, platform):
+    """
+    Minutes per stage of the latest run of a platform; a stage missing from
+    that run is taken from the latest run that has it.
+
+    Returns:
+        Dict of stage to minutes (empty when the platform has no runs)
+    """
+    minutes = {}
+    for run in run_summaries(record for record in records if record.get("platform") == platform):
+        for stage, seconds in run["stages"].items():
+            minutes[stage] = seconds / 60
+    return minutes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and summarize pipeline run metrics")
+    parser.add_argument("--metrics-store", help=f"JSONL store (default: ${STORE_ENV_VARIABLE} or {DEFAULT_STORE_PATH})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record a stage measured elsewhere")
+    record_parser.add_argument("--platform", choices=PLATFORMS, required=True)
+    record_parser.add_argument("--stage", required=True, help=f"Stage name ({', '.join(STAGES)})")
+    record_parser.add_argument("--wall-seconds", type=float, required=True)
+    record_parser.add_argument("--run-id", help="Run to add the stage to (default: a new run)")
+    record_parser.add_argument("--partition", help="Partition the record covers (default: the whole stage)")
+    record_parser.add_argument("--started-at", help="ISO start time (default: now minus the wall time)")
+    for name in COUNTER_FIELDS:
+        record_parser.add_argument(f"--{name.replace('_', '-')}", type=int)
+
+    summary_parser = subparsers.add_parser("summary", help="Print the stage times of each run")
+    summary_parser.add_argument("--platform", choices=PLATFORMS)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "record":
+            metrics = RunMetrics(args.metrics_store, run_id=args.run_id, platform=args.platform)
+            record = metrics.add(
+                args.stage, args.wall_seconds, args.partition, args.started_at,
+                **{name: getattr(args, name) for name in COUNTER_FIELDS},
+            )
+            print(f"Recorded {record['stage']} of run {record['run_id']} ({record['platform']}) in {metrics.store_path}")
+        else:
+            for run in run_summaries(load_records(args.metrics_store, platform=args.platform)):
+                stages = ", ".join(f"{stage} {seconds / 60:.2f} min" for stage, seconds in run["stages"].items())
+                print(f"{run['started_at']} {run['run_id']} ({run['platform']}): {stages}")
+    except Exception as e:
+        print(f"Error reading run metrics: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
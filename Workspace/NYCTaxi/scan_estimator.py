@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Offline scan-cost estimator for the transform and report queries.
+
+A BigQuery transform run costs $7.84 against $2.70 on Databricks SQL, and
+what a query scans is only known once it has run and been billed. This tool
+estimates it beforehand from the local table layout, without connecting to
+a warehouse:
+
+- the tables a query reads are matched to local hive-partitioned Parquet
+  tables (``--data-root`` for the converted tables, ``--table`` for the
+  transform tables and the mat view)
+- comparisons of a partition column with a literal (``trip_year = 2016``,
+  ``CAST(t.trip_year AS INT) < 2015``, ``trip_month IN ('01', '02')``,
+  ``trip_year BETWEEN ...``) select the partitions read; each UNION branch is
+  filtered on its own, and a WHERE clause containing OR prunes nothing
+- the columns read are the table's columns named anywhere in the query, or
+  all of them after a ``SELECT *``
+- comparisons of other columns with literals prune row groups by the min/max
+  statistics in the Parquet footers, as Databricks and Spark do
+
+Only WHERE clauses are read for predicates; comparisons in join conditions
+and CASE expressions filter nothing.
+
+For each table it reports the partitions and files read and three byte
+counts of the projected columns, all from footers: compressed bytes in the
+selected partitions, compressed bytes after row-group pruning (closest to
+what Databricks reads), and uncompressed bytes in the selected partitions
+(closest to the logical bytes BigQuery bills). ``--scale`` extrapolates from
+a sampled local dataset to the full one. The estimate is a heuristic over
+the SQL text: predicates it cannot read (joins, subqueries, functions of
+the column) are ignored, so it errs towards reading more.
+
+Queries that read every partition of a partitioned table, or read a table
+partitioned by ``trip_year`` without a ``trip_year`` predicate, get a
+warning; ``--fail-on-warning`` turns warnings into exit status 1.
+
+Usage:
+    python -m NYCTaxi.scan_estimator [sql_file]... [--report NAME|all]... --data-root /tmp/nyctaxi-silver
+        [--table taxi_trips_mat_view=/tmp/nyctaxi-gold]... [--scale 1000] [--price-per-tib 6.25]
+        [--json] [--fail-on-warning]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+import pyarrow.parquet as pq
+
+from .compact import row_group_may_match
+from .query_cache import normalize_sql, referenced_tables
+from .report_queries import REPORT_QUERIES
+from .sql_bench import DATA_ROOT_TABLES, NamedQuery, parse_queries
+
+# BigQuery on-demand price per TiB scanned
+DEFAULT_PRICE_PER_TIB = 6.25
+TIB = 1024 ** 4
+
+YEAR_PARTITION_COLUMN = "trip_year"
+
+# Literal compared with a column: a quoted string or a number/date-like word
+_LITERAL = r"""(?:'[^']*'|"[^"]*"|-?\d[\w.:-]*)"""
+_COLUMN = r"""(?:cast\(\s*)?(?:[\w`]+\.)?`?(?P<column>\w+)`?(?:\s+as\s+\w+\s*\))?"""
+_COMPARISON = re.compile(rf"{_COLUMN}\s*(?P<op><=|>=|!=|<>|=|<|>)\s*(?P<value>{_LITERAL})")
+_IN_LIST = re.compile(rf"{_COLUMN}\s*\bin\s*\((?P<values>\s*{_LITERAL}(?:\s*,\s*{_LITERAL})*\s*)\)")
+_BETWEEN = re.compile(rf"{_COLUMN}\s*\bbetween\s+(?P<low>{_LITERAL})\s+and\s+(?P<high>{_LITERAL})")
+_UNION = re.compile(r"\bunion(?:\s+all|\s+distinct)?\b")
+_OR = re.compile(r"\bor\b")
+_WHERE = re.compile(r"\bwhere\b")
+_CLAUSE_END = re.compile(r"\b(?:group by|order by|having|qualify|window|limit)\b")
+_SELECT_STAR = re.compile(r"(?:\bselect|,)\s*(?:distinct\s+)?(?:[\w`]+\.)?\*")
+_WORD = re.compile(r"[a-z_][a-z0-9_]*")
+_QUOTED = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*\"""")
+
+FileFooter = namedtuple("FileFooter", ["path", "partition", "metadata"])
+
+
+class LocalTable:
+    """Footers and partition values of a local hive-partitioned Parquet table."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.files = []
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith((".", "_")))
+            for file_name in sorted(files):
+                if not file_name.endswith(".parquet") or file_name.startswith((".", "_")):
+                    continue
+                file_path = os.path.join(root, file_name)
+                partition = tuple(
+                    tuple(part.split("=", 1))
+                    for part in os.path.relpath(root, path).split(os.sep)
+                    if "=" in part
+                )
+                self.files.append(FileFooter(file_path, partition, pq.ParquetFile(file_path).metadata))
+        self.partition_columns = sorted({key for footer in self.files for key, _ in footer.partition})
+        self.columns = self.files[0].metadata.schema.to_arrow_schema().names if self.files else []
+
+    @property
+    def partitions(self):
+        return sorted({footer.partition for footer in self.files})
+
+
+def _literal(text):
+    return text[1:-1] if text[:1] in ("'", '"') else text
+
+
+def _compare(op, left, right):
+    # Hive partition values are strings ("01"); compare numerically when both sides are numbers
+    try:
+        left, right = float(left), float(right)
+    except ValueError:
+        pass
+    if op == "=":
+        return left == right
+    if op in ("!=", "<>"):
+        return left != right
+    if op == "<":
+        return left < right
+    if op == "<=":
+        return left <= right
+    if op == ">":
+        return left > right
+    return left >= right
+
+
+def extract_predicates(sql, columns):
+    """
+    Comparisons of the given columns with literals in a piece of normalized SQL.
+
+    Returns:
+        List of (column, op, value) with op one of = != < <= > >= and "in"
+        (value a list); BETWEEN is returned as a >= and a <= predicate
+    """
+    columns = set(columns)
+    predicates = []
+    for match in _COMPARISON.finditer(sql):
+        if match.group("column") in columns:
+            op = "!=" if match.group("op") == "<>" else match.group("op")
+            predicates.append((match.group("column"), op, _literal(match.group("value"))))
+    for match in _IN_LIST.finditer(sql):
+        if match.group("column") in columns:
+            values = [_literal(value.strip()) for value in re.findall(_LITERAL, match.group("values"))]
+            predicates.append((match.group("column"), "in", values))
+    for match in _BETWEEN.finditer(sql):
+        if match.group("column") in columns:
+            predicates.append((match.group("column"), ">=", _literal(match.group("low"))))
+            predicates.append((match.group("column"), "<=", _literal(match.group("high"))))
+    return predicates
+
+
+def where_clauses(sql):
+    """
+    The WHERE clauses of a piece of normalized SQL, each up to the next
+    clause keyword or the parenthesis closing its subquery.
+    """
+    clauses = []
+    for match in _WHERE.finditer(sql):
+        depth, end = 0, len(sql)
+        for index in range(match.end(), len(sql)):
+            if sql[index] == "(":
+                depth += 1
+            elif sql[index] == ")":
+                depth -= 1
+                if depth < 0:
+                    end = index
+                    break
+        clause = sql[match.end():end]
+        keyword = _CLAUSE_END.search(clause)
+        clauses.append(clause[:keyword.start()] if keyword else clause)
+    return clauses
+
+
+def partition_matches(partition, predicates):
+    """Whether a partition (tuple of (column, value)) satisfies all partition predicates."""
+    values = dict(partition)
+    for column, op, value in predicates:
+        if column not in values:
+            continue
+        if op == "in":
+            if not any(_compare("=", values[column], item) for item in value):
+                return False
+        elif not _compare(op, values[column], value):
+            return False
+    return True
+
+
+def _row_group_matches(row_group, column_indexes, predicates):
+    for column, op, value in predicates:
+        if op == "in":
+            continue
+        try:
+            if not row_group_may_match(row_group, column_indexes.get(column), (column, op, value)):
+                return False
+        except (ValueError, TypeError):
+            # A literal that does not convert to the column's type prunes nothing
+            continue
+    return True
+
+
+def projected_columns(sql, table):
+    """Columns of a table a query reads: all of them after SELECT *, else those named in it."""
+    if _SELECT_STAR.search(sql):
+        return list(table.columns)
+    words = set(_WORD.findall(_QUOTED.sub(" ", sql)))
+    return [name for name in table.columns if name.lower() in words]
+
+
+def _table_name(reference):
+    return reference.replace("`", "").split(".")[-1]
+
+
+def estimate_query(sql, tables):
+    """
+    Estimate what a query reads from local tables.
+
+    Args:
+        sql: Query text
+        tables: Dict of table name -> LocalTable
+
+    Returns:
+        Dict with per-table estimates ("tables"), the referenced tables with
+        no local layout ("unresolved") and "warnings"
+    """
+    normalized = normalize_sql(sql)
+    branches = _UNION.split(normalized)
+    referenced = {_table_name(name) for name in referenced_tables(sql)}
+    result = {"tables": {}, "unresolved": [], "warnings": []}
+
+    for name in sorted(referenced):
+        table = tables.get(name)
+        if table is None:
+            result["unresolved"].append(name)
+            continue
+        columns = projected_columns(normalized, table)
+        column_indexes = {
+            column: index
+            for index, column in enumerate(table.files[0].metadata.schema.names)
+        } if table.files else {}
+        filter_columns = set(table.columns) | set(table.partition_columns)
+
+        # Partitions and row-group predicates per UNION branch that reads the table
+        selections = []
+        year_filtered = False
+        for branch in branches:
+            if not any(_table_name(reference) == name for reference in referenced_tables(branch)):
+                continue
+            predicates = [
+                predicate
+                for clause in where_clauses(branch) if not _OR.search(clause)
+                for predicate in extract_predicates(clause, filter_columns)
+            ]
+            year_filtered |= any(column == YEAR_PARTITION_COLUMN for column, _, _ in predicates)
+            selections.append(predicates)
+        if not selections:
+            selections.append([])
+
+        partitions = set()
+        stats = {"files": 0, "row_groups": 0, "row_groups_read": 0, "rows_read": 0,
+                 "compressed_bytes": 0, "pruned_bytes": 0, "uncompressed_bytes": 0, "table_bytes": 0}
+        for footer in table.files:
+            metadata = footer.metadata
+            stats["table_bytes"] += sum(
+                metadata.row_group(i).column(j).total_compressed_size
+                for i in range(metadata.num_row_groups) for j in range(metadata.num_columns)
+            )
+            matching = [
+                predicates for predicates in selections
+                if partition_matches(footer.partition, predicates)
+            ]
+            if not matching:
+                continue
+            partitions.add(footer.partition)
+            stats["files"] += 1
+            for i in range(metadata.num_row_groups):
+                row_group = metadata.row_group(i)
+                chunks = [row_group.column(column_indexes[column]) for column in columns if column in column_indexes]
+                compressed = sum(chunk.total_compressed_size for chunk in chunks)
+                stats["row_groups"] += 1
+                stats["compressed_bytes"] += compressed
+                stats["uncompressed_bytes"] += sum(chunk.total_uncompressed_size for chunk in chunks)
+                if any(_row_group_matches(row_group, column_indexes, predicates) for predicates in matching):
+                    stats["row_groups_read"] += 1
+                    stats["rows_read"] += row_group.num_rows
+                    stats["pruned_bytes"] += compressed
+
+        stats.update({
+            "partitions": len(partitions),
+            "total_partitions": len(table.partitions),
+            "columns": columns,
+        })
+        result["tables"][name] = stats
+
+        if table.partition_columns and len(table.partitions) > 1 and len(partitions) == len(table.partitions):
+            result["warnings"].append(f"{name}: full scan, no predicate prunes any of {len(partitions)} partitions")
+        if YEAR_PARTITION_COLUMN in table.partition_columns and not year_filtered:
+            result["warnings"].append(f"{name}: no {YEAR_PARTITION_COLUMN} predicate")
+    return result
+
+
+def load_tables(data_root=None, extra_tables=()):
+    """LocalTable per table name, from a --data-root and name=path pairs."""
+    paths = {}
+    if data_root:
+        for name, dir_name in DATA_ROOT_TABLES.items():
+            path = os.path.join(data_root, dir_name)
+            if os.path.isdir(path):
+                paths[name] = path
+    paths.update(dict(extra_tables))
+    return {name: LocalTable(name, path) for name, path in paths.items()}
+
+
+def _report_queries(names):
+    if "all" in names:
+        names = list(REPORT_QUERIES)
+    queries = []
+    for name in names:
+        if name not in REPORT_QUERIES:
+            raise ValueError(f"Unknown report query {name!r}; choose from {', '.join(REPORT_QUERIES)}")
+        title, sql = REPORT_QUERIES[name]
+        queries.append(NamedQuery("report_queries.py", name, title, sql))
+    return queries
+
+
+def _format_bytes(value):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if value < 1024 or unit == "TiB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value:.0f} B"
+        value /= 1024
+
+
+def _parse_table(value):
+    name, path = value.split("=", 1)
+    return name, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the bytes and partitions queries scan, from local Parquet footers")
+    parser.add_argument("sql", nargs="*", help="SQL files, e.g. NYCTaxi/sql/transform/gcp/bigquery/*.sql")
+    parser.add_argument("--report", action="append", default=[],
+                        help="Report query name from report_queries.py, or 'all' (repeatable)")
+    parser.add_argument("--data-root", help="Dir with the converted yellow-taxi/ and green-taxi/ tables")
+    parser.add_argument("--table", type=_parse_table, action="append", default=[],
+                        help="Local table as name=dir, e.g. taxi_trips_mat_view=/tmp/nyctaxi-gold (repeatable)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply bytes by this factor, e.g. 1000 for data generated with --scale-factor 0.001")
+    parser.add_argument("--price-per-tib", type=float, default=DEFAULT_PRICE_PER_TIB,
+                        help=f"Price per TiB of uncompressed bytes scanned (default: {DEFAULT_PRICE_PER_TIB}, BigQuery on-demand)")
+    parser.add_argument("--json", action="store_true", help="Print the estimates as JSON")
+    parser.add_argument("--fail-on-warning", action="store_true", help="Exit with status 1 if any query gets a warning")
+    args = parser.parse_args()
+
+    try:
+        queries = [query for path in args.sql for query in parse_queries(path)] + _report_queries(args.report)
+        if not queries:
+            raise ValueError("No queries given; pass SQL files and/or --report")
+        tables = load_tables(args.data_root, args.table)
+
+        estimates = []
+        for query in queries:
+            estimate = estimate_query(query.sql, tables)
+            for stats in estimate["tables"].values():
+                for key in ("compressed_bytes", "pruned_bytes", "uncompressed_bytes", "table_bytes"):
+                    stats[key] = int(stats[key] * args.scale)
+            uncompressed = sum(stats["uncompressed_bytes"] for stats in estimate["tables"].values())
+            estimate.update({
+                "file": query.file,
+                "name": query.name,
+                "estimated_cost": round(uncompressed / TIB * args.price_per_tib, 4),
+            })
+            estimates.append(estimate)
+    except Exception as e:
+        print(f"Error estimating scans: {e}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(estimates, indent=2, sort_keys=True))
+    else:
+        for estimate in estimates:
+            print(f"{estimate['file']} {estimate['name']}: estimated ${estimate['estimated_cost']:.4f}")
+            for name, stats in estimate["tables"].items():
+                print(f"  {name}: {stats['partitions']}/{stats['total_partitions']} partitions, "
+                      f"{stats['files']} files, {stats['row_groups_read']}/{stats['row_groups']} row groups, "
+                      f"{len(stats['columns'])} columns; "
+                      f"{_format_bytes(stats['compressed_bytes'])} compressed "
+                      f"({_format_bytes(stats['pruned_bytes'])} after row-group pruning, "
+                      f"{_format_bytes(stats['uncompressed_bytes'])} uncompressed) "
+                      f"of {_format_bytes(stats['table_bytes'])}")
+            if estimate["unresolved"]:
+                print(f"  no local layout: {', '.join(estimate['unresolved'])}")
+            for warning in estimate["warnings"]:
+                print(f"  WARNING {warning}")
+
+    if args.fail_on_warning and any(estimate["warnings"] for estimate in estimates):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
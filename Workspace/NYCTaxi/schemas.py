@@ -0,0 +1,293 @@
+"""
+Trip schemas for the NYC taxi source CSVs.
+
+Plain-Python mirror of the StructType definitions, ``getTaxiSchema`` and the
+canonical column lists in the load-data notebooks
+(GCPLoadDataYellowTaxi.ipynb / GCPLoadDataGreenTaxi.ipynb), so local tools can
+use the same schema eras without a Spark session.
+
+Field types use the Spark names the notebooks cast to: "string", "integer",
+"double" and "timestamp".
+"""
+
+import os
+
+TAXI_TYPES = ("yellow", "green")
+
+# Canonical ordered column list for yellow taxi across years
+YELLOW_CANONICAL_COLUMNS = [
+    "taxi_type", "vendor_id", "pickup_datetime", "dropoff_datetime",
+    "store_and_fwd_flag", "rate_code_id", "pickup_location_id",
+    "dropoff_location_id", "pickup_longitude", "pickup_latitude",
+    "dropoff_longitude", "dropoff_latitude", "passenger_count",
+    "trip_distance", "fare_amount", "extra", "mta_tax", "tip_amount",
+    "tolls_amount", "improvement_surcharge", "total_amount", "payment_type",
+    "trip_year", "trip_month",
+]
+
+# Canonical ordered column list for green taxi across years
+GREEN_CANONICAL_COLUMNS = [
+    "taxi_type", "vendor_id", "pickup_datetime", "dropoff_datetime",
+    "store_and_fwd_flag", "rate_code_id", "pickup_location_id",
+    "dropoff_location_id", "pickup_longitude", "pickup_latitude",
+    "dropoff_longitude", "dropoff_latitude", "passenger_count",
+    "trip_distance", "fare_amount", "extra", "mta_tax", "tip_amount",
+    "tolls_amount", "ehail_fee", "improvement_surcharge", "total_amount",
+    "payment_type", "trip_type", "trip_year", "trip_month",
+]
+
+CANONICAL_COLUMNS = {
+    "yellow": YELLOW_CANONICAL_COLUMNS,
+    "green": GREEN_CANONICAL_COLUMNS,
+}
+
+# Yellow taxi schemas by era
+
+# 2017
+YELLOW_TRIP_SCHEMA_2017H1 = [
+    ("vendor_id", "string"),
+    ("pickup_datetime", "timestamp"),
+    ("dropoff_datetime", "timestamp"),
+    ("passenger_count", "integer"),
+    ("trip_distance", "double"),
+    ("rate_code_id", "integer"),
+    ("store_and_fwd_flag", "string"),
+    ("pickup_location_id", "integer"),
+    ("dropoff_location_id", "integer"),
+    ("payment_type", "string"),
+    ("fare_amount", "double"),
+    ("extra", "double"),
+    ("mta_tax", "double"),
+    ("tip_amount", "double"),
+    ("tolls_amount", "double"),
+    ("improvement_surcharge", "double"),
+    ("total_amount", "double"),
+]
+
+# Second half of 2016
+YELLOW_TRIP_SCHEMA_2016H2 = YELLOW_TRIP_SCHEMA_2017H1 + [
+    ("junk1", "string"),
+    ("junk2", "string"),
+]
+
+# 2015 and 2016 first half of the year
+YELLOW_TRIP_SCHEMA_2015_2016H1 = [
+    ("vendor_id", "string"),
+    ("pickup_datetime", "timestamp"),
+    ("dropoff_datetime", "timestamp"),
+    ("passenger_count", "integer"),
+    ("trip_distance", "double"),
+    ("pickup_longitude", "double"),
+    ("pickup_latitude", "double"),
+    ("rate_code_id", "integer"),
+    ("store_and_fwd_flag", "string"),
+    ("dropoff_longitude", "double"),
+    ("dropoff_latitude", "double"),
+    ("payment_type", "string"),
+    ("fare_amount", "double"),
+    ("extra", "double"),
+    ("mta_tax", "double"),
+    ("tip_amount", "double"),
+    ("tolls_amount", "double"),
+    ("improvement_surcharge", "double"),
+    ("total_amount", "double"),
+]
+
+# 2009 though 2014
+YELLOW_TRIP_SCHEMA_PRE2015 = [
+    field for field in YELLOW_TRIP_SCHEMA_2015_2016H1
+    if field[0] != "improvement_surcharge"
+]
+
+# Green taxi schemas by era
+
+# 2017
+GREEN_TRIP_SCHEMA_2017H1 = [
+    ("vendor_id", "integer"),
+    ("pickup_datetime", "timestamp"),
+    ("dropoff_datetime", "timestamp"),
+    ("store_and_fwd_flag", "string"),
+    ("rate_code_id", "integer"),
+    ("pickup_location_id", "integer"),
+    ("dropoff_location_id", "integer"),
+    ("passenger_count", "integer"),
+    ("trip_distance", "double"),
+    ("fare_amount", "double"),
+    ("extra", "double"),
+    ("mta_tax", "double"),
+    ("tip_amount", "double"),
+    ("tolls_amount", "double"),
+    ("ehail_fee", "double"),
+    ("improvement_surcharge", "double"),
+    ("total_amount", "double"),
+    ("payment_type", "integer"),
+    ("trip_type", "integer"),
+]
+
+# Second half of 2016
+GREEN_TRIP_SCHEMA_2016H2 = GREEN_TRIP_SCHEMA_2017H1 + [
+    ("junk1", "string"),
+    ("junk2", "string"),
+]
+
+# 2015 second half of the year and 2016 first half of the year
+GREEN_TRIP_SCHEMA_2015H2_2016H1 = [
+    ("vendor_id", "integer"),
+    ("pickup_datetime", "timestamp"),
+    ("dropoff_datetime", "timestamp"),
+    ("store_and_fwd_flag", "string"),
+    ("rate_code_id", "integer"),
+    ("pickup_longitude", "double"),
+    ("pickup_latitude", "double"),
+    ("dropoff_longitude", "double"),
+    ("dropoff_latitude", "double"),
+    ("passenger_count", "integer"),
+    ("trip_distance", "double"),
+    ("fare_amount", "double"),
+    ("extra", "double"),
+    ("mta_tax", "double"),
+    ("tip_amount", "double"),
+    ("tolls_amount", "double"),
+    ("ehail_fee", "double"),
+    ("improvement_surcharge", "double"),
+    ("total_amount", "double"),
+    ("payment_type", "integer"),
+    ("trip_type", "integer"),
+]
+
+# 2015 first half of the year
+GREEN_TRIP_SCHEMA_2015H1 = GREEN_TRIP_SCHEMA_2015H2_2016H1 + [
+    ("junk1", "string"),
+    ("junk2", "string"),
+]
+
+# August 2013 through 2014
+GREEN_TRIP_SCHEMA_PRE2015 = [
+    field for field in GREEN_TRIP_SCHEMA_2015H1
+    if field[0] != "improvement_surcharge"
+]
+
+TRIP_SCHEMAS = {
+    "yellow": {
+        "pre2015": YELLOW_TRIP_SCHEMA_PRE2015,
+        "2015_2016H1": YELLOW_TRIP_SCHEMA_2015_2016H1,
+        "2016H2": YELLOW_TRIP_SCHEMA_2016H2,
+        "2017H1": YELLOW_TRIP_SCHEMA_2017H1,
+    },
+    "green": {
+        "pre2015": GREEN_TRIP_SCHEMA_PRE2015,
+        "2015H1": GREEN_TRIP_SCHEMA_2015H1,
+        "2015H2_2016H1": GREEN_TRIP_SCHEMA_2015H2_2016H1,
+        "2016H2": GREEN_TRIP_SCHEMA_2016H2,
+        "2017H1": GREEN_TRIP_SCHEMA_2017H1,
+    },
+}
+
+# First and last (year, month) of trip data loaded by the notebooks
+TRIP_MONTH_RANGE = {
+    "yellow": ((2009, 1), (2017, 6)),
+    "green": ((2013, 8), (2017, 6)),
+}
+
+
+def get_schema_era(taxi_type, trip_year, trip_month):
+    """
+    Determine the schema era for a given taxi type, year and month.
+
+    Follows the branches of ``getTaxiSchema`` in the load-data notebooks.
+
+    Args:
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+
+    Returns:
+        The era key into TRIP_SCHEMAS[taxi_type], or None if there is no data
+    """
+    if taxi_type == "yellow":
+        if 2008 < trip_year < 2015:
+            return "pre2015"
+        elif trip_year == 2016 and trip_month > 6:
+            return "2016H2"
+        elif (trip_year == 2016 and trip_month < 7) or trip_year == 2015:
+            return "2015_2016H1"
+        elif trip_year == 2017 and trip_month < 7:
+            return "2017H1"
+    elif taxi_type == "green":
+        if (trip_year == 2013 and trip_month > 7) or trip_year == 2014:
+            return "pre2015"
+        elif trip_year == 2015 and trip_month < 7:
+            return "2015H1"
+        elif (trip_year == 2015 and trip_month > 6) or (
+            trip_year == 2016 and trip_month < 7
+        ):
+            return "2015H2_2016H1"
+        elif trip_year == 2016 and trip_month > 6:
+            return "2016H2"
+        elif trip_year == 2017 and trip_month < 7:
+            return "2017H1"
+    else:
+        raise ValueError(f"Unknown taxi type: {taxi_type}")
+    return None
+
+
+def get_taxi_schema(taxi_type, trip_year, trip_month):
+    """
+    Get the source CSV schema for a given taxi type, year and month.
+
+    Args:
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+
+    Returns:
+        List of (column name, type name) tuples, or None if there is no data
+    """
+    era = get_schema_era(taxi_type, trip_year, trip_month)
+    if era is None:
+        return None
+    return TRIP_SCHEMAS[taxi_type][era]
+
+
+def iter_trip_months(taxi_type, start=None, end=None):
+    """
+    Iterate over the (year, month) pairs loaded for a taxi type.
+
+    Args:
+        taxi_type: "yellow" or "green"
+        start: Optional (year, month) to start from, clipped to the data range
+        end: Optional (year, month) to stop at (inclusive), clipped to the data range
+
+    Yields:
+        (year, month) tuples in chronological order
+    """
+    first, last = TRIP_MONTH_RANGE[taxi_type]
+    start = max(first, tuple(start)) if start else first
+    end = min(last, tuple(end)) if end else last
+
+    year, month = start
+    while (year, month) <= end:
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def source_csv_path(root, taxi_type, trip_year, trip_month):
+    """
+    Build the path of a monthly source CSV in the raw transactional layout.
+
+    Args:
+        root: Root dir for source data (srcDataDirRoot in the notebooks)
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+
+    Returns:
+        Path such as <root>/year=2016/month=07/type=yellow/yellow_tripdata_2016-07.csv
+    """
+    return os.path.join(
+        root,
+        f"year={trip_year}",
+        f"month={trip_month:02d}",
+        f"type={taxi_type}",
+        f"{taxi_type}_tripdata_{trip_year}-{trip_month:02d}.csv",
+    )
@@ -0,0 +1,244 @@
+-- Dedup on a precomputed row fingerprint instead of a wide SELECT DISTINCT.
+-- The raw fields determine every joined and derived column, so rows are duplicates
+-- within a (taxi_type, trip_year, trip_month) partition exactly when their raw fields
+-- match. Q2 needs yellow_taxi_trips_raw loaded with a row_fingerprint column
+-- (python -m NYCTaxi.convert ... --fingerprint-bits 64); Q3 computes one inline.
+
+SET use_cached_result = false;
+-- Q1 - Wide distinct after the joins (baseline, same as Q2 of 1-join-yellow-taxi.sql)
+select /*+ BROADCAST(v), BROADCAST(tm), BROADCAST(pt), BROADCAST(rc), BROADCAST(tzpu), BROADCAST(tzdo) */ distinct t.taxi_type,
+      t.vendor_id as vendor_id,
+      t.pickup_datetime,
+      t.dropoff_datetime,
+      t.store_and_fwd_flag,
+      t.rate_code_id,
+      t.pickup_location_id,
+      t.dropoff_location_id,
+      t.pickup_longitude,
+      t.pickup_latitude,
+      t.dropoff_longitude,
+      t.dropoff_latitude,
+      t.passenger_count,
+      t.trip_distance,
+      t.fare_amount,
+      t.extra,
+      t.mta_tax,
+      t.tip_amount,
+      t.tolls_amount,
+      t.improvement_surcharge,
+      t.total_amount,
+      t.payment_type,
+      t.trip_year,
+      t.trip_month,
+      v.abbreviation as vendor_abbreviation,
+      v.description as vendor_description,
+      tm.month_name_short,
+      tm.month_name_full,
+      pt.description as payment_type_description,
+      rc.description as rate_code_description,
+      tzpu.borough as pickup_borough,
+      tzpu.zone as pickup_zone,
+      tzpu.service_zone as pickup_service_zone,
+      tzdo.borough as dropoff_borough,
+      tzdo.zone as dropoff_zone,
+      tzdo.service_zone as dropoff_service_zone,
+      year(t.pickup_datetime) as pickup_year,
+      month(t.pickup_datetime) as pickup_month,
+      day(t.pickup_datetime) as pickup_day,
+      hour(t.pickup_datetime) as pickup_hour,
+      minute(t.pickup_datetime) as pickup_minute,
+      second(t.pickup_datetime) as pickup_second,
+      date(t.pickup_datetime) as pickup_date,
+      year(t.dropoff_datetime) as dropoff_year,
+      month(t.dropoff_datetime) as dropoff_month,
+      day(t.dropoff_datetime) as dropoff_day,
+      hour(t.dropoff_datetime) as dropoff_hour,
+      minute(t.dropoff_datetime) as dropoff_minute,
+      second(t.dropoff_datetime) as dropoff_second,
+      date(t.dropoff_datetime) as dropoff_date
+  from 
+    synapse_nyc_reference.nyctaxi.yellow_taxi_trips_raw t
+    left outer join synapse_nyc_reference.nyctaxi.vendor_lookup v 
+      on (case when t.trip_year < "2015" then t.vendor_id = v.abbreviation else t.vendor_id = v.vendor_id end)
+    left outer join synapse_nyc_reference.nyctaxi.trip_month_lookup tm 
+      on (t.trip_month = tm.trip_month)
+    left outer join synapse_nyc_reference.nyctaxi.payment_type_lookup pt 
+      on (case when t.trip_year < "2015" then t.payment_type = pt.abbreviation else t.payment_type = pt.payment_type end)
+    left outer join synapse_nyc_reference.nyctaxi.rate_code_lookup rc 
+      on (t.rate_code_id = rc.rate_code_id)
+    left outer join synapse_nyc_reference.nyctaxi.taxi_zone_lookup tzpu 
+      on (t.pickup_location_id = tzpu.location_id)
+    left outer join synapse_nyc_reference.nyctaxi.taxi_zone_lookup tzdo 
+      on (t.dropoff_location_id = tzdo.location_id);
+
+SET use_cached_result = false;
+-- Q2 - Dedup on the precomputed row_fingerprint before the joins
+with t_dedup as (
+  select *
+  from synapse_nyc_reference.nyctaxi.yellow_taxi_trips_raw
+  qualify row_number() over (partition by taxi_type, trip_year, trip_month, row_fingerprint order by row_fingerprint) = 1
+)
+select /*+ BROADCAST(v), BROADCAST(tm), BROADCAST(pt), BROADCAST(rc), BROADCAST(tzpu), BROADCAST(tzdo) */ t.taxi_type,
+      t.vendor_id as vendor_id,
+      t.pickup_datetime,
+      t.dropoff_datetime,
+      t.store_and_fwd_flag,
+      t.rate_code_id,
+      t.pickup_location_id,
+      t.dropoff_location_id,
+      t.pickup_longitude,
+      t.pickup_latitude,
+      t.dropoff_longitude,
+      t.dropoff_latitude,
+      t.passenger_count,
+      t.trip_distance,
+      t.fare_amount,
+      t.extra,
+      t.mta_tax,
+      t.tip_amount,
+      t.tolls_amount,
+      t.improvement_surcharge,
+      t.total_amount,
+      t.payment_type,
+      t.trip_year,
+      t.trip_month,
+      v.abbreviation as vendor_abbreviation,
+      v.description as vendor_description,
+      tm.month_name_short,
+      tm.month_name_full,
+      pt.description as payment_type_description,
+      rc.description as rate_code_description,
+      tzpu.borough as pickup_borough,
+      tzpu.zone as pickup_zone,
+      tzpu.service_zone as pickup_service_zone,
+      tzdo.borough as dropoff_borough,
+      tzdo.zone as dropoff_zone,
+      tzdo.service_zone as dropoff_service_zone,
+      year(t.pickup_datetime) as pickup_year,
+      month(t.pickup_datetime) as pickup_month,
+      day(t.pickup_datetime) as pickup_day,
+      hour(t.pickup_datetime) as pickup_hour,
+      minute(t.pickup_datetime) as pickup_minute,
+      second(t.pickup_datetime) as pickup_second,
+      date(t.pickup_datetime) as pickup_date,
+      year(t.dropoff_datetime) as dropoff_year,
+      month(t.dropoff_datetime) as dropoff_month,
+      day(t.dropoff_datetime) as dropoff_day,
+      hour(t.dropoff_datetime) as dropoff_hour,
+      minute(t.dropoff_datetime) as dropoff_minute,
+      second(t.dropoff_datetime) as dropoff_second,
+      date(t.dropoff_datetime) as dropoff_date
+  from 
+    t_dedup t
+    left outer join synapse_nyc_reference.nyctaxi.vendor_lookup v 
+      on (case when t.trip_year < "2015" then t.vendor_id = v.abbreviation else t.vendor_id = v.vendor_id end)
+    left outer join synapse_nyc_reference.nyctaxi.trip_month_lookup tm 
+      on (t.trip_month = tm.trip_month)
+    left outer join synapse_nyc_reference.nyctaxi.payment_type_lookup pt 
+      on (case when t.trip_year < "2015" then t.payment_type = pt.abbreviation else t.payment_type = pt.payment_type end)
+    left outer join synapse_nyc_reference.nyctaxi.rate_code_lookup rc 
+      on (t.rate_code_id = rc.rate_code_id)
+    left outer join synapse_nyc_reference.nyctaxi.taxi_zone_lookup tzpu 
+      on (t.pickup_location_id = tzpu.location_id)
+    left outer join synapse_nyc_reference.nyctaxi.taxi_zone_lookup tzdo 
+      on (t.dropoff_location_id = tzdo.location_id);
+
+SET use_cached_result = false;
+-- Q3 - Dedup on an inline xxhash64 fingerprint before the joins
+with t_fingerprint as (
+  select *,
+    xxhash64(
+      taxi_type,
+      vendor_id,
+      pickup_datetime,
+      dropoff_datetime,
+      store_and_fwd_flag,
+      rate_code_id,
+      pickup_location_id,
+      dropoff_location_id,
+      pickup_longitude,
+      pickup_latitude,
+      dropoff_longitude,
+      dropoff_latitude,
+      passenger_count,
+      trip_distance,
+      fare_amount,
+      extra,
+      mta_tax,
+      tip_amount,
+      tolls_amount,
+      improvement_surcharge,
+      total_amount,
+      payment_type
+    ) as row_fingerprint
+  from synapse_nyc_reference.nyctaxi.yellow_taxi_trips_raw
+),
+t_dedup as (
+  select *
+  from t_fingerprint
+  qualify row_number() over (partition by taxi_type, trip_year, trip_month, row_fingerprint order by row_fingerprint) = 1
+)
+select /*+ BROADCAST(v), BROADCAST(tm), BROADCAST(pt), BROADCAST(rc), BROADCAST(tzpu), BROADCAST(tzdo) */ t.taxi_type,
+      t.vendor_id as vendor_id,
+      t.pickup_datetime,
+      t.dropoff_datetime,
+      t.store_and_fwd_flag,
+      t.rate_code_id,
+      t.pickup_location_id,
+      t.dropoff_location_id,
+      t.pickup_longitude,
+      t.pickup_latitude,
+      t.dropoff_longitude,
+      t.dropoff_latitude,
+      t.passenger_count,
+      t.trip_distance,
+      t.fare_amount,
+      t.extra,
+      t.mta_tax,
+      t.tip_amount,
+      t.tolls_amount,
+      t.improvement_surcharge,
+      t.total_amount,
+      t.payment_type,
+      t.trip_year,
+      t.trip_month,
+      v.abbreviation as vendor_abbreviation,
+      v.description as vendor_description,
+      tm.month_name_short,
+      tm.month_name_full,
+      pt.description as payment_type_description,
+      rc.description as rate_code_description,
+      tzpu.borough as pickup_borough,
+      tzpu.zone as pickup_zone,
+      tzpu.service_zone as pickup_service_zone,
+      tzdo.borough as dropoff_borough,
+      tzdo.zone as dropoff_zone,
+      tzdo.service_zone as dropoff_service_zone,
+      year(t.pickup_datetime) as pickup_year,
+      month(t.pickup_datetime) as pickup_month,
+      day(t.pickup_datetime) as pickup_day,
+      hour(t.pickup_datetime) as pickup_hour,
+      minute(t.pickup_datetime) as pickup_minute,
+      second(t.pickup_datetime) as pickup_second,
+      date(t.pickup_datetime) as pickup_date,
+      year(t.dropoff_datetime) as dropoff_year,
+      month(t.dropoff_datetime) as dropoff_month,
+      day(t.dropoff_datetime) as dropoff_day,
+      hour(t.dropoff_datetime) as dropoff_hour,
+      minute(t.dropoff_datetime) as dropoff_minute,
+      second(t.dropoff_datetime) as dropoff_second,
+      date(t.dropoff_datetime) as dropoff_date
+  from 
+    t_dedup t
+    left outer join synapse_nyc_reference.nyctaxi.vendor_lookup v 
+      on (case when t.trip_year < "2015" then t.vendor_id = v.abbreviation else t.vendor_id = v.vendor_id end)
+    left outer join synapse_nyc_reference.nyctaxi.trip_month_lookup tm 
+      on (t.trip_month = tm.trip_month)
+    left outer join synapse_nyc_reference.nyctaxi.payment_type_lookup pt 
+      on (case when t.trip_year < "2015" then t.payment_type = pt.abbreviation else t.payment_type = pt.payment_type end)
+    left outer join synapse_nyc_reference.nyctaxi.rate_code_lookup rc 
+      on (t.rate_code_id = rc.rate_code_id)
+    left outer join synapse_nyc_reference.nyctaxi.taxi_zone_lookup tzpu 
+      on (t.pickup_location_id = tzpu.location_id)
+    left outer join synapse_nyc_reference.nyctaxi.taxi_zone_lookup tzdo 
+      on (t.dropoff_location_id = tzdo.location_id);
@@ -0,0 +1,206 @@
+-- Incremental refresh of taxi_trips_mat_view, partition by partition.
+-- Run 3-bq-transform-create-materialize-view.sql once to create the table; afterwards
+-- this script rebuilds only the (taxi_type, trip_year, trip_month) partitions whose
+-- source rows changed since the last refresh, instead of the whole table.
+-- Run as one multi-statement query (the temp tables live for the script only).
+--
+-- Changes are found from the row data, not from partition metadata:
+-- 1-/2-bq-transform-*.sql recreate the transform tables with CREATE OR REPLACE TABLE
+-- on every pipeline run, so the last_modified_time of every partition moves each time
+-- even when its rows do not. The signature of a partition is its row count plus the
+-- sum of FARM_FINGERPRINT over every row's JSON (summed as NUMERIC, so it cannot overflow).
+--
+-- Cost: computing the signatures reads every column of both transform tables, so
+-- each refresh is billed for one full scan of them (on-demand pricing bills the
+-- bytes of the columns read, with no pruning). The DISTINCT, DELETE and INSERT of
+-- the rebuild then cover only the partitions whose rows changed, so an unchanged
+-- pipeline run costs one scan instead of the full materialize.
+
+-- Signature of each source partition as of the last refresh
+CREATE TABLE IF NOT EXISTS `amplified-brook-454012-i1`.`nyc_taxi`.`taxi_trips_mat_view_refresh_state` (
+  taxi_type STRING,
+  trip_year INT64,
+  trip_month INT64,
+  source_rows INT64,
+  source_hash NUMERIC,
+  refreshed_at TIMESTAMP
+);
+
+-- Current signature of each source partition from its rows
+CREATE TEMP TABLE source_signature AS
+  SELECT
+    'yellow' AS taxi_type,
+    CAST(t.trip_year AS INT64) AS trip_year,
+    CAST(t.trip_month AS INT64) AS trip_month,
+    COUNT(1) AS source_rows,
+    SUM(CAST(FARM_FINGERPRINT(TO_JSON_STRING(t)) AS NUMERIC)) AS source_hash
+  FROM `amplified-brook-454012-i1`.`nyc_taxi`.`yellow_taxi_trips_transform` t
+  GROUP BY 2, 3
+  UNION ALL
+  SELECT
+    'green' AS taxi_type,
+    CAST(t.trip_year AS INT64) AS trip_year,
+    CAST(t.trip_month AS INT64) AS trip_month,
+    COUNT(1) AS source_rows,
+    SUM(CAST(FARM_FINGERPRINT(TO_JSON_STRING(t)) AS NUMERIC)) AS source_hash
+  FROM `amplified-brook-454012-i1`.`nyc_taxi`.`green_taxi_trips_transform` t
+  GROUP BY 2, 3;
+
+-- Partitions that are new, changed or no longer present in the source
+CREATE TEMP TABLE changed_partitions AS
+SELECT
+  COALESCE(s.taxi_type, r.taxi_type) AS taxi_type,
+  COALESCE(s.trip_year, r.trip_year) AS trip_year,
+  COALESCE(s.trip_month, r.trip_month) AS trip_month
+FROM source_signature s
+FULL OUTER JOIN `amplified-brook-454012-i1`.`nyc_taxi`.`taxi_trips_mat_view_refresh_state` r
+  ON s.taxi_type = r.taxi_type
+  AND s.trip_year = r.trip_year
+  AND s.trip_month = r.trip_month
+WHERE s.taxi_type IS NULL
+  OR r.taxi_type IS NULL
+  OR s.source_rows <> r.source_rows
+  OR s.source_hash <> r.source_hash;
+
+SELECT * FROM changed_partitions ORDER BY taxi_type, trip_year, trip_month;
+
+-- Drop the rows of every changed partition
+DELETE FROM `amplified-brook-454012-i1`.`nyc_taxi`.`taxi_trips_mat_view` mv
+WHERE EXISTS (
+  SELECT 1 FROM changed_partitions c
+  WHERE c.taxi_type = mv.taxi_type
+    AND c.trip_year = CAST(mv.trip_year AS INT64)
+    AND c.trip_month = CAST(mv.trip_month AS INT64)
+);
+
+-- Rebuild the changed partitions with the same SELECT DISTINCT as the full materialize
+INSERT INTO `amplified-brook-454012-i1`.`nyc_taxi`.`taxi_trips_mat_view`
+SELECT *, PARSE_DATETIME('%Y%m', FORMAT('%06d', CAST(trip_year as INT64) * 100 + CAST(trip_month as INT64))) as partition_id FROM (
+SELECT DISTINCT
+  taxi_type,
+  vendor_id,
+  pickup_datetime,
+  dropoff_datetime,
+  store_and_fwd_flag,
+  rate_code_id,
+  pickup_location_id,
+  dropoff_location_id,
+  pickup_longitude,
+  pickup_latitude,
+  dropoff_longitude,
+  dropoff_latitude,
+  passenger_count,
+  trip_distance,
+  fare_amount,
+  extra,
+  mta_tax,
+  tip_amount,
+  tolls_amount,
+  0.0 AS ehail_fee, -- Added inline
+  improvement_surcharge,
+  total_amount,
+  payment_type,
+  0 AS trip_type, -- Added inline
+  vendor_abbreviation,
+  vendor_description,
+  '' AS trip_type_description, -- Added inline
+  month_name_short,
+  month_name_full,
+  payment_type_description,
+  rate_code_description,
+  pickup_borough,
+  pickup_zone,
+  pickup_service_zone,
+  dropoff_borough,
+  dropoff_zone,
+  dropoff_service_zone,
+  pickup_year,
+  pickup_month,
+  pickup_day,
+  pickup_hour,
+  pickup_minute,
+  pickup_second,
+  dropoff_year,
+  dropoff_month,
+  dropoff_day,
+  dropoff_hour,
+  dropoff_minute,
+  dropoff_second,
+  trip_year,
+  trip_month
+FROM `amplified-brook-454012-i1`.`nyc_taxi`.`yellow_taxi_trips_transform`
+WHERE STRUCT(taxi_type, CAST(trip_year AS INT64), CAST(trip_month AS INT64)) IN (
+  SELECT AS STRUCT taxi_type, trip_year, trip_month FROM changed_partitions
+)
+UNION ALL
+SELECT DISTINCT
+  taxi_type,
+  vendor_id,
+  pickup_datetime,
+  dropoff_datetime,
+  store_and_fwd_flag,
+  rate_code_id,
+  pickup_location_id,
+  dropoff_location_id,
+  pickup_longitude,
+  pickup_latitude,
+  dropoff_longitude,
+  dropoff_latitude,
+  passenger_count,
+  trip_distance,
+  fare_amount,
+  extra,
+  mta_tax,
+  tip_amount,
+  tolls_amount,
+  ehail_fee,
+  improvement_surcharge,
+  total_amount,
+  payment_type,
+  trip_type,
+  vendor_abbreviation,
+  vendor_description,
+  trip_type_description,
+  month_name_short,
+  month_name_full,
+  payment_type_description,
+  rate_code_description,
+  pickup_borough,
+  pickup_zone,
+  pickup_service_zone,
+  dropoff_borough,
+  dropoff_zone,
+  dropoff_service_zone,
+  pickup_year,
+  pickup_month,
+  pickup_day,
+  pickup_hour,
+  pickup_minute,
+  pickup_second,
+  dropoff_year,
+  dropoff_month,
+  dropoff_day,
+  dropoff_hour,
+  dropoff_minute,
+  dropoff_second,
+  trip_year,
+  trip_month
+FROM `amplified-brook-454012-i1`.`nyc_taxi`.`green_taxi_trips_transform`
+WHERE STRUCT(taxi_type, CAST(trip_year AS INT64), CAST(trip_month AS INT64)) IN (
+  SELECT AS STRUCT taxi_type, trip_year, trip_month FROM changed_partitions
+)
+) tmp;
+
+-- Remember the signatures the mat view now reflects
+MERGE `amplified-brook-454012-i1`.`nyc_taxi`.`taxi_trips_mat_view_refresh_state` r
+USING source_signature s
+  ON s.taxi_type = r.taxi_type
+  AND s.trip_year = r.trip_year
+  AND s.trip_month = r.trip_month
+WHEN MATCHED AND (s.source_rows <> r.source_rows OR s.source_hash <> r.source_hash) THEN
+  UPDATE SET source_rows = s.source_rows, source_hash = s.source_hash, refreshed_at = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN
+  INSERT (taxi_type, trip_year, trip_month, source_rows, source_hash, refreshed_at)
+  VALUES (s.taxi_type, s.trip_year, s.trip_month, s.source_rows, s.source_hash, CURRENT_TIMESTAMP())
+WHEN NOT MATCHED BY SOURCE THEN
+  DELETE;
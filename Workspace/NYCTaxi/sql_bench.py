@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Local benchmark harness for the SQL in sql/benchmark and sql/transform.
+
+``sql/benchmark/1-join-yellow-taxi.sql`` holds variants of the same query
+(Q1 the original, Q2 with broadcast hints, Q3 with the joins rewritten, ...)
+that so far could only be compared by hand on a paid warehouse with
+``use_cached_result = false``. This harness runs them on local engines over
+a Parquet dataset:
+
+- each file is split into statements; SELECT/WITH statements are queries,
+  named by their ``-- Qn - title`` comment (or their position in the file),
+  and the SELECT of ``CREATE TABLE ... AS`` / ``INSERT`` statements is taken
+  as the query; SET, FSCK, CACHE and the like are skipped
+- table names (``synapse_nyc_reference.nyctaxi.<table>``, ``nyctaxi.<table>``)
+  are rewritten to views over local files: the converted and enriched
+  tables, a mat view dir or the reference CSVs
+- on DuckDB the Spark dialect is translated: backtick identifiers, double
+  quoted string literals, ``xxhash64`` and a ``unix_millis`` macro
+- every run computes the row count and an order-independent checksum of all
+  output columns inside the engine, so every column is produced but no rows
+  are fetched into Python
+- cold runs use a fresh connection (DuckDB) or a cleared cache (Spark) each
+  time; warm runs follow one discarded warm-up run on the same connection.
+  The OS page cache is not dropped, so cold means a cold engine, not cold disks
+- variants in a file are checked for equivalence against its first query,
+  by row count and checksum over the output columns they share
+
+Results are written as JSON (sorted keys, one run per file) to diff between
+commits; ``--compare`` prints the median change against an earlier file.
+
+Spark runs in local mode and needs pyspark; DuckDB is the default engine.
+
+Usage:
+    python -m NYCTaxi.sql_bench --data-root /tmp/nyctaxi-silver --reference-dir /tmp/nyctaxi-reference
+        [--sql NYCTaxi/sql/benchmark/1-join-yellow-taxi.sql]... [--query Q1]... [--engine duckdb|spark]
+        [--reps 5] [--mode cold|warm|both] [--table name=path]... [--output bench.json] [--compare old.json]
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from .reference import load_reference_data
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+DEFAULT_SQL_FILES = sorted(glob.glob(os.path.join(SQL_DIR, "benchmark", "*.sql")))
+RESULTS_VERSION = 1
+
+DEFAULT_REPS = 3
+MODES = ("cold", "warm")
+
+# Tables under --data-root, as written by convert.py, enrich.py and matview.py
+DATA_ROOT_TABLES = {
+    "yellow_taxi_trips_raw": "yellow-taxi",
+    "green_taxi_trips_raw": "green-taxi",
+}
+
+NamedQuery = namedtuple("NamedQuery", ["file", "name", "title", "sql"])
+
+_QUERY_NAME = re.compile(r"^\s*--\s*(?P<name>Q\d+)\s*-\s*(?P<title>.*?)\s*$", re.M)
+_QUERY_START = re.compile(r"\b(select|with)\b", re.I)
+_TABLE_NAME = re.compile(
+    r'(?:[`"]?synapse_nyc_reference[`"]?\s*\.\s*)?[`"]?nyctaxi[`"]?\s*\.\s*[`"]?(?P<table>\w+)[`"]?'
+)
+_DUCKDB_FUNCTION_RENAMES = {"xxhash64": "hash"}
+_DUCKDB_MACROS = [
+    "CREATE MACRO unix_millis(ts) AS epoch_ms(ts)",
+]
+
+
+def _scan(sql):
+    """
+    Split SQL text into (kind, text) tokens: "code", "single" (quoted string),
+    "double" (double quoted), "backtick", "comment" (line or block), "hint"
+    (``/*+ ... */``) and "end" (a statement-ending semicolon).
+    """
+    tokens = []
+    i, code_start, n = 0, 0, len(sql)
+
+    def flush(end):
+        if end > code_start:
+            tokens.append(("code", sql[code_start:end]))
+
+    while i < n:
+        char = sql[i]
+        if char in "'\"`":
+            flush(i)
+            j = i + 1
+            while j < n:
+                if sql[j] == "\\" and char != "`":
+                    j += 2
+                    continue
+                if sql[j] == char:
+                    if j + 1 < n and sql[j + 1] == char:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            kind = {"'": "single", '"': "double", "`": "backtick"}[char]
+            tokens.append((kind, sql[i:j + 1]))
+            i = code_start = j + 1
+        elif sql.startswith("--", i):
+            flush(i)
+            j = sql.find("\n", i)
+            j = n if j < 0 else j
+            tokens.append(("comment", sql[i:j]))
+            i = code_start = j
+        elif sql.startswith("/*", i):
+            flush(i)
+            j = sql.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            tokens.append(("hint" if sql.startswith("/*+", i) else "comment", sql[i:j]))
+            i = code_start = j
+        elif char == ";":
+            flush(i)
+            tokens.append(("end", ";"))
+            i = code_start = i + 1
+        else:
+            i += 1
+    flush(n)
+    return tokens
+
+
+def split_statements(sql):
+    """Statements of a SQL script (comments kept), split on semicolons outside strings and comments."""
+    statements, current = [], []
+    for kind, text in _scan(sql):
+        if kind == "end":
+            statements.append("".join(current))
+            current = []
+        else:
+            current.append(text)
+    if "".join(text for kind, text in _scan("".join(current)) if kind != "comment").strip():
+        statements.append("".join(current))
+    return statements
+
+
+def _without_comments(sql):
+    # Drop comments but keep hints, which Spark reads
+    return "".join(text for kind, text in _scan(sql) if kind != "comment")
+
+
+def parse_queries(path):
+    """
+    Named queries of a SQL file.
+
+    Returns:
+        List of NamedQuery; queries without a ``-- Qn - title`` comment are
+        named by their statement position, e.g. "statement_3"
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    queries = []
+    for index, statement in enumerate(split_statements(text), 1):
+        code = _without_comments(statement).strip()
+        if not code:
+            continue
+        keyword = code.split(None, 1)[0].lower()
+        if keyword in ("select", "with"):
+            sql = code
+        elif keyword in ("create", "insert"):
+            match = _QUERY_START.search(code)
+            if not match:
+                continue
+            sql = code[match.start():]
+        else:
+            continue
+        name_match = _QUERY_NAME.search(statement)
+        name = name_match.group("name") if name_match else f"statement_{index}"
+        title = name_match.group("title") if name_match else code.split("\n", 1)[0][:80]
+        queries.append(NamedQuery(os.path.relpath(path, SQL_DIR), name, title, sql))
+    return queries
+
+
+def to_duckdb_sql(sql):
+    """Translate the Spark SQL of the scripts to DuckDB and point table names at the local views."""
+    parts = []
+    for kind, text in _scan(sql):
+        if kind == "double":
+            # Spark reads "..." as a string literal
+            parts.append("'" + text[1:-1].replace("'", "''") + "'")
+        elif kind == "backtick":
+            parts.append('"' + text[1:-1] + '"')
+        elif kind == "code":
+            for name, replacement in _DUCKDB_FUNCTION_RENAMES.items():
+                text = re.sub(rf"\b{name}\s*\(", f"{replacement}(", text, flags=re.I)
+            parts.append(text)
+        else:
+            parts.append(text)
+    return _TABLE_NAME.sub(lambda match: match.group("table"), "".join(parts))
+
+
+def to_spark_sql(sql):
+    """Point the table names of a script's Spark SQL at the local temp views."""
+    return _TABLE_NAME.sub(lambda match: match.group("table"), sql)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _timing_summary(seconds):
+    return {
+        "seconds": [round(value, 4) for value in seconds],
+        "median": round(statistics.median(seconds), 4),
+        "p95": round(percentile(seconds, 0.95), 4),
+    }
+
+
+def _table_source(path):
+    # (kind, path) of a local table: a hive-partitioned Parquet dir, a Parquet file or a CSV file
+    if os.path.isdir(path):
+        return "parquet_dir", path
+    if path.endswith(".csv"):
+        return "csv", path
+    return "parquet", path
+
+
+class DuckDBEngine:
+    """Runs queries on DuckDB, over views of the local tables."""
+
+    name = "duckdb"
+
+    def __init__(self, tables, reference):
+        import duckdb
+
+        self._duckdb = duckdb
+        self.tables = tables
+        self.reference = reference
+        self.version = duckdb.__version__
+
+    def connect(self):
+        con = self._duckdb.connect()
+        for statement in _DUCKDB_MACROS:
+            con.execute(statement)
+        for name, path in self.tables.items():
+            kind, path = _table_source(path)
+            if kind == "parquet_dir":
+                source = f"read_parquet('{path}/**/*.parquet', hive_partitioning = true)"
+            elif kind == "csv":
+                source = f"read_csv_auto('{path}')"
+            else:
+                source = f"read_parquet('{path}')"
+            con.execute(f'CREATE VIEW "{name}" AS SELECT * FROM {source}')
+        for name, table in self.reference.items():
+            con.register(name, table)
+        return con
+
+    def translate(self, sql):
+        return to_duckdb_sql(sql)
+
+    def columns(self, con, sql):
+        return [row[0] for row in con.execute(f"DESCRIBE {sql}").fetchall()]
+
+    def checksum(self, con, sql, columns=None):
+        """(rows, order-independent checksum) of a query's output (all columns, or the given ones)."""
+        hashed = "hash(r)" if columns is None else "hash(" + ", ".join(f'r."{name}"' for name in columns) + ")"
+        rows, total = con.execute(f"SELECT count(*), sum({hashed}::HUGEINT) FROM ({sql}) r").fetchone()
+        return rows, str(total)
+
+    def clear(self, con):
+        con.close()
+
+
+class SparkEngine:
+    """Runs queries on Spark in local mode, over temp views of the local tables."""
+
+    name = "spark"
+
+    def __init__(self, tables, reference, master="local[*]"):
+        from pyspark.sql import SparkSession
+
+        self.spark = SparkSession.builder.master(master).appName("nyctaxi-sql-bench").getOrCreate()
+        self.tables = tables
+        self.reference = reference
+        self.version = self.spark.version
+
+    def connect(self):
+        self.spark.catalog.clearCache()
+        for name, path in self.tables.items():
+            kind, path = _table_source(path)
+            if kind == "csv":
+                frame = self.spark.read.option("header", True).csv(path)
+            elif kind == "parquet_dir":
+                frame = self.spark.read.option("basePath", path).parquet(path)
+            else:
+                frame = self.spark.read.parquet(path)
+            frame.createOrReplaceTempView(name)
+        for name, table in self.reference.items():
+            self.spark.createDataFrame(table.to_pandas()).createOrReplaceTempView(name)
+        return self.spark
+
+    def translate(self, sql):
+        return to_spark_sql(sql)
+
+    def columns(self, spark, sql):
+        return spark.sql(sql).columns
+
+    def checksum(self, spark, sql, columns=None):
+        hashed = "xxhash64(*)" if columns is None else "xxhash64(" + ", ".join(f"r.`{name}`" for name in columns) + ")"
+        row = spark.sql(f"SELECT count(1), sum(CAST({hashed} AS DECIMAL(38, 0))) FROM ({sql}) r").collect()[0]
+        return row[0], str(row[1])
+
+    def clear(self, spark):
+        spark.catalog.clearCache()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=SQL_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(engine, queries, reps=DEFAULT_REPS, modes=MODES):
+    """
+    Time queries cold and warm and check the variants of each file for equivalence.
+
+    Args:
+        engine: DuckDBEngine or SparkEngine
+        queries: List of NamedQuery
+        reps: Timed runs per query and mode
+        modes: "cold" and/or "warm"
+
+    Returns:
+        Dict with the engine, queries (timings, rows, checksum or error per
+        query) and equivalence (per variant, against the first query of its file)
+    """
+    results = []
+    for query in queries:
+        sql = engine.translate(query.sql)
+        result = {"file": query.file, "name": query.name, "title": query.title}
+        try:
+            if "cold" in modes:
+                seconds = []
+                for _ in range(reps):
+                    con = engine.connect()
+                    start_time = time.perf_counter()
+                    result["rows"], result["checksum"] = engine.checksum(con, sql)
+                    seconds.append(time.perf_counter() - start_time)
+                    engine.clear(con)
+                result["cold"] = _timing_summary(seconds)
+            if "warm" in modes:
+                con = engine.connect()
+                result["rows"], result["checksum"] = engine.checksum(con, sql)
+                seconds = []
+                for _ in range(reps):
+                    start_time = time.perf_counter()
+                    engine.checksum(con, sql)
+                    seconds.append(time.perf_counter() - start_time)
+                engine.clear(con)
+                result["warm"] = _timing_summary(seconds)
+        except Exception as e:
+            result["error"] = str(e).splitlines()[0]
+        results.append(result)
+
+    equivalence = []
+    by_file = {}
+    for query, result in zip(queries, results):
+        if "error" not in result:
+            by_file.setdefault(query.file, []).append(query)
+    for file, variants in by_file.items():
+        if len(variants) < 2:
+            continue
+        con = engine.connect()
+        sqls = [engine.translate(query.sql) for query in variants]
+        column_lists = [engine.columns(con, sql) for sql in sqls]
+        shared = [name for name in column_lists[0] if all(name in columns for columns in column_lists[1:])]
+        baseline = engine.checksum(con, sqls[0], shared)
+        for query, sql in zip(variants[1:], sqls[1:]):
+            checksum = engine.checksum(con, sql, shared)
+            equivalence.append({
+                "file": file,
+                "baseline": variants[0].name,
+                "query": query.name,
+                "columns": len(shared),
+                "equivalent": checksum == baseline,
+                "rows": [baseline[0], checksum[0]],
+            })
+        engine.clear(con)
+
+    return {
+        "version": RESULTS_VERSION,
+        "engine": engine.name,
+        "engine_version": engine.version,
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "reps": reps,
+        "tables": engine.tables,
+        "queries": results,
+        "equivalence": equivalence,
+    }
+
+
+def compare_results(old, new):
+    """
+    Median changes of the queries present in both result files.
+
+    Returns:
+        List of (file, name, mode, old median, new median)
+    """
+    old_queries = {(query["file"], query["name"]): query for query in old["queries"]}
+    changes = []
+    for query in new["queries"]:
+        previous = old_queries.get((query["file"], query["name"]))
+        if previous is None:
+            continue
+        for mode in MODES:
+            if mode in query and mode in previous:
+                changes.append((query["file"], query["name"], mode, previous[mode]["median"], query[mode]["median"]))
+    return changes
+
+
+def _parse_table(value):
+    name, path = value.split("=", 1)
+    return name, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the project SQL on local engines")
+    parser.add_argument("--sql", action="append",
+                        help="SQL file to benchmark (repeatable, default: every file in sql/benchmark)")
+    parser.add_argument("--query", action="append", help="Only these query names, e.g. Q1 (repeatable)")
+    parser.add_argument("--data-root", help="Dir with the converted yellow-taxi/ and green-taxi/ tables")
+    parser.add_argument("--reference-dir", help="Dir with the reference CSVs (see reference.py)")
+    parser.add_argument("--table", type=_parse_table, action="append", default=[],
+                        help="Extra table as name=path (Parquet dir or file, or CSV), e.g. "
+                             "taxi_trips_mat_view=/tmp/nyctaxi-gold (repeatable)")
+    parser.add_argument("--engine", choices=["duckdb", "spark"], default="duckdb")
+    parser.add_argument("--reps", type=int, default=DEFAULT_REPS, help=f"Timed runs per mode (default: {DEFAULT_REPS})")
+    parser.add_argument("--mode", choices=["cold", "warm", "both"], default="both")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare medians with")
+    args = parser.parse_args()
+
+    try:
+        tables = {}
+        if args.data_root:
+            for name, dir_name in DATA_ROOT_TABLES.items():
+                path = os.path.join(args.data_root, dir_name)
+                if os.path.isdir(path):
+                    tables[name] = path
+        tables.update(dict(args.table))
+        reference = {}
+        if args.reference_dir:
+            # Spark compares strings with numbers leniently (non-numeric strings give null);
+            # DuckDB raises instead, so the lookups are registered with string columns
+            reference = {
+                f"{name}_lookup": table.cast(pa.schema([(field.name, pa.string()) for field in table.schema]))
+                for name, table in load_reference_data(args.reference_dir).items()
+            }
+
+        queries = [query for path in (args.sql or DEFAULT_SQL_FILES) for query in parse_queries(path)]
+        if args.query:
+            queries = [query for query in queries if query.name in args.query]
+        if not queries:
+            raise ValueError("No queries to run")
+
+        engine = SparkEngine(tables, reference) if args.engine == "spark" else DuckDBEngine(tables, reference)
+        modes = MODES if args.mode == "both" else (args.mode,)
+        results = run_benchmark(engine, queries, reps=args.reps, modes=modes)
+
+        for result in results["queries"]:
+            label = f"{result['file']} {result['name']}"
+            if "error" in result:
+                print(f"{label}: error: {result['error']}")
+                continue
+            timings = ", ".join(
+                f"{mode} median {result[mode]['median']:.3f}s p95 {result[mode]['p95']:.3f}s"
+                for mode in MODES if mode in result
+            )
+            print(f"{label}: {result['rows']} rows; {timings}")
+        for check in results["equivalence"]:
+            verdict = "equivalent" if check["equivalent"] else "DIFFERENT"
+            print(f"{check['file']} {check['query']} vs {check['baseline']} on {check['columns']} shared columns: "
+                  f"{verdict} ({check['rows'][1]} vs {check['rows'][0]} rows)")
+
+        if args.compare:
+            with open(args.compare, "r") as f:
+                previous = json.load(f)
+            for file, name, mode, old_median, new_median in compare_results(previous, results):
+                print(f"{file} {name} {mode}: {old_median:.3f}s -> {new_median:.3f}s "
+                      f"({(new_median / old_median - 1) * 100 if old_median else 0:+.0f}%)")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            print(f"Wrote results to {args.output}")
+    except Exception as e:
+        print(f"Error running benchmark: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
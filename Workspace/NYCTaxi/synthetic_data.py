@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Generate deterministic synthetic NYC taxi trip CSVs.
+
+Writes monthly CSVs in the same layout the load-data notebooks read
+(``year=YYYY/month=MM/type=yellow|green/<type>_tripdata_YYYY-MM.csv``), using
+the schema era of each month from ``schemas.get_taxi_schema``. Pre-2015 yellow
+months carry longitude/latitude and vendor/payment abbreviations; later months
+carry numeric codes and, from 2016H2, location ids.
+
+Every month is generated in fixed-size chunks, each with its own random stream
+derived from (seed, taxi type, year, month, chunk), so the output bytes depend
+only on the seed and row count - not on the number of workers or the machine.
+
+Usage:
+    python -m NYCTaxi.synthetic_data <output_dir> [--scale-factor 0.001] [--seed 42]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from .schemas import TAXI_TYPES, get_schema_era, get_taxi_schema, iter_trip_months, source_csv_path
+
+# Approximate rows per month in the real dataset, used as scale factor 1.0
+# (1.37B yellow trips over 102 months, ~76M green trips over 47 months).
+BASE_ROWS_PER_MONTH = {
+    "yellow": 13_500_000,
+    "green": 1_600_000,
+}
+
+# Rows generated per random stream. Changing this changes the output bytes.
+CHUNK_ROWS = 250_000
+
+TAXI_TYPE_IDS = {"yellow": 1, "green": 2}
+
+# Code systems used by the raw data (see vendor_lookup / payment_type_lookup)
+PRE2015_VENDOR_CODES = np.array(["CMT", "VTS", "DDS"])
+PRE2015_VENDOR_WEIGHTS = [0.48, 0.47, 0.05]
+PRE2015_PAYMENT_CODES = np.array(["CRD", "CSH", "NOC", "DIS", "UNK"])
+PAYMENT_WEIGHTS = [0.62, 0.36, 0.008, 0.002, 0.01]
+RATE_CODE_WEIGHTS = [0.972, 0.02, 0.003, 0.002, 0.002, 0.001]
+PASSENGER_WEIGHTS = [0.70, 0.14, 0.04, 0.02, 0.06, 0.04]
+NUM_TAXI_ZONES = 265
+
+# Centre and spread of pickup/dropoff coordinates, and share of rows with no GPS fix
+NYC_CENTER = (-73.975, 40.752)
+NYC_SPREAD = (0.035, 0.03)
+MISSING_GPS_RATE = 0.015
+
+
+def rows_per_month(taxi_type, scale_factor):
+    """
+    Number of rows to generate per month for a scale factor.
+
+    Scale factor 1.0 approximates the real volume (~180 GB of yellow CSV);
+    0.0001 produces a few MB for the whole 2009-2017 range.
+    """
+    return max(1, int(round(BASE_ROWS_PER_MONTH[taxi_type] * scale_factor)))
+
+
+def _chunk_rng(seed, taxi_type, trip_year, trip_month, chunk_index):
+    seed_seq = np.random.SeedSequence(
+        [seed, TAXI_TYPE_IDS[taxi_type], trip_year, trip_month, chunk_index]
+    )
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def _zone_weights():
+    # Skewed zone popularity: a few Manhattan zones take most of the trips
+    ranks = np.arange(1, NUM_TAXI_ZONES + 1, dtype=np.float64)
+    weights = 1.0 / ranks ** 0.9
+    order = np.random.Generator(np.random.PCG64(2016)).permutation(NUM_TAXI_ZONES)
+    return weights[order] / weights.sum()
+
+
+ZONE_WEIGHTS = _zone_weights()
+
+
+def _coordinates(rng, rows):
+    lon = np.round(rng.normal(NYC_CENTER[0], NYC_SPREAD[0], rows), 6)
+    lat = np.round(rng.normal(NYC_CENTER[1], NYC_SPREAD[1], rows), 6)
+    missing = rng.random(rows) < MISSING_GPS_RATE
+    lon[missing] = 0.0
+    lat[missing] = 0.0
+    return lon, lat
+
+
+def generate_chunk(taxi_type, trip_year, trip_month, rows, seed, chunk_index=0):
+    """
+    Generate one chunk of trips for a month as a dict of NumPy arrays.
+
+    Args:
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+        rows: Number of rows in the chunk
+        seed: Dataset seed
+        chunk_index: Index of the chunk within the month
+
+    Returns:
+        Dict of column name to array, keyed by the columns of the month's schema
+    """
+    era = get_schema_era(taxi_type, trip_year, trip_month)
+    schema = get_taxi_schema(taxi_type, trip_year, trip_month)
+    if schema is None:
+        raise ValueError(f"No {taxi_type} schema for {trip_year}-{trip_month:02d}")
+
+    rng = _chunk_rng(seed, taxi_type, trip_year, trip_month, chunk_index)
+
+    month_start = np.datetime64(f"{trip_year}-{trip_month:02d}", "s")
+    next_month = (np.datetime64(f"{trip_year}-{trip_month:02d}", "M") + 1).astype("datetime64[s]")
+    month_seconds = int((next_month - month_start) / np.timedelta64(1, "s"))
+
+    # Trip timing and distance
+    pickup = month_start + rng.integers(0, month_seconds, rows).astype("timedelta64[s]")
+    duration_seconds = np.clip(rng.lognormal(6.4, 0.6, rows), 30, 4 * 3600).astype(np.int64)
+    dropoff = pickup + duration_seconds.astype("timedelta64[s]")
+    speed_miles_per_second = np.clip(rng.normal(0.0033, 0.0012, rows), 0.0005, 0.012)
+    trip_distance = np.round(duration_seconds * speed_miles_per_second, 2)
+
+    passenger_count = rng.choice(np.arange(1, 7, dtype=np.int32), rows, p=PASSENGER_WEIGHTS)
+    rate_code_id = rng.choice(np.arange(1, 7, dtype=np.int32), rows, p=RATE_CODE_WEIGHTS)
+    store_and_fwd_flag = np.where(rng.random(rows) < 0.01, "Y", "N")
+    payment_index = rng.choice(len(PAYMENT_WEIGHTS), rows, p=PAYMENT_WEIGHTS)
+    vendor_index = rng.choice(2, rows)
+
+    # Amounts are computed in cents so totals add up exactly
+    fare_cents = 250 + np.round(trip_distance * 250 + duration_seconds * 0.5).astype(np.int64)
+    extra_cents = rng.choice(np.array([0, 50, 100], dtype=np.int64), rows, p=[0.5, 0.35, 0.15])
+    mta_tax_cents = np.full(rows, 50, dtype=np.int64)
+    tip_rate = rng.uniform(0.1, 0.3, rows)
+    tip_cents = np.where(payment_index == 0, np.round(fare_cents * tip_rate), 0).astype(np.int64)
+    tolls_cents = np.where(rng.random(rows) < 0.05, 554, 0).astype(np.int64)
+    surcharge_cents = np.full(rows, 30 if trip_year >= 2015 else 0, dtype=np.int64)
+    total_cents = fare_cents + extra_cents + mta_tax_cents + tip_cents + tolls_cents + surcharge_cents
+
+    columns = {
+        "pickup_datetime": pickup,
+        "dropoff_datetime": dropoff,
+        "passenger_count": passenger_count,
+        "trip_distance": trip_distance,
+        "rate_code_id": rate_code_id,
+        "store_and_fwd_flag": store_and_fwd_flag,
+        "fare_amount": fare_cents / 100,
+        "extra": extra_cents / 100,
+        "mta_tax": mta_tax_cents / 100,
+        "tip_amount": tip_cents / 100,
+        "tolls_amount": tolls_cents / 100,
+        "improvement_surcharge": surcharge_cents / 100,
+        "total_amount": total_cents / 100,
+        "junk1": None,
+        "junk2": None,
+    }
+
+    # Vendor and payment codes: abbreviations before 2015 for yellow, numeric ids otherwise
+    if taxi_type == "yellow" and era == "pre2015":
+        vendor_index = rng.choice(len(PRE2015_VENDOR_CODES), rows, p=PRE2015_VENDOR_WEIGHTS)
+        columns["vendor_id"] = PRE2015_VENDOR_CODES[vendor_index]
+        columns["payment_type"] = PRE2015_PAYMENT_CODES[payment_index]
+    elif taxi_type == "yellow":
+        columns["vendor_id"] = (vendor_index + 1).astype(str)
+        columns["payment_type"] = (payment_index + 1).astype(str)
+    else:
+        columns["vendor_id"] = (vendor_index + 1).astype(np.int32)
+        columns["payment_type"] = (payment_index + 1).astype(np.int32)
+        columns["trip_type"] = np.where(rng.random(rows) < 0.98, 1, 2).astype(np.int32)
+        columns["ehail_fee"] = None
+
+    # Location: raw coordinates until mid-2016, taxi zone ids afterwards
+    field_names = [name for name, _ in schema]
+    if "pickup_longitude" in field_names:
+        columns["pickup_longitude"], columns["pickup_latitude"] = _coordinates(rng, rows)
+        columns["dropoff_longitude"], columns["dropoff_latitude"] = _coordinates(rng, rows)
+    else:
+        zone_ids = np.arange(1, NUM_TAXI_ZONES + 1, dtype=np.int32)
+        columns["pickup_location_id"] = rng.choice(zone_ids, rows, p=ZONE_WEIGHTS)
+        columns["dropoff_location_id"] = rng.choice(zone_ids, rows, p=ZONE_WEIGHTS)
+
+    return {name: columns[name] for name in field_names}
+
+
+def _chunk_to_table(chunk, schema, rows):
+    arrays = []
+    for name, type_name in schema:
+        values = chunk[name]
+        if values is None:
+            arrays.append(pa.nulls(rows, pa.string()))
+        elif type_name == "timestamp":
+            arrays.append(pa.array(values, pa.timestamp("s")))
+        else:
+            arrays.append(pa.array(values))
+    return pa.Table.from_arrays(arrays, names=[name for name, _ in schema])
+
+
+def write_month_csv(path, taxi_type, trip_year, trip_month, rows, seed):
+    """
+    Generate a month of trips and write it as a CSV with a header row.
+
+    Args:
+        path: Output CSV path
+        taxi_type: "yellow" or "green"
+        trip_year: Trip year
+        trip_month: Trip month (1-12)
+        rows: Number of rows to generate
+        seed: Dataset seed
+
+    Returns:
+        Number of bytes written
+    """
+    schema = get_taxi_schema(taxi_type, trip_year, trip_month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_options = pacsv.WriteOptions(include_header=False, quoting_style="none")
+
+    with open(path, "wb") as f:
+        f.write((",".join(name for name, _ in schema) + "\n").encode())
+        for chunk_index, chunk_start in enumerate(range(0, rows, CHUNK_ROWS)):
+            chunk_rows = min(CHUNK_ROWS, rows - chunk_start)
+            chunk = generate_chunk(taxi_type, trip_year, trip_month, chunk_rows, seed, chunk_index)
+            pacsv.write_csv(_chunk_to_table(chunk, schema, chunk_rows), f, write_options)
+        return f.tell()
+
+
+def _write_month_task(args):
+    root, taxi_type, trip_year, trip_month, rows, seed = args
+    path = source_csv_path(root, taxi_type, trip_year, trip_month)
+    size = write_month_csv(path, taxi_type, trip_year, trip_month, rows, seed)
+    return path, size
+
+
+def generate_dataset(root, scale_factor=0.001, seed=42, taxi_types=TAXI_TYPES,
+                     start=None, end=None, workers=None):
+    """
+    Generate monthly CSVs for all requested taxi types and months.
+
+    Args:
+        root: Root dir for the generated source data
+        scale_factor: Fraction of the real monthly row counts to generate
+        seed: Dataset seed; the same seed and scale factor give the same bytes
+        taxi_types: Taxi types to generate
+        start: Optional first (year, month)
+        end: Optional last (year, month), inclusive
+        workers: Number of worker processes (default: CPU count)
+
+    Returns:
+        List of (path, bytes written) tuples in generation order
+    """
+    tasks = [
+        (root, taxi_type, year, month, rows_per_month(taxi_type, scale_factor), seed)
+        for taxi_type in taxi_types
+        for year, month in iter_trip_months(taxi_type, start, end)
+    ]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, size in executor.map(_write_month_task, tasks):
+            print(f"Wrote {path} ({size / 1024 ** 2:.1f} MB)")
+            results.append((path, size))
+    return results
+
+
+def _parse_year_month(value):
+    year, month = value.split("-")
+    return int(year), int(month)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic NYC taxi trip CSVs")
+    parser.add_argument("output_dir", help="Root dir for the generated transactional data")
+    parser.add_argument("--scale-factor", type=float, default=0.001,
+                        help="Fraction of the real monthly row counts (default: 0.001)")
+    parser.add_argument("--seed", type=int, default=42, help="Dataset seed (default: 42)")
+    parser.add_argument("--taxi-type", choices=TAXI_TYPES, action="append",
+                        help="Taxi type to generate (repeatable, default: all)")
+    parser.add_argument("--start", type=_parse_year_month, help="First month as YYYY-MM")
+    parser.add_argument("--end", type=_parse_year_month, help="Last month as YYYY-MM")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    try:
+        results = generate_dataset(
+            args.output_dir,
+            scale_factor=args.scale_factor,
+            seed=args.seed,
+            taxi_types=args.taxi_type or TAXI_TYPES,
+            start=args.start,
+            end=args.end,
+            workers=args.workers,
+        )
+        total = sum(size for _, size in results)
+        print(f"Generated {len(results)} files, {total / 1024 ** 2:.1f} MB in total")
+    except Exception as e:
+        print(f"Error generating data: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
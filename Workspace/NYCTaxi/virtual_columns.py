@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Derived timestamp columns computed on read instead of stored.
+
+The transform and materialize SQL store fourteen derived columns:
+``pickup_year``, ``pickup_month``, ``pickup_day``, ``pickup_hour``,
+``pickup_minute``, ``pickup_second``, ``pickup_date`` and the dropoff
+equivalents. Each is a pure function of ``pickup_datetime`` or
+``dropoff_datetime``, yet every partition pays to compute, compress and write
+them, and to store them.
+
+Here they are virtual columns over the stored timestamps:
+
+- ``add_virtual_columns`` computes requested columns for a Table or
+  RecordBatch with vectorized Arrow kernels
+- ``read_table`` reads a hive-partitioned table, reading only the stored
+  columns a projection needs (plus the timestamps behind the virtual ones)
+  and computing the virtual ones afterwards
+- ``create_duckdb_view`` defines a DuckDB view with the virtual columns as
+  expressions; DuckDB evaluates a view column only when a query projects it
+
+Columns a table still stores are read as stored, so the same readers work
+on both layouts, and on a table that mixes them partition by partition.
+``matview.py --virtual-columns`` writes a mat view without them; the CLI
+measures both layouts side by side: bytes stored, the time to materialize
+them, and the time to read a derived column back.
+
+Usage:
+    python -m NYCTaxi.virtual_columns <work_dir> --source yellow=<dir> [--source green=<dir>] [--reps 3]
+        Materialize a mat view with stored and with virtual derived columns
+        under <work_dir> and compare them
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# Derived column -> (timestamp column, part), in transform SQL order
+VIRTUAL_COLUMNS = {
+    f"{prefix}_{part}": (f"{prefix}_datetime", part)
+    for prefix in ("pickup", "dropoff")
+    for part in ("year", "month", "day", "hour", "minute", "second", "date")
+}
+
+_PART_FUNCTIONS = {
+    "year": pc.year,
+    "month": pc.month,
+    "day": pc.day,
+    "hour": pc.hour,
+    "minute": pc.minute,
+    "second": pc.second,
+}
+
+# DuckDB expression of each part, typed like the stored columns
+_PART_SQL = {
+    "year": 'CAST(year("{column}") AS INTEGER)',
+    "month": 'CAST(month("{column}") AS INTEGER)',
+    "day": 'CAST(day("{column}") AS INTEGER)',
+    "hour": 'CAST(hour("{column}") AS INTEGER)',
+    "minute": 'CAST(minute("{column}") AS INTEGER)',
+    "second": 'CAST(second("{column}") AS INTEGER)',
+    "date": 'CAST("{column}" AS DATE)',
+}
+
+
+def virtual_column(name, timestamps):
+    """Values of a virtual column from its timestamp column (int32 parts, date32 dates)."""
+    _, part = VIRTUAL_COLUMNS[name]
+    if part == "date":
+        return pc.cast(timestamps, pa.date32())
+    return pc.cast(_PART_FUNCTIONS[part](timestamps), pa.int32())
+
+
+def add_virtual_columns(data, columns=None):
+    """
+    Append virtual columns to a Table or RecordBatch.
+
+    Args:
+        data: Table or RecordBatch with the timestamp columns
+        columns: Virtual columns to add (default: all); columns the data
+            already has are left as they are
+
+    Returns:
+        Table or RecordBatch with the columns appended
+    """
+    names, arrays = list(data.schema.names), list(data.columns)
+    for name in columns if columns is not None else VIRTUAL_COLUMNS:
+        if name in names:
+            continue
+        names.append(name)
+        arrays.append(virtual_column(name, data.column(VIRTUAL_COLUMNS[name][0])))
+    if isinstance(data, pa.RecordBatch):
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def read_table(table_dir, columns=None, filter=None):
+    """
+    Read a hive-partitioned table with its virtual columns.
+
+    Each file is read with the columns it stores, and the virtual columns it
+    does not store are computed from its timestamps, so a table whose
+    partitions were written with different layouts reads as one.
+
+    Args:
+        table_dir: Table dir (e.g. a mat view, or an enriched <type>-taxi table)
+        columns: Columns to read, stored or virtual (default: every stored
+            column, then the virtual columns the table does not store)
+        filter: Optional pyarrow.dataset expression on stored columns
+
+    Returns:
+        pyarrow Table with the columns in the requested order
+    """
+    dataset = ds.dataset(table_dir, format="parquet", partitioning="hive", exclude_invalid_files=True)
+    stored = dataset.schema.names
+    if columns is None:
+        columns = stored + [name for name in VIRTUAL_COLUMNS if name not in stored]
+    schema = pa.schema([
+        dataset.schema.field(name) if name in stored
+        else pa.field(name, pa.date32() if VIRTUAL_COLUMNS[name][1] == "date" else pa.int32())
+        for name in columns
+    ])
+
+    tables = []
+    for fragment in dataset.get_fragments(filter=filter):
+        # The fragment's own columns plus the hive partition columns
+        fragment_schema = pa.unify_schemas([fragment.physical_schema, dataset.partitioning.schema])
+        virtual = [
+            name for name in columns
+            if name in VIRTUAL_COLUMNS and name not in fragment_schema.names
+        ]
+        needed = [name for name in columns if name not in virtual]
+        for name in virtual:
+            if VIRTUAL_COLUMNS[name][0] not in needed:
+                needed.append(VIRTUAL_COLUMNS[name][0])
+        table = fragment.to_table(schema=fragment_schema, columns=needed, filter=filter)
+        tables.append(add_virtual_columns(table, virtual).select(columns).cast(schema))
+    if not tables:
+        return schema.empty_table()
+    return pa.concat_tables(tables)
+
+
+def duckdb_view_sql(table_dir, stored_columns):
+    """
+    SELECT over a table's Parquet files with every virtual column.
+
+    The files are read by name, so files without a virtual column read it as
+    NULL; a virtual column the table stores in some files is coalesced with
+    its expression, one it stores in none is just the expression.
+    """
+    expressions = [
+        f'{_PART_SQL[part].format(column=column)} AS "{name}"'
+        for name, (column, part) in VIRTUAL_COLUMNS.items()
+        if name not in stored_columns
+    ]
+    replaced = [
+        f'coalesce("{name}", {_PART_SQL[part].format(column=column)}) AS "{name}"'
+        for name, (column, part) in VIRTUAL_COLUMNS.items()
+        if name in stored_columns
+    ]
+    star = f"* REPLACE (\n    {', '.join(replaced)}\n  )" if replaced else "*"
+    select_list = ",\n  ".join([star] + expressions)
+    path = os.path.join(table_dir, "**", "*.parquet").replace("'", "''")
+    return (f"SELECT\n  {select_list}\n"
+            f"FROM read_parquet('{path}', hive_partitioning = true, union_by_name = true)")
+
+
+def create_duckdb_view(con, name, table_dir):
+    """Create (or replace) a DuckDB view of a table with its virtual columns."""
+    path = os.path.join(table_dir, "**", "*.parquet").replace("'", "''")
+    stored = [row[0] for row in con.execute(
+        f"DESCRIBE SELECT * FROM read_parquet('{path}', hive_partitioning = true, union_by_name = true)"
+    ).fetchall()]
+    con.execute(f'CREATE OR REPLACE VIEW "{name}" AS {duckdb_view_sql(table_dir, stored)}')
+
+
+def _stored_bytes(table_dir):
+    # (total bytes, compressed bytes of the stored virtual columns) from the Parquet footers
+    total = derived = 0
+    for fragment in ds.dataset(table_dir, format="parquet", partitioning="hive").get_fragments():
+        metadata = fragment.metadata
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                chunk = row_group.column(j)
+                total += chunk.total_compressed_size
+                if chunk.path_in_schema in VIRTUAL_COLUMNS:
+                    derived += chunk.total_compressed_size
+    return total, derived
+
+
+def measure_layouts(sources, work_dir, reps=3):
+    """
+    Materialize a mat view with stored and with virtual derived columns and compare.
+
+    Args:
+        sources: Dict of taxi type to enriched source table dir
+        work_dir: Dir for the two mat views; emptied first
+        reps: Timed reads per layout and query
+
+    Returns:
+        Dict of layout ("stored", "virtual") to materialize seconds, rows,
+        bytes, bytes of stored derived columns and the median seconds of
+        reading with and without a derived column
+    """
+    import duckdb
+
+    from .matview import MatView
+
+    queries = {
+        "derived": "SELECT pickup_hour, count(*), sum(total_amount) FROM taxi_trips_mat_view GROUP BY 1",
+        "plain": "SELECT taxi_type, count(*), sum(total_amount) FROM taxi_trips_mat_view GROUP BY 1",
+    }
+    results = {}
+    for layout in ("stored", "virtual"):
+        mat_view_dir = os.path.join(work_dir, layout)
+        shutil.rmtree(mat_view_dir, ignore_errors=True)
+        result = MatView(mat_view_dir, virtual_columns=layout == "virtual").refresh(sources, full_refresh=True)
+        total_bytes, derived_bytes = _stored_bytes(mat_view_dir)
+
+        con = duckdb.connect()
+        create_duckdb_view(con, "taxi_trips_mat_view", mat_view_dir)
+        read_seconds = {}
+        for name, sql in queries.items():
+            con.execute(sql).fetchall()
+            seconds = []
+            for _ in range(reps):
+                start_time = time.perf_counter()
+                con.execute(sql).fetchall()
+                seconds.append(time.perf_counter() - start_time)
+            read_seconds[name] = statistics.median(seconds)
+        con.close()
+
+        results[layout] = {
+            "materialize_seconds": result["seconds"],
+            "rows": result["rows"],
+            "bytes": total_bytes,
+            "derived_bytes": derived_bytes,
+            "read_seconds": read_seconds,
+        }
+    return results
+
+
+def _parse_source(value):
+    taxi_type, table_dir = value.split("=", 1)
+    return taxi_type, table_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a mat view with stored and with virtual derived columns")
+    parser.add_argument("work_dir", help="Dir for the two mat views (replaced)")
+    parser.add_argument("--source", type=_parse_source, action="append", required=True,
+                        help="Enriched source table as <taxi_type>=<dir> (repeatable)")
+    parser.add_argument("--reps", type=int, default=3, help="Timed reads per query (default: 3)")
+    args = parser.parse_args()
+
+    try:
+        results = measure_layouts(dict(args.source), args.work_dir, args.reps)
+        for layout, result in results.items():
+            print(f"{layout}: {result['rows']} rows materialized in {result['materialize_seconds']:.2f}s, "
+                  f"{result['bytes'] / 1024 ** 2:.1f} MiB ({result['derived_bytes'] / 1024 ** 2:.1f} MiB derived columns); "
+                  f"read with a derived column {result['read_seconds']['derived']:.3f}s, "
+                  f"without {result['read_seconds']['plain']:.3f}s")
+        stored, virtual = results["stored"], results["virtual"]
+        print(f"Virtual columns save {1 - virtual['bytes'] / stored['bytes']:.0%} of storage and "
+              f"{1 - virtual['materialize_seconds'] / stored['materialize_seconds']:.0%} of materialize time")
+    except Exception as e:
+        print(f"Error measuring layouts: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
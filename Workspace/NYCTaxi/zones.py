@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Taxi zone assignment from pickup/dropoff coordinates, with a grid spatial index.
+
+Before July 2016 the TLC files carry raw longitude/latitude instead of zone
+ids, and ``getSchemaHomogenizedDataframe`` sets ``pickup_location_id`` and
+``dropoff_location_id`` to ``lit(0)`` for them, so every ``taxi_zone_lookup``
+join comes back empty and those years drop out of zone-level analytics.
+``ZoneIndex`` assigns the ids from the coordinates, using the NYC taxi zone
+polygons in a local GeoJSON file (``taxi_zones.geojson`` from NYC Open
+Data, in WGS84 longitude/latitude).
+
+The index is a uniform grid over the zones' bounding box:
+
+- a cell crossed by no zone edge lies inside a single zone (or none), so
+  its zone is computed once at build time and points in it are looked up by
+  array indexing alone
+- a cell crossed by edges keeps the zones whose edges cross it, plus the
+  zone of its center (a zone whose edges miss the cell covers all of it or
+  none); points in it are tested against those zones only, with the
+  crossing-number test over just the zone edges in the point's grid row
+  (the only edges a horizontal ray from the point can cross)
+
+Both steps run over NumPy arrays for a whole batch of points at once. With
+the default 512x512 grid most points fall in edge-free cells.
+
+Points outside every zone, and missing or (0, 0) coordinates, get zone 0,
+the value the homogenized tables already use for unknown.
+
+Usage:
+    python -m NYCTaxi.zones <taxi_zones.geojson> [--points 10000000] [--grid-size 512] [--check 20000]
+        Time the lookup on random points over the zones' bounding box and
+        optionally compare a sample with a brute-force test.
+    python -m NYCTaxi.convert ... --zones taxi_zones.geojson
+        Fill the location ids of converted trips that have coordinates only
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DEFAULT_GRID_SIZE = 512
+LOOKUP_CHUNK_POINTS = 1 << 20
+
+# Feature properties holding the zone id, by the spellings of the published files
+LOCATION_ID_PROPERTIES = ("LocationID", "location_id", "locationid")
+
+_OUTSIDE = -1
+_BOUNDARY = -2
+
+
+def load_zone_polygons(path):
+    """
+    Zone polygons of a GeoJSON FeatureCollection.
+
+    Returns:
+        List of (location id, list of rings as (n, 2) float64 arrays of longitude/latitude);
+        holes and the parts of multipolygons are rings like any other
+    """
+    with open(path, "r") as f:
+        collection = json.load(f)
+    zones = []
+    for feature in collection["features"]:
+        properties = feature.get("properties") or {}
+        location_id = next((properties[name] for name in LOCATION_ID_PROPERTIES if name in properties), None)
+        if location_id is None:
+            raise ValueError(f"Feature without a location id property ({', '.join(LOCATION_ID_PROPERTIES)})")
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise ValueError(f"Unsupported geometry type {geometry['type']} for zone {location_id}")
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon]
+        zones.append((int(location_id), rings))
+    return zones
+
+
+def _ring_edges(rings):
+    # (x1, y1, x2, y2) of every edge of a set of rings, closed or not
+    edges = []
+    for ring in rings:
+        if len(ring) and np.array_equal(ring[0], ring[-1]):
+            ring = ring[:-1]
+        if len(ring) < 3:
+            continue
+        edges.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+    return np.vstack(edges) if edges else np.empty((0, 4))
+
+
+def _crossings(px, py, x1, y1, x2, y2):
+    # Whether a ray from (px, py) towards +x crosses each edge; half-open in y so a
+    # ray through a vertex counts it once
+    spans = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    return spans & (px < x_cross)
+
+
+class ZoneIndex:
+    """
+    Grid index of taxi zone polygons for batched point-in-polygon lookups.
+
+    Usage:
+        index = ZoneIndex.from_geojson("taxi_zones.geojson")
+        location_ids = index.lookup(longitudes, latitudes)
+    """
+
+    def __init__(self, zones, grid_size=DEFAULT_GRID_SIZE):
+        self.grid_size = grid_size
+        self.location_ids = np.array([location_id for location_id, _ in zones], dtype=np.int32)
+        num_zones = len(zones)
+
+        edge_arrays, edge_zones = [], []
+        for zone, (_, rings) in enumerate(zones):
+            edges = _ring_edges(rings)
+            edge_arrays.append(edges)
+            edge_zones.append(np.full(len(edges), zone, dtype=np.int64))
+        edges = np.vstack(edge_arrays)
+        edge_zone = np.concatenate(edge_zones)
+
+        self.x0, self.y0 = edges[:, [0, 2]].min(), edges[:, [1, 3]].min()
+        x_max, y_max = edges[:, [0, 2]].max(), edges[:, [1, 3]].max()
+        self.cell_width = (x_max - self.x0) / grid_size
+        self.cell_height = (y_max - self.y0) / grid_size
+        self.x_max, self.y_max = x_max, y_max
+
+        col_lo = self._cols(np.minimum(edges[:, 0], edges[:, 2]))
+        col_hi = self._cols(np.maximum(edges[:, 0], edges[:, 2]))
+        row_lo = self._rows(np.minimum(edges[:, 1], edges[:, 3]))
+        row_hi = self._rows(np.maximum(edges[:, 1], edges[:, 3]))
+
+        # Edges of each (row, zone), sorted by row then zone so each pair is a contiguous range.
+        # Horizontal edges never cross a horizontal ray, so the crossing test skips them
+        row_counts = row_hi - row_lo + 1
+        sloped = np.nonzero(edges[:, 1] != edges[:, 3])[0]
+        row_edge = np.repeat(sloped, row_counts[sloped])
+        row_of = np.repeat(row_lo[sloped], row_counts[sloped]) + _ramp(row_counts[sloped])
+        row_zone_key = row_of * num_zones + edge_zone[row_edge]
+        order = np.argsort(row_zone_key, kind="stable")
+        self._row_edges = edges[row_edge[order]]
+        self._row_edge_zone = edge_zone[row_edge[order]]
+        self._row_zone_start = np.searchsorted(row_zone_key[order], np.arange(grid_size * num_zones + 1))
+        self._num_zones = num_zones
+
+        # Zones whose edges (horizontal ones included) may cross each cell, from the edge
+        # bounding boxes: a superset
+        cell_counts = row_counts * (col_hi - col_lo + 1)
+        cell_edge = np.repeat(np.arange(len(edges)), cell_counts)
+        offsets = _ramp(cell_counts)
+        widths = (col_hi - col_lo + 1)[cell_edge]
+        cell_of = (row_lo[cell_edge] + offsets // widths) * grid_size + col_lo[cell_edge] + offsets % widths
+        cell_zone = np.unique(cell_of * num_zones + edge_zone[cell_edge])
+        crossed = np.zeros(grid_size * grid_size, dtype=bool)
+        crossed[cell_zone // num_zones] = True
+
+        # The zone of each cell center, tested against every zone of its row
+        all_cells = np.arange(grid_size * grid_size)
+        centers_x = self.x0 + (all_cells % grid_size + 0.5) * self.cell_width
+        centers_y = self.y0 + (all_cells // grid_size + 0.5) * self.cell_height
+        center_zone = self._row_test(centers_x, centers_y, all_cells // grid_size)
+
+        # Edge-free cells lie inside one zone or none: label them by their center
+        self.cell_label = np.where(crossed, _BOUNDARY, center_zone).astype(np.int32)
+
+        # A zone whose boundary misses a crossed cell either covers the whole cell or none of
+        # it, so with its center's zone the candidates of a crossed cell are complete (e.g. the
+        # zone around an island whose edges are the only ones crossing the cell)
+        enclosing = np.nonzero(crossed & (center_zone >= 0))[0]
+        cell_zone = np.union1d(cell_zone, enclosing * num_zones + center_zone[enclosing])
+        cells, zones_of_cells = cell_zone // num_zones, cell_zone % num_zones
+        self._cell_zone_start = np.searchsorted(cells, np.arange(grid_size * grid_size + 1))
+        self._cell_zones = zones_of_cells
+
+    @classmethod
+    def from_geojson(cls, path, grid_size=DEFAULT_GRID_SIZE):
+        return cls(load_zone_polygons(path), grid_size)
+
+    def _cols(self, x):
+        return np.clip(((x - self.x0) / self.cell_width).astype(np.int64), 0, self.grid_size - 1)
+
+    def _rows(self, y):
+        return np.clip(((y - self.y0) / self.cell_height).astype(np.int64), 0, self.grid_size - 1)
+
+    def _row_test(self, px, py, rows):
+        # Zone index of each point against every zone of its row, or _OUTSIDE
+        labels = np.full(len(px), _OUTSIDE, dtype=np.int32)
+        for row in np.unique(rows):
+            points = np.nonzero(rows == row)[0]
+            start = self._row_zone_start[row * self._num_zones]
+            end = self._row_zone_start[(row + 1) * self._num_zones]
+            x1, y1, x2, y2 = self._row_edges[start:end].T
+            crosses = _crossings(px[points, None], py[points, None], x1, y1, x2, y2)
+            point, edge = np.nonzero(crosses)
+            counts = np.bincount(point * self._num_zones + self._row_edge_zone[start:end][edge],
+                                 minlength=len(points) * self._num_zones).reshape(len(points), self._num_zones)
+            inside = counts % 2 == 1
+            labels[points] = np.where(inside.any(axis=1), inside.argmax(axis=1), _OUTSIDE)
+        return labels
+
+    def lookup(self, longitudes, latitudes):
+        """
+        Location id of each point; 0 for points outside every zone or without coordinates.
+
+        Args:
+            longitudes: Array-like of longitudes (NaN for missing)
+            latitudes: Array-like of latitudes (NaN for missing)
+
+        Returns:
+            numpy int32 array of location ids
+        """
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        result = np.zeros(len(longitudes), dtype=np.int32)
+        for start in range(0, len(longitudes), LOOKUP_CHUNK_POINTS):
+            end = start + LOOKUP_CHUNK_POINTS
+            result[start:end] = self._lookup_chunk(longitudes[start:end], latitudes[start:end])
+        return result
+
+    def _lookup_chunk(self, px, py):
+        result = np.zeros(len(px), dtype=np.int32)
+        with np.errstate(invalid="ignore"):
+            valid = (px >= self.x0) & (px <= self.x_max) & (py >= self.y0) & (py <= self.y_max)
+        points = np.nonzero(valid)[0]
+        rows, cols = self._rows(py[points]), self._cols(px[points])
+        labels = self.cell_label[rows * self.grid_size + cols]
+
+        interior = labels >= 0
+        result[points[interior]] = self.location_ids[labels[interior]]
+
+        boundary = labels == _BOUNDARY
+        points, rows, cells = points[boundary], rows[boundary], (rows * self.grid_size + cols)[boundary]
+        # One (point, candidate zone) pair per zone crossing the point's cell
+        candidate_counts = self._cell_zone_start[cells + 1] - self._cell_zone_start[cells]
+        pair_point = np.repeat(np.arange(len(points)), candidate_counts)
+        pair_zone = self._cell_zones[np.repeat(self._cell_zone_start[cells], candidate_counts) + _ramp(candidate_counts)]
+        # One (pair, edge) item per edge of the candidate zone in the point's row
+        keys = rows[pair_point] * self._num_zones + pair_zone
+        edge_counts = self._row_zone_start[keys + 1] - self._row_zone_start[keys]
+        item_pair = np.repeat(np.arange(len(pair_point)), edge_counts)
+        item_edge = np.repeat(self._row_zone_start[keys], edge_counts) + _ramp(edge_counts)
+        x1, y1, x2, y2 = self._row_edges[item_edge].T
+        item_point = points[pair_point[item_pair]]
+        crosses = _crossings(px[item_point], py[item_point], x1, y1, x2, y2)
+        inside = np.bincount(item_pair, weights=crosses, minlength=len(pair_point)) % 2 == 1
+        result[points[pair_point[inside]]] = self.location_ids[pair_zone[inside]]
+        return result
+
+
+def _ramp(counts):
+    # 0..count-1 for each count, concatenated
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total, dtype=np.int64) - starts
+
+
+def brute_force_lookup(zones, longitudes, latitudes):
+    """Location ids by testing every point against every zone; for checking ZoneIndex."""
+    result = np.zeros(len(longitudes), dtype=np.int32)
+    for location_id, rings in zones:
+        x1, y1, x2, y2 = _ring_edges(rings).T
+        crosses = _crossings(longitudes[:, None], latitudes[:, None], x1, y1, x2, y2)
+        result[crosses.sum(axis=1) % 2 == 1] = location_id
+    return result
+
+
+_NUMBER_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+
+def _coordinates(array):
+    """
+    Coordinates as a float64 numpy array, NaN where they are null or not a number.
+
+    The converted tables keep coordinates as strings, and a value such as
+    "x" would make a plain cast fail for the whole batch.
+    """
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        trimmed = pc.utf8_trim_whitespace(array)
+        numeric = pc.fill_null(pc.match_substring_regex(trimmed, _NUMBER_PATTERN), False)
+        array = pc.if_else(numeric, trimmed, pa.scalar(None, array.type))
+    return pc.fill_null(pc.cast(array, pa.float64()), np.nan).to_numpy(zero_copy_only=False)
+
+
+def assign_zones(batch, index, prefixes=("pickup", "dropoff")):
+    """
+    Fill the zero location ids of a RecordBatch from its coordinates.
+
+    Rows whose location id is already set are left alone, so the batches of
+    months that carry ids pass through unchanged. Coordinates that are
+    missing or not numbers get zone 0.
+
+    Returns:
+        RecordBatch with the location id columns filled where possible
+    """
+    arrays, names = list(batch.columns), batch.schema.names
+    for prefix in prefixes:
+        id_name = f"{prefix}_location_id"
+        lon_name, lat_name = f"{prefix}_longitude", f"{prefix}_latitude"
+        if id_name not in names or lon_name not in names or lat_name not in names:
+            continue
+        ids = batch.column(id_name)
+        missing = pc.fill_null(pc.equal(ids, 0), True)
+        if not pc.any(missing).as_py():
+            continue
+        found = index.lookup(_coordinates(batch.column(lon_name)), _coordinates(batch.column(lat_name)))
+        current = pc.fill_null(ids, 0).to_numpy(zero_copy_only=False)
+        filled = np.where(missing.to_numpy(zero_copy_only=False), found, current)
+        arrays[names.index(id_name)] = pa.array(filled, type=ids.type)
+    return pa.RecordBatch.from_arrays(arrays, schema=batch.schema)
+
+
+_INDEX_CACHE = {}
+
+
+def cached_zone_index(path, grid_size=DEFAULT_GRID_SIZE):
+    """ZoneIndex of a GeoJSON file, built once per process (e.g. per converter worker)."""
+    key = (path, grid_size)
+    if key not in _INDEX_CACHE:
+        _INDEX_CACHE[key] = ZoneIndex.from_geojson(path, grid_size)
+    return _INDEX_CACHE[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark taxi zone assignment from coordinates")
+    parser.add_argument("zones_path", help="Taxi zone polygons as GeoJSON (e.g. taxi_zones.geojson)")
+    parser.add_argument("--points", type=int, default=10_000_000, help="Random points to look up (default: 10000000)")
+    parser.add_argument("--grid-size", type=int, default=DEFAULT_GRID_SIZE,
+                        help=f"Cells per side of the index grid (default: {DEFAULT_GRID_SIZE})")
+    parser.add_argument("--check", type=int, default=0, help="Compare this many points with a brute-force test")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        zones = load_zone_polygons(args.zones_path)
+        start_time = time.time()
+        index = ZoneIndex(zones, args.grid_size)
+        build_seconds = time.time() - start_time
+        free_share = np.mean(index.cell_label != _BOUNDARY)
+        print(f"Indexed {len(zones)} zones on a {args.grid_size}x{args.grid_size} grid in {build_seconds:.2f}s "
+              f"({free_share:.0%} of cells edge-free)")
+
+        rng = np.random.default_rng(args.seed)
+        longitudes = rng.uniform(index.x0, index.x_max, args.points)
+        latitudes = rng.uniform(index.y0, index.y_max, args.points)
+        start_time = time.time()
+        location_ids = index.lookup(longitudes, latitudes)
+        seconds = time.time() - start_time
+        print(f"Looked up {args.points} points in {seconds:.2f}s ({args.points / seconds * 60 / 1e6:.0f}M points/min), "
+              f"{np.mean(location_ids > 0):.0%} inside a zone")
+
+        if args.check:
+            sample = slice(0, args.check)
+            expected = brute_force_lookup(zones, longitudes[sample], latitudes[sample])
+            mismatches = int(np.sum(expected != location_ids[sample]))
+            print(f"Brute-force check of {args.check} points: {mismatches} mismatches")
+            if mismatches:
+                sys.exit(1)
+    except Exception as e:
+        print(f"Error assigning zones: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
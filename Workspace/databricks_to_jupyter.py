@@ -2,14 +2,22 @@
 """
 Convert Databricks notebook to Jupyter notebook format.
 This script takes a Databricks notebook and converts it to a Jupyter notebook.
+
+Bulk mode converts a whole tree of exported notebooks in one process,
+skipping those unchanged since the last run (see workspace_sync.py):
+
+    python databricks_to_jupyter.py --bulk <src_dir> <dest_dir> [--workers 8] [--force]
 """
 
+import argparse
 import json
 import sys
 import re
 import os
 from pathlib import Path
 
+from workspace_sync import DEFAULT_WORKERS, convert_tree
+
 
 def convert_databricks_to_jupyter(input_path, output_path=None):
     """
@@ -140,10 +148,41 @@ def convert_databricks_to_jupyter(input_path, output_path=None):
     return notebook
 
 
+def bulk_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="databricks_to_jupyter.py --bulk",
+        description="Convert a tree of Databricks notebooks (.py) to Jupyter notebooks",
+    )
+    parser.add_argument("src_dir", help="Dir of Databricks notebooks in SOURCE format")
+    parser.add_argument("dest_dir", help="Dir for the .ipynb notebooks, in the same layout")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Notebooks converted at once (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--force", action="store_true", help="Convert unchanged notebooks too")
+    args = parser.parse_args(argv)
+
+    result = convert_tree(args.src_dir, args.dest_dir, convert_databricks_to_jupyter,
+                          ".py", ".ipynb", workers=args.workers, force=args.force)
+    print(f"Converted {len(result['converted'])} notebooks to {args.dest_dir}, "
+          f"{len(result['skipped'])} unchanged, in {result['seconds']:.2f}s")
+    for name, error in result["failures"]:
+        print(f"Error converting {name}: {error}")
+    if result["failures"]:
+        sys.exit(1)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--bulk":
+        try:
+            bulk_main(sys.argv[2:])
+        except Exception as e:
+            print(f"Error converting notebooks: {e}")
+            sys.exit(1)
+        return
+
     if len(sys.argv) < 2:
         print(
-            "Usage: python databricks_to_jupyter.py <input_notebook.py> [output_notebook.ipynb]"
+            "Usage: python databricks_to_jupyter.py <input_notebook.py> [output_notebook.ipynb]\n"
+            "       python databricks_to_jupyter.py --bulk <src_dir> <dest_dir>"
         )
         sys.exit(1)
 
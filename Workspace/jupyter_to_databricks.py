@@ -2,13 +2,30 @@
 """
 Convert Jupyter notebook to Databricks notebook format.
 This script takes a Jupyter notebook and converts it to a format that can be imported into Databricks.
+
+Bulk mode converts a whole tree in one process and, with --upload, imports
+it into the workspace over pooled keep-alive connections, skipping
+notebooks unchanged since the last sync (see workspace_sync.py):
+
+    python jupyter_to_databricks.py --bulk <src_dir> [--output-dir <dir>] [--upload <remote_dir>]
 """
 
+import argparse
 import json
 import sys
 import base64
 import os
 
+from workspace_sync import (
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_SYNC_STATE_PATH,
+    DEFAULT_WORKERS,
+    WorkspaceImporter,
+    convert_tree,
+    read_databricks_config,
+    sync_tree,
+)
+
 
 def convert_jupyter_to_databricks(input_path, output_path=None):
     """
@@ -62,10 +79,73 @@ def convert_jupyter_to_databricks(input_path, output_path=None):
     return result
 
 
+def bulk_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="jupyter_to_databricks.py --bulk",
+        description="Convert a tree of Jupyter notebooks and optionally import it into a Databricks workspace",
+    )
+    parser.add_argument("src_dir", help="Dir of .ipynb notebooks")
+    parser.add_argument("--output-dir", help="Write the converted notebooks (.py) to this dir")
+    parser.add_argument("--upload", metavar="REMOTE_DIR", help="Import the notebooks into this workspace folder")
+    parser.add_argument("--profile", default="DEFAULT", help="~/.databrickscfg profile (default: DEFAULT)")
+    parser.add_argument("--host", help="Workspace URL, overriding the profile's (e.g. a local stub server)")
+    parser.add_argument("--token", help="Access token, overriding the profile's")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Notebooks converted at once (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help=f"Uploads in flight at once (default: {DEFAULT_MAX_CONNECTIONS})")
+    parser.add_argument("--state", default=DEFAULT_SYNC_STATE_PATH,
+                        help=f"Sync state file (default: {DEFAULT_SYNC_STATE_PATH})")
+    parser.add_argument("--force", action="store_true", help="Convert and upload unchanged notebooks too")
+    args = parser.parse_args(argv)
+    if not args.output_dir and not args.upload:
+        parser.error("give --output-dir, --upload or both")
+
+    failures = []
+    if args.output_dir:
+        result = convert_tree(args.src_dir, args.output_dir, convert_jupyter_to_databricks,
+                              ".ipynb", ".py", workers=args.workers, force=args.force)
+        print(f"Converted {len(result['converted'])} notebooks to {args.output_dir}, "
+              f"{len(result['skipped'])} unchanged, in {result['seconds']:.2f}s")
+        failures += result["failures"]
+    if args.upload:
+        host, token = args.host, args.token
+        if not host or not token:
+            config_host, config_token = read_databricks_config(args.profile)
+            host, token = host or config_host, token or config_token
+        importer = WorkspaceImporter(host, token, max_connections=args.max_connections)
+        try:
+            result = sync_tree(args.src_dir, args.upload, convert_jupyter_to_databricks, importer,
+                               ".ipynb", "PYTHON", state_path=args.state, workers=args.workers,
+                               force=args.force)
+        finally:
+            importer.close()
+        for remote_path in result["imported"]:
+            print(f"Imported {remote_path}")
+        print(f"Imported {len(result['imported'])} notebooks to {host}{args.upload}, "
+              f"{len(result['skipped'])} unchanged, in {result['seconds']:.2f}s "
+              f"over {importer.connections_opened} connections")
+        failures += result["failures"]
+
+    for name, error in failures:
+        print(f"Error syncing {name}: {error}")
+    if failures:
+        sys.exit(1)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--bulk":
+        try:
+            bulk_main(sys.argv[2:])
+        except Exception as e:
+            print(f"Error converting notebooks: {e}")
+            sys.exit(1)
+        return
+
     if len(sys.argv) < 2:
         print(
-            "Usage: python jupyter_to_databricks.py <input_notebook.ipynb> [output_notebook.json]"
+            "Usage: python jupyter_to_databricks.py <input_notebook.ipynb> [output_notebook.json]\n"
+            "       python jupyter_to_databricks.py --bulk <src_dir> [--output-dir <dir>] [--upload <remote_dir>]"
         )
         sys.exit(1)
 
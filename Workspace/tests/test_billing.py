@@ -0,0 +1,70 @@
+import json
+
+from NYCTaxi.billing import BillingLedger, write_daily_csv
+
+
+def _row(currency, cost, rate=None, run_id="20250601T100000Z-abc"):
+    row = {
+        "usage_start_time": "2025-06-01 10:00:00 UTC",
+        "service": {"description": "BigQuery"},
+        "sku": {"description": "Analysis"},
+        "resource": {"name": "r1", "global_name": "g1"},
+        "currency": currency,
+        "cost": cost,
+        "labels": [{"key": "run_id", "value": run_id}, {"key": "stage", "value": "transform"}],
+    }
+    if rate is not None:
+        row["currency_conversion_rate"] = rate
+    return row
+
+
+def _write_export(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def test_rows_without_a_usd_cost_are_skipped(tmp_path):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    _write_export(exports / "billing.jsonl", [
+        _row("USD", 2.0),
+        _row("USD", 1.0, rate=None),
+        _row("EUR", 9.0, rate=0.9),
+        _row("EUR", 5.0),
+        _row("EUR", 5.0, rate=""),
+        _row("EUR", 5.0, rate=0),
+        _row("USD", "n/a"),
+    ])
+    ledger = BillingLedger(str(tmp_path / "ledger.json"))
+    result = ledger.ingest([str(exports)])
+    assert result["rows"] == 7 and result["skipped"] == 4
+    assert ledger.run_costs()["20250601T100000Z-abc"][("transform", "transform")] == 13.0
+
+
+def test_daily_report_in_the_export_dir_is_not_ingested(tmp_path):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    _write_export(exports / "billing.jsonl", [_row("USD", 2.0)])
+    daily_csv = exports / "daily.csv"
+    ledger = BillingLedger(str(tmp_path / "ledger.json"))
+    ledger.ingest([str(exports)], exclude=[str(daily_csv)])
+    write_daily_csv(ledger.daily_resource_costs(), str(daily_csv))
+    other_csv = exports / "daily-copy.csv"
+    other_csv.write_text(daily_csv.read_text())
+
+    result = ledger.ingest([str(exports)], exclude=[str(daily_csv)])
+    assert result["ingested"] == [] and result["ignored"] == [str(other_csv)]
+    assert list(ledger.files) == [str(exports / "billing.jsonl")]
+    assert ledger.daily_resource_costs()[0]["usd_cost"] == 2.0
+
+
+def test_run_ids_shaped_like_dates_are_runs(tmp_path):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    unlabeled = dict(_row("USD", 4.0), labels=[], usage_start_time="2025-06-02 00:00:00 UTC",
+                     service={"description": "Cloud Storage"})
+    _write_export(exports / "billing.jsonl", [_row("USD", 3.0, run_id="2025-06-01"), unlabeled])
+    ledger = BillingLedger(str(tmp_path / "ledger.json"))
+    ledger.ingest([str(exports)])
+    assert ledger.latest_run_category_costs() == {"transform": 3.0}
+    assert ledger.latest_day_category_costs() == {"storage": 4.0}
+    assert list(ledger.run_costs()) == ["2025-06-01"] and list(ledger.day_costs()) == ["2025-06-02"]
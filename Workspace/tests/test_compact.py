@@ -0,0 +1,61 @@
+import os
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from NYCTaxi.compact import compact_table
+from NYCTaxi.enrich import enrich_table
+from NYCTaxi.homogenize import Homogenizer
+from NYCTaxi.reference import load_reference_data, write_reference_data
+
+_VALUES = {pa.string(): "1", pa.int32(): 1, pa.float64(): 2.5}
+
+
+def _write_silver_table(table_dir, month, files=3, rows=40):
+    # A converted (convert.py) partition: the hive columns live only in the dir names
+    schema = Homogenizer("yellow", 2016, month).data_schema
+    partition_dir = os.path.join(table_dir, "trip_year=2016", f"trip_month={month:02d}")
+    os.makedirs(partition_dir)
+    for part in range(files):
+        pickups = [datetime(2016, month, 1 + i % 28, part, i % 60) for i in range(rows)]
+        columns = {}
+        for field in schema:
+            if field.name == "pickup_datetime":
+                columns[field.name] = pickups
+            elif field.name == "dropoff_datetime":
+                columns[field.name] = [pickup + timedelta(minutes=15) for pickup in pickups]
+            elif field.name.endswith("location_id"):
+                columns[field.name] = [1 + i % 7 for i in range(rows)]
+            else:
+                columns[field.name] = [_VALUES[field.type]] * rows
+        pq.write_table(pa.table(columns, schema=schema),
+                       os.path.join(partition_dir, f"part-yellow-2016-{month:02d}-{part:05d}.parquet"))
+
+
+def test_compacted_table_keeps_its_stored_columns(tmp_path):
+    table_dir = str(tmp_path / "silver" / "yellow-taxi")
+    for month in (1, 2):
+        _write_silver_table(table_dir, month)
+    stored_columns = Homogenizer("yellow", 2016, 1).data_schema.names
+
+    compact_table(table_dir)
+    # A second run with another layout reads the compacted files again
+    result = compact_table(table_dir, row_group_rows=10)
+    assert result["compacted"] == 2 and result["after"]["files"] == 2
+    for partition_dir in ("trip_year=2016/trip_month=01", "trip_year=2016/trip_month=02"):
+        (name,) = os.listdir(os.path.join(table_dir, partition_dir))
+        assert pq.read_schema(os.path.join(table_dir, partition_dir, name)).names == stored_columns
+
+    table = ds.dataset(table_dir, partitioning="hive").to_table()
+    assert table.num_rows == 240
+    assert sorted(table.group_by(["trip_year", "trip_month"]).aggregate([]).to_pylist(),
+                  key=lambda row: row["trip_month"]) == [
+        {"trip_year": 2016, "trip_month": 1}, {"trip_year": 2016, "trip_month": 2},
+    ]
+
+    write_reference_data(str(tmp_path / "reference"))
+    results = enrich_table(load_reference_data(str(tmp_path / "reference")), "yellow",
+                           table_dir, str(tmp_path / "gold" / "yellow-taxi"))
+    assert [(result["trip_month"], result["rows"]) for result in results] == [("01", 120), ("02", 120)]
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+import duckdb
+import pyarrow as pa
+
+from NYCTaxi.enrich import Enricher
+from NYCTaxi.homogenize import CANONICAL_SCHEMAS, arrow_schema
+from NYCTaxi.reference import load_reference_data, write_reference_data
+
+_VALUES = {pa.string(): "N", pa.int32(): 1, pa.float64(): 2.5}
+
+# 1-transform-yellow-taxi.sql / 2-transform-green-taxi.sql in DuckDB. Spark casts
+# a string compared with an int to int, so those joins spell out the TRY_CAST.
+_DERIVED_SQL = """
+    year(t.pickup_datetime) AS pickup_year, month(t.pickup_datetime) AS pickup_month,
+    day(t.pickup_datetime) AS pickup_day, hour(t.pickup_datetime) AS pickup_hour,
+    minute(t.pickup_datetime) AS pickup_minute, second(t.pickup_datetime) AS pickup_second,
+    {pickup_date}
+    year(t.dropoff_datetime) AS dropoff_year, month(t.dropoff_datetime) AS dropoff_month,
+    day(t.dropoff_datetime) AS dropoff_day, hour(t.dropoff_datetime) AS dropoff_hour,
+    minute(t.dropoff_datetime) AS dropoff_minute, second(t.dropoff_datetime) AS dropoff_second
+    {dropoff_date}
+"""
+_YELLOW_DERIVED_SQL = _DERIVED_SQL.format(
+    pickup_date="CAST(t.pickup_datetime AS DATE) AS pickup_date,",
+    dropoff_date=", CAST(t.dropoff_datetime AS DATE) AS dropoff_date, epoch_ms(t.pickup_datetime) AS partition_id",
+)
+_LOOKUP_SQL = """
+    tm.month_name_short, tm.month_name_full,
+    pt.description AS payment_type_description, rc.description AS rate_code_description,
+    tzpu.borough AS pickup_borough, tzpu.zone AS pickup_zone, tzpu.service_zone AS pickup_service_zone,
+    tzdo.borough AS dropoff_borough, tzdo.zone AS dropoff_zone, tzdo.service_zone AS dropoff_service_zone,
+"""
+_JOIN_SQL = """
+    LEFT OUTER JOIN trip_month tm ON (t.trip_month = tm.trip_month)
+    LEFT OUTER JOIN rate_code rc ON (t.rate_code_id = rc.rate_code_id)
+    LEFT OUTER JOIN taxi_zone tzpu ON (t.pickup_location_id = TRY_CAST(tzpu.location_id AS INT))
+    LEFT OUTER JOIN taxi_zone tzdo ON (t.dropoff_location_id = TRY_CAST(tzdo.location_id AS INT))
+"""
+_TRIP_SQL = """
+    t.pickup_datetime, t.dropoff_datetime, t.store_and_fwd_flag, t.rate_code_id,
+    t.pickup_location_id, t.dropoff_location_id, t.pickup_longitude, t.pickup_latitude,
+    t.dropoff_longitude, t.dropoff_latitude, t.passenger_count, t.trip_distance, t.fare_amount,
+    t.extra, t.mta_tax, t.tip_amount, t.tolls_amount,
+"""
+YELLOW_TRANSFORM_SQL = f"""
+SELECT t.taxi_type, CAST(v.vendor_id AS INT) AS vendor_id, {_TRIP_SQL}
+    t.improvement_surcharge, t.total_amount, CAST(pt.payment_type AS INT) AS payment_type,
+    t.trip_year, t.trip_month, v.abbreviation AS vendor_abbreviation, v.description AS vendor_description,
+    {_LOOKUP_SQL} {_YELLOW_DERIVED_SQL}
+FROM trips t
+    LEFT OUTER JOIN vendor v ON (t.vendor_id = v.abbreviation)
+    LEFT OUTER JOIN payment_type pt ON (t.payment_type = pt.abbreviation)
+    {_JOIN_SQL}
+WHERE CAST(t.trip_year AS INT) < 2015
+UNION ALL
+SELECT t.taxi_type, TRY_CAST(t.vendor_id AS INT) AS vendor_id, {_TRIP_SQL}
+    t.improvement_surcharge, t.total_amount, TRY_CAST(t.payment_type AS INT) AS payment_type,
+    t.trip_year, t.trip_month, v.abbreviation AS vendor_abbreviation, v.description AS vendor_description,
+    {_LOOKUP_SQL} {_YELLOW_DERIVED_SQL}
+FROM trips t
+    LEFT OUTER JOIN vendor v ON (TRY_CAST(t.vendor_id AS INT) = v.vendor_id)
+    LEFT OUTER JOIN payment_type pt ON (TRY_CAST(t.payment_type AS INT) = pt.payment_type)
+    {_JOIN_SQL}
+WHERE CAST(t.trip_year AS INT) >= 2015
+"""
+GREEN_TRANSFORM_SQL = f"""
+SELECT t.taxi_type, t.vendor_id, {_TRIP_SQL}
+    t.ehail_fee, t.improvement_surcharge, t.total_amount, t.payment_type, t.trip_type,
+    t.trip_year, t.trip_month, v.abbreviation AS vendor_abbreviation, v.description AS vendor_description,
+    tt.description AS trip_type_description,
+    {_LOOKUP_SQL} {_DERIVED_SQL.format(pickup_date="", dropoff_date="")}
+FROM trips t
+    LEFT OUTER JOIN vendor v ON (t.vendor_id = v.vendor_id)
+    LEFT OUTER JOIN trip_type tt ON (t.trip_type = tt.trip_type)
+    LEFT OUTER JOIN payment_type pt ON (t.payment_type = pt.payment_type)
+    {_JOIN_SQL}
+"""
+
+
+def _trips(taxi_type, trip_years, codes):
+    schema = arrow_schema(CANONICAL_SCHEMAS[taxi_type])
+    rows = len(codes) * len(trip_years)
+    pickups = [datetime(2016, 3, 1) + timedelta(minutes=37 * i, seconds=i) for i in range(rows)]
+    columns = {}
+    for field in schema:
+        if field.name == "pickup_datetime":
+            columns[field.name] = pickups
+        elif field.name == "dropoff_datetime":
+            columns[field.name] = [pickup + timedelta(hours=5) for pickup in pickups]
+        elif field.name in ("vendor_id", "payment_type"):
+            columns[field.name] = [code for _ in trip_years for code in codes]
+        elif field.name == "trip_year":
+            columns[field.name] = [str(year) for year in trip_years for _ in codes]
+        elif field.name == "trip_month":
+            columns[field.name] = ["03"] * rows
+        elif field.name.endswith("location_id"):
+            columns[field.name] = [[1, 7, 999, None][i % 4] for i in range(rows)]
+        elif field.name == "rate_code_id":
+            columns[field.name] = [[1, 6, 99][i % 3] for i in range(rows)]
+        else:
+            columns[field.name] = [_VALUES[field.type]] * rows
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def _assert_matches_sql(tmp_path, taxi_type, batch, sql):
+    write_reference_data(str(tmp_path))
+    reference = load_reference_data(str(tmp_path))
+    con = duckdb.connect()
+    for name, table in reference.items():
+        con.register(name, table)
+    con.register("trips", pa.Table.from_batches([batch]))
+    expected = con.execute(sql).arrow()
+    if isinstance(expected, pa.RecordBatchReader):
+        expected = expected.read_all()
+
+    enriched = Enricher(reference, taxi_type).enrich(batch)
+    assert enriched.schema.names == expected.schema.names
+    key = lambda row: row["pickup_datetime"]
+    assert sorted(enriched.to_pylist(), key=key) == sorted(expected.to_pylist(), key=key)
+
+
+def test_yellow_codes_match_the_transform_sql(tmp_path):
+    # Abbreviations resolve only before 2015; numeric codes the lookup misses are kept from 2015
+    codes = ["CMT", "VTS", "XYZ", "1", "2", "9", "01", None]
+    batch = _trips("yellow", [2014, 2016], codes)
+    _assert_matches_sql(tmp_path, "yellow", batch, YELLOW_TRANSFORM_SQL)
+
+    enriched = Enricher(load_reference_data(str(tmp_path)), "yellow").enrich(batch)
+    assert enriched.column("vendor_id").to_pylist() == [1, 2, None, None, None, None, None, None,
+                                                        None, None, None, 1, 2, 9, 1, None]
+
+
+def test_green_codes_match_the_transform_sql(tmp_path):
+    batch = _trips("green", [2016], [1, 2, 9, None])
+    _assert_matches_sql(tmp_path, "green", batch, GREEN_TRANSFORM_SQL)
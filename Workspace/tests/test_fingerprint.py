@@ -0,0 +1,27 @@
+import numpy as np
+import pyarrow as pa
+
+from NYCTaxi.fingerprint import _SEEDS, column_hash, fingerprint_array
+
+
+def test_128_bit_halves_hash_strings_independently():
+    rng = np.random.default_rng(3)
+    values = pa.array(sorted({f"{x:.6f}" for x in rng.uniform(-74, -73, 20000)}))
+    low_bits = np.uint64((1 << 20) - 1)
+    first = column_hash(values) & low_bits
+    second = column_hash(values, _SEEDS[1]) & low_bits
+
+    # Truncated to 20 bits the first hash collides a lot; the second half must not repeat those collisions
+    order = np.argsort(first, kind="stable")
+    colliding = np.flatnonzero(first[order][1:] == first[order][:-1])
+    assert len(colliding) > 50
+    left, right = order[colliding], order[colliding + 1]
+    assert not np.any(second[left] == second[right])
+
+
+def test_128_bit_low_half_is_the_64_bit_fingerprint():
+    batch = pa.record_batch({"vendor_id": ["CMT", None, "VTS"], "total_amount": [1.5, -0.0, None]})
+    assert fingerprint_array(batch).to_pylist() == [-6790181090054827815, -3821809065093122369, 4776336807146938144]
+    wide = fingerprint_array(batch, 128).to_pylist()
+    narrow = fingerprint_array(batch).to_numpy().astype(np.uint64)
+    assert [int.from_bytes(value[:8], "little") for value in wide] == narrow.tolist()
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pyarrow as pa
+
+from NYCTaxi.homogenize import Constant, Homogenizer
+
+
+def _batch(homogenizer, num_rows):
+    # Source batch of the homogenizer's month, every pickup inside it
+    arrays = [
+        pa.array([datetime(2010, 3, 1 + i % 28) for i in range(num_rows)], field.type)
+        if field.name == "pickup_datetime" else pa.nulls(num_rows, field.type)
+        for field in homogenizer.read_column_types
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=homogenizer.read_column_types)
+
+
+def test_constant_columns_do_not_grow_the_cache():
+    homogenizer = Homogenizer("yellow", 2010, 3)
+    constants = {name: spec.value for name, spec in homogenizer.mapping.items() if isinstance(spec, Constant)}
+    assert constants
+
+    sizes = set()
+    for num_rows in [5, 300, 17, 1000, 999, 1]:
+        batch = homogenizer.apply(_batch(homogenizer, num_rows))
+        assert batch.num_rows == num_rows
+        for name, value in constants.items():
+            assert batch.column(name).to_pylist() == [value] * num_rows
+        assert batch.column("trip_year").to_pylist() == ["2010"] * num_rows
+        sizes.add(len(homogenizer._constants))
+    assert sizes == {len(constants) + 2}
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from NYCTaxi.fake_warehouse import FakeWarehouse
+from NYCTaxi.query_cache import ResultCache, cached_sql_query, referenced_tables
+from NYCTaxi.report_runner import SUCCEEDED, CachedAdapter, ReportRunner
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("select extract(hour from pickup_datetime) as h, count(*) from nyctaxi.a group by 1", ["nyctaxi.a"]),
+    ("select substring(zone from 1 for 3), trim(both ' ' from zone) from nyctaxi.a", ["nyctaxi.a"]),
+    ("select * from nyctaxi.a, nyctaxi.c where a.id = c.id", ["nyctaxi.a", "nyctaxi.c"]),
+    ("select * from nyctaxi.a x, `cat`.`nyctaxi`.c as y join nyctaxi.d on x.id = d.id", ["cat.nyctaxi.c", "nyctaxi.a", "nyctaxi.d"]),
+    ("select * from a left join (select * from b, c) z on a.id = z.id", ["a", "b", "c"]),
+    ("with m as (select * from a), n as (select * from m) select * from n, unnest(n.ids) u", ["a"]),
+    ("select 'from x' as s from a where zone = 'join y'", ["a"]),
+])
+def test_referenced_tables(sql, tables):
+    assert referenced_tables(sql) == tables
+
+
+def _cached(tmp_path, versions, executed):
+    def execute(w, query, warehouse_id):
+        executed.append(query)
+        return pd.DataFrame({"n": [len(executed)]})
+
+    def table_version(table):
+        return versions[table]
+
+    return cached_sql_query(execute, ResultCache(str(tmp_path / "cache")), table_version, version_ttl_seconds=0)
+
+
+def test_comma_joined_table_change_invalidates(tmp_path):
+    versions = {"nyctaxi.a": "1", "nyctaxi.c": "1"}
+    executed = []
+    execute_sql_query = _cached(tmp_path, versions, executed)
+    sql = "select count(*) from nyctaxi.a, nyctaxi.c where a.id = c.id"
+
+    execute_sql_query(None, sql, "wh")
+    execute_sql_query(None, sql, "wh")
+    assert len(executed) == 1
+    versions["nyctaxi.c"] = "2"
+    assert execute_sql_query(None, sql, "wh")["n"].tolist() == [2]
+
+
+def test_failed_version_lookup_runs_uncached(tmp_path):
+    executed = []
+    execute_sql_query = _cached(tmp_path, {}, executed)
+    sql = "select count(*) from nyctaxi.unversioned"
+
+    for _ in range(2):
+        assert execute_sql_query(None, sql, "wh")["n"].tolist() == [len(executed)]
+    assert len(executed) == 2 and execute_sql_query.cache.entries == {}
+
+    adapter = CachedAdapter(FakeWarehouse(0.0, 0.0, execute=lambda sql: pd.DataFrame({"n": [1]})), execute_sql_query)
+    result = ReportRunner(adapter).run_all({"q": sql})["q"]
+    assert result.state == SUCCEEDED and result.df["n"].tolist() == [1]
+    assert execute_sql_query.cache.entries == {}
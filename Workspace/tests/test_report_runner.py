@@ -0,0 +1,84 @@
+import pandas as pd
+
+from NYCTaxi.fake_warehouse import FakeWarehouse
+from NYCTaxi.query_cache import ResultCache, cached_sql_query, local_table_version
+from NYCTaxi.report_queries import REPORT_QUERIES
+from NYCTaxi.report_runner import SUCCEEDED, TIMED_OUT, CachedAdapter, ReportRunner
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _execute(sql):
+    return pd.DataFrame({"sql_length": [len(sql)]})
+
+
+def _not_executed(**kwargs):
+    raise AssertionError(f"Executed {kwargs['query']}")
+
+
+def test_cached_adapter_answers_a_rerun_from_the_cache(tmp_path):
+    execute_sql_query = cached_sql_query(
+        _not_executed,
+        ResultCache(str(tmp_path / "cache")),
+        local_table_version(str(tmp_path / "mat_view")),
+    )
+    queries = {name: sql for name, (_, sql) in REPORT_QUERIES.items()}
+
+    results = []
+    for _ in range(2):
+        clock = FakeClock()
+        warehouse = FakeWarehouse(0.5, 2.0, execute=_execute, clock=clock)
+        adapter = CachedAdapter(warehouse, execute_sql_query)
+        runner = ReportRunner(adapter, clock=clock, sleep=clock.sleep)
+        results.append((runner.run_all(queries), warehouse, adapter))
+
+    (first, first_warehouse, first_adapter), (second, second_warehouse, second_adapter) = results
+    assert len(first_warehouse.statements) == len(queries) and first_adapter.hits == 0
+    assert len(second_warehouse.statements) == 0 and second_adapter.hits == len(queries)
+    for name, sql in queries.items():
+        assert second[name].state == SUCCEEDED
+        pd.testing.assert_frame_equal(second[name].df, _execute(sql))
+    # The notebook cells' execute_sql_query sees the runner's entries too
+    pd.testing.assert_frame_equal(execute_sql_query(query=queries["revenue_by_taxi_type"]),
+                                  _execute(queries["revenue_by_taxi_type"]))
+
+
+class UncancelableWarehouse(FakeWarehouse):
+    def cancel(self, statement_id):
+        raise RuntimeError("connection reset")
+
+
+def test_failed_cancel_still_times_out():
+    clock = FakeClock()
+    warehouse = UncancelableWarehouse(latency=lambda sql: 60.0 if "slow" in sql else 1.0, clock=clock)
+    runner = ReportRunner(warehouse, timeout_seconds=10, clock=clock, sleep=clock.sleep)
+    results = runner.run_all({"slow": "select 'slow'", "fast": "select 1"})
+    assert results["fast"].state == SUCCEEDED
+    assert results["slow"].state == TIMED_OUT
+    assert results["slow"].error == "Timed out after 10 seconds (cancel failed: connection reset)"
+
+
+class ParameterWarehouse(FakeWarehouse):
+    def submit(self, sql, parameters=None):
+        self.parameters = getattr(self, "parameters", []) + [parameters]
+        return super().submit(sql)
+
+
+def test_parameters_are_passed_to_the_adapter():
+    warehouse = ParameterWarehouse(0.0, 0.0, execute=_execute)
+    zones = {"pickup_zone": "Governor's Island", "dropoff_zone": 'Upper "East" Side'}
+    results = ReportRunner(warehouse).run_all(
+        {"report": "select 1", "drill_down": "select * from trips where pickup_zone=:pickup_zone"},
+        parameters={"drill_down": zones},
+    )
+    assert [result.state for result in results.values()] == [SUCCEEDED, SUCCEEDED]
+    assert warehouse.parameters == [None, zones]
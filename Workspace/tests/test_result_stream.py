@@ -0,0 +1,100 @@
+import time
+
+import pyarrow as pa
+import pytest
+
+from NYCTaxi.fake_warehouse import FakeWarehouse
+from NYCTaxi.query_cache import ResultCache, cached_sql_query, local_table_version
+from NYCTaxi.report_runner import FAILED, SUCCEEDED, CachedAdapter, ReportRunner
+from NYCTaxi.result_stream import ChunkedResultAdapter, ResultStream
+
+ROWS = 100_000
+CHUNK_ROWS = 5_000
+
+
+def _trips(sql):
+    return pa.table({
+        "trip_id": pa.array(range(ROWS), pa.int64()),
+        "total_amount": pa.array([float(i % 97) for i in range(ROWS)]),
+    })
+
+
+def _stream(memory_budget_bytes, chunk_latency_seconds=0.0):
+    warehouse = FakeWarehouse(0.0, 0.0, execute=_trips, chunk_rows=CHUNK_ROWS,
+                              chunk_latency_seconds=chunk_latency_seconds)
+    fetched = []
+    fetch_chunk = warehouse.fetch_chunk
+
+    def recording_fetch_chunk(statement_id, chunk_index):
+        fetched.append(chunk_index)
+        return fetch_chunk(statement_id, chunk_index)
+
+    warehouse.fetch_chunk = recording_fetch_chunk
+    result = next(ReportRunner(ChunkedResultAdapter(warehouse, memory_budget_bytes)).run({"drill_down": "select *"}))
+    assert result.state == SUCCEEDED and isinstance(result.df, ResultStream)
+    return result.df, fetched
+
+
+def _chunk_bytes():
+    stream, _ = _stream(1)
+    next(iter(stream))
+    return stream.bytes_fetched
+
+
+@pytest.mark.parametrize("chunks_in_budget", [1, 3])
+def test_slow_consumer_stays_within_the_memory_budget(chunks_in_budget):
+    budget = chunks_in_budget * _chunk_bytes()
+    stream, fetched = _stream(budget, chunk_latency_seconds=0.001)
+    trip_ids = []
+    for batch in stream:
+        # A consumer slower than the downloads: the prefetch thread has to wait for it
+        time.sleep(0.002)
+        trip_ids.extend(batch.column("trip_id").to_pylist())
+
+    assert trip_ids == list(range(ROWS))
+    assert fetched == list(range(ROWS // CHUNK_ROWS))
+    assert stream.chunks_read == ROWS // CHUNK_ROWS and stream.rows == ROWS
+    assert 0 < stream.peak_buffered_bytes <= budget
+
+
+def test_one_chunk_is_held_however_small_the_budget():
+    stream, fetched = _stream(1)
+    assert sum(batch.num_rows for batch in stream) == ROWS
+    assert stream.peak_buffered_bytes == _chunk_bytes()
+    assert fetched == list(range(ROWS // CHUNK_ROWS))
+
+
+def test_to_pandas_refuses_a_result_over_the_budget():
+    stream, _ = _stream(4 * _chunk_bytes())
+    with pytest.raises(ValueError, match="memory budget"):
+        stream.to_pandas()
+
+    stream, _ = _stream(ROWS * 64)
+    df = stream.to_pandas()
+    assert df["trip_id"].tolist() == list(range(ROWS))
+
+
+def test_cached_adapter_caches_a_streamed_result_within_the_budget(tmp_path):
+    # The Report notebooks' runner: stream adapter under the result cache
+    execute_sql_query = cached_sql_query(
+        lambda **kwargs: None,
+        ResultCache(str(tmp_path / "cache")),
+        local_table_version(str(tmp_path / "mat_view")),
+    )
+    chunk_bytes = _chunk_bytes()
+    queries = {"trips": "select * from taxi_trips_mat_view"}
+
+    def run(memory_budget_bytes):
+        warehouse = FakeWarehouse(0.0, 0.0, execute=_trips, chunk_rows=CHUNK_ROWS)
+        adapter = CachedAdapter(ChunkedResultAdapter(warehouse, memory_budget_bytes), execute_sql_query)
+        return ReportRunner(adapter).run_all(queries)["trips"], warehouse
+
+    over_budget, _ = run(4 * chunk_bytes)
+    assert over_budget.state == FAILED and "memory budget" in over_budget.error
+
+    within_budget, _ = run(ROWS * 64)
+    assert within_budget.state == SUCCEEDED
+    assert within_budget.df["trip_id"].tolist() == list(range(ROWS))
+
+    rerun, warehouse = run(ROWS * 64)
+    assert rerun.df["trip_id"].tolist() == list(range(ROWS)) and warehouse.chunks_fetched == 0
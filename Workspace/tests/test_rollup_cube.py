@@ -0,0 +1,106 @@
+import os
+import re
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from NYCTaxi.fake_warehouse import FakeWarehouse
+from NYCTaxi.query_cache import ResultCache, cached_sql_query, local_table_version
+from NYCTaxi.report_queries import REPORT_QUERIES
+from NYCTaxi.report_runner import SUCCEEDED, CachedAdapter, CubeAdapter, ReportRunner
+from NYCTaxi.rollup_cube import CELLS_SQL, RollupCube, _same_result
+
+
+def _mat_view(tmp_path):
+    partition_dir = tmp_path / "taxi_type=green" / "trip_year=2016" / "trip_month=03"
+    os.makedirs(partition_dir)
+    pq.write_table(pa.table({
+        "total_amount": [0.0, 0.0, 12.5, 0.0],
+        "trip_distance": [0.0, 1.2, 2.5, 0.3],
+        "tip_amount": [0.0, 0.0, 2.0, 0.0],
+        "fare_amount": [0.0, 3.0, 9.0, 0.0],
+        "payment_type_description": ["No charge", "Cash", "Credit card", "No charge"],
+    }), os.path.join(partition_dir, "part-00000.parquet"))
+    cube = RollupCube(str(tmp_path))
+    cube.refresh()
+    return cube
+
+
+def test_string_literals_keep_their_case(tmp_path):
+    cube = _mat_view(tmp_path)
+    sql = """
+SELECT taxi_type, COUNT(*) AS transactions
+FROM taxi_trips_mat_view
+WHERE Payment_Type_Description = 'No charge' -- don't lowercase 'No charge'
+  AND total_amount = 0.0
+GROUP BY Taxi_Type
+"""
+    df = cube.answer(sql)
+    assert df.to_dict("list") == {"taxi_type": ["green"], "transactions": [2]}
+    # Literal comparisons are case-sensitive, so the cube's 'No charge' count does not answer these
+    assert cube.answer(sql.replace("'No charge'", "'no charge'")) is None
+    assert cube.answer(sql.replace("'No charge'", "'NO CHARGE'")) is None
+
+
+def _report_mat_view(tmp_path):
+    rng = np.random.default_rng(7)
+    for taxi_type, trip_year, trip_month in [("yellow", 2015, 12), ("yellow", 2016, 1), ("yellow", 2016, 2),
+                                             ("green", 2016, 1), ("green", 2016, 2)]:
+        partition_dir = tmp_path / f"taxi_type={taxi_type}" / f"trip_year={trip_year}" / f"trip_month={trip_month:02d}"
+        os.makedirs(partition_dir)
+        rows = int(rng.integers(50, 100))
+        payment = rng.choice(["Credit card", "Cash", "No charge"], rows)
+        total = np.where(payment == "No charge", 0.0, rng.uniform(3, 60, rows).round(2))
+        pq.write_table(pa.table({
+            "total_amount": total,
+            "trip_distance": rng.uniform(0, 20, rows).round(2),
+            "tip_amount": np.where(rng.random(rows) < 0.4, 0.0, rng.uniform(0, 10, rows).round(2)),
+            "fare_amount": (total * 0.8).round(2),
+            "payment_type_description": payment,
+        }), os.path.join(partition_dir, "part-00000.parquet"))
+
+
+def test_notebook_runner_answers_from_the_cube(tmp_path):
+    mat_view_dir = tmp_path / "mat_view"
+    _report_mat_view(mat_view_dir)
+    con = duckdb.connect()
+    files = os.path.join(str(mat_view_dir), "taxi_type=*", "trip_year=*", "trip_month=*", "*.parquet")
+    con.execute(f"""
+        CREATE VIEW taxi_trips_mat_view AS
+        SELECT * FROM read_parquet('{files}', hive_partitioning = true,
+                                   hive_types = {{'trip_year': INTEGER, 'trip_month': VARCHAR}})
+    """)
+
+    def warehouse_execute(sql):
+        if "taxi_trips_mat_view" not in sql:
+            return pd.DataFrame({"rows": [0]})
+        return con.execute(re.sub(r"[\w.`]*taxi_trips_mat_view", "taxi_trips_mat_view", sql)).fetchdf()
+
+    execute_sql_query = cached_sql_query(
+        lambda **kwargs: None, ResultCache(str(tmp_path / "cache")), local_table_version(str(mat_view_dir)),
+    )
+    warehouse = FakeWarehouse(0.0, 0.0, execute=warehouse_execute)
+    cached_adapter = CachedAdapter(warehouse, execute_sql_query)
+
+    # The Report notebooks' runner cell: cube cells from the warehouse, then the cube ahead of it
+    cube_cells = ReportRunner(cached_adapter).run_all({"cube_cells": CELLS_SQL})["cube_cells"]
+    cube = RollupCube.from_dataframe(cube_cells.df)
+    local_cube = RollupCube(str(mat_view_dir))
+    local_cube.refresh()
+    assert _same_result(local_cube.to_dataframe(), cube.to_dataframe())
+
+    adapter = CubeAdapter(cube, cached_adapter)
+    queries = {name: sql for name, (_, sql) in REPORT_QUERIES.items()}
+    results = ReportRunner(adapter).run_all(queries)
+
+    unanswerable = ["trips_by_payment_type", "yellow_trips_by_pickup_hour_2016", "top_yellow_zone_pairs_2016"]
+    submitted = [statement["sql"] for statement in warehouse.statements.values()]
+    assert submitted == [CELLS_SQL] + [queries[name] for name in unanswerable]
+    assert adapter.hits == len(queries) - len(unanswerable)
+    for name, sql in queries.items():
+        assert results[name].state == SUCCEEDED
+        if name not in unanswerable:
+            assert _same_result(warehouse_execute(sql), results[name].df), name
@@ -0,0 +1,24 @@
+import time
+
+import numpy as np
+import pytest
+
+from NYCTaxi.run_metrics import MemorySampler, current_memory_bytes
+
+
+def _hold(num_bytes, seconds=0.1):
+    data = np.ones(num_bytes // 8)
+    time.sleep(seconds)
+    del data
+
+
+def test_memory_sampler_measures_each_block_alone():
+    if current_memory_bytes() is None:
+        pytest.skip("resident memory cannot be read on this platform")
+    with MemorySampler() as large:
+        _hold(256 * 1024 ** 2)
+    with MemorySampler() as small:
+        _hold(16 * 1024 ** 2)
+
+    # The large block's peak is not carried over into the next one, as the process peak would be
+    assert large.peak_bytes - small.peak_bytes > 128 * 1024 ** 2
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime, timedelta
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from NYCTaxi.matview import MatView
+from NYCTaxi.virtual_columns import add_virtual_columns, create_duckdb_view, read_table
+
+
+def _write_source(table_dir, hour):
+    # One trip_year=2016/trip_month=01 partition of an enriched table, derived columns stored
+    pickups = [datetime(2016, 1, 1 + i, hour, i) for i in range(5)]
+    table = add_virtual_columns(pa.table({
+        "vendor_id": pa.array([1, 2, 1, 2, 1], pa.int32()),
+        "pickup_datetime": pa.array(pickups, pa.timestamp("us")),
+        "dropoff_datetime": pa.array([p + timedelta(minutes=20) for p in pickups], pa.timestamp("us")),
+        "total_amount": pa.array([10.0, 11.0, 12.0, 13.0, 14.0]),
+    }))
+    partition_dir = os.path.join(table_dir, "trip_year=2016", "trip_month=01")
+    os.makedirs(partition_dir)
+    pq.write_table(table, os.path.join(partition_dir, "part-00000.parquet"))
+
+
+def _mixed_mat_view(tmp_path):
+    sources = {"yellow": str(tmp_path / "yellow-taxi"), "green": str(tmp_path / "green-taxi")}
+    _write_source(sources["yellow"], 7)
+    _write_source(sources["green"], 18)
+    mat_view_dir = str(tmp_path / "mat_view")
+    MatView(mat_view_dir).refresh(sources)
+    # Switch only yellow to virtual columns; green keeps its stored ones
+    result = MatView(mat_view_dir, virtual_columns=True).refresh({"yellow": sources["yellow"]})
+    assert result["changed"] == ["taxi_type=yellow/trip_year=2016/trip_month=01"]
+    return mat_view_dir, sources
+
+
+def test_layout_is_recorded_per_partition(tmp_path):
+    mat_view_dir, sources = _mixed_mat_view(tmp_path)
+    layouts = {key: partition["virtual_columns"] for key, partition in MatView(mat_view_dir).partitions.items()}
+    assert layouts == {
+        "taxi_type=green/trip_year=2016/trip_month=01": False,
+        "taxi_type=yellow/trip_year=2016/trip_month=01": True,
+    }
+    assert pq.read_schema(os.path.join(mat_view_dir, "taxi_type=yellow", "trip_year=2016", "trip_month=01",
+                                       "part-00000.parquet")).get_field_index("pickup_hour") == -1
+
+    mat_view = MatView(mat_view_dir, virtual_columns=True)
+    assert mat_view.refresh({"yellow": sources["yellow"]})["changed"] == []
+    assert mat_view.refresh(sources)["changed"] == ["taxi_type=green/trip_year=2016/trip_month=01"]
+
+
+def test_read_table_mixed_layouts(tmp_path):
+    mat_view_dir, _ = _mixed_mat_view(tmp_path)
+    table = read_table(mat_view_dir, ["taxi_type", "pickup_hour", "dropoff_date"]).sort_by("taxi_type")
+    assert table.column("pickup_hour").null_count == 0
+    assert table.column("pickup_hour").to_pylist() == [18] * 5 + [7] * 5
+    assert table.schema.field("pickup_hour").type == pa.int32()
+
+    yellow = read_table(mat_view_dir, ["pickup_hour"], filter=pc.field("taxi_type") == "yellow")
+    assert yellow.column("pickup_hour").to_pylist() == [7] * 5
+
+
+def test_duckdb_view_mixed_layouts(tmp_path):
+    mat_view_dir, _ = _mixed_mat_view(tmp_path)
+    con = duckdb.connect()
+    create_duckdb_view(con, "taxi_trips_mat_view", mat_view_dir)
+    rows = con.execute(
+        "SELECT taxi_type, pickup_hour, count(*), count(dropoff_date) FROM taxi_trips_mat_view GROUP BY ALL ORDER BY 1"
+    ).fetchall()
+    assert rows == [("green", 18, 5, 5), ("yellow", 7, 5, 5)]
@@ -0,0 +1,92 @@
+import base64
+import json
+import posixpath
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jupyter_to_databricks import bulk_main
+
+
+class StubWorkspace(BaseHTTPRequestHandler):
+    """The workspace mkdirs and import APIs, over keep-alive HTTP/1.1, with the import calls recorded."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            if self.headers.get("Authorization") != "Bearer stub-token":
+                status, body = 401, {"error_code": "UNAUTHENTICATED", "message": "Bad token"}
+            elif self.path == "/api/2.0/workspace/mkdirs":
+                path = payload["path"]
+                while path != "/":
+                    server.folders.add(path)
+                    path = posixpath.dirname(path)
+                status, body = 200, {}
+            elif self.path == "/api/2.0/workspace/import":
+                if posixpath.dirname(payload["path"]) not in server.folders:
+                    status, body = 404, {"error_code": "RESOURCE_DOES_NOT_EXIST", "message": "Parent folder missing"}
+                else:
+                    server.imports.append(payload["path"])
+                    server.files[payload["path"]] = base64.b64decode(payload["content"]).decode()
+                    status, body = 200, {}
+            else:
+                status, body = 404, {"error_code": "ENDPOINT_NOT_FOUND", "message": self.path}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def workspace():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWorkspace)
+    server.lock = threading.Lock()
+    server.folders = {"/"}
+    server.imports = []
+    server.files = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _write_notebook(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"cells": [
+        {"cell_type": "markdown", "source": ["# Title"]},
+        {"cell_type": "code", "source": [text]},
+    ]}))
+
+
+def test_bulk_upload_imports_each_notebook_once(workspace, tmp_path):
+    src_dir = tmp_path / "jupyter-notebook"
+    names = ["gcp/analytics/Report", "azure/analytics/Report", "gcp/ingest/Load", "Overview"]
+    for name in names:
+        _write_notebook(src_dir / f"{name}.ipynb", f"print({name!r})")
+    argv = [
+        str(src_dir), "--upload", "/Workspace/NYCTaxi/jupyter-notebook",
+        "--host", f"http://127.0.0.1:{workspace.server_port}", "--token", "stub-token",
+        "--state", str(tmp_path / "sync_state.json"), "--max-connections", "2",
+    ]
+
+    bulk_main(argv)
+    expected = sorted(f"/NYCTaxi/jupyter-notebook/{name}" for name in names)
+    assert sorted(workspace.imports) == expected
+    assert workspace.files["/NYCTaxi/jupyter-notebook/Overview"].startswith("# Databricks notebook source")
+
+    bulk_main(argv)
+    assert sorted(workspace.imports) == expected
+
+    _write_notebook(src_dir / "gcp/ingest/Load.ipynb", "print('changed')")
+    bulk_main(argv)
+    assert sorted(workspace.imports) == sorted(expected + ["/NYCTaxi/jupyter-notebook/gcp/ingest/Load"])
@@ -0,0 +1,63 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from NYCTaxi.zones import ZoneIndex, assign_zones, brute_force_lookup
+
+
+def _rect(x0, y0, x1, y1):
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]], dtype=np.float64)
+
+
+def _zones():
+    # 1: square with a hole, plus an island inside that hole (multipolygon)
+    # 2: fills the hole around the island
+    # 3 and 4: rectangles sharing the horizontal edge y=1.3, next to zone 1
+    return [
+        (1, [_rect(0.0, 0.0, 1.0, 1.0), _rect(0.3, 0.3, 0.7, 0.7)[::-1], _rect(0.45, 0.45, 0.52, 0.52)]),
+        (2, [_rect(0.3, 0.3, 0.7, 0.7), _rect(0.45, 0.45, 0.52, 0.52)[::-1]]),
+        (3, [_rect(1.5, 1.0, 2.5, 1.3)]),
+        (4, [_rect(1.5, 1.3, 2.5, 1.6)]),
+    ]
+
+
+@pytest.mark.parametrize("grid_size", [4, 16, 64, 512])
+def test_lookup_matches_brute_force(grid_size):
+    zones = _zones()
+    index = ZoneIndex(zones, grid_size)
+    rng = np.random.default_rng(grid_size)
+    longitudes = rng.uniform(-0.1, 2.6, 50_000)
+    latitudes = rng.uniform(-0.1, 1.7, 50_000)
+    expected = brute_force_lookup(zones, longitudes, latitudes)
+    np.testing.assert_array_equal(index.lookup(longitudes, latitudes), expected)
+
+
+def test_cell_split_by_horizontal_edge():
+    zones = [(1, [_rect(0.0, 1.0, 4.0, 1.3)]), (2, [_rect(0.0, 1.3, 4.0, 2.0)])]
+    index = ZoneIndex(zones, 4)
+    np.testing.assert_array_equal(index.lookup([2.0, 2.0], [1.27, 1.45]), [1, 2])
+
+
+def test_island_only_cell_keeps_enclosing_zone():
+    zones = _zones()
+    index = ZoneIndex(zones, 64)
+    # Inside zone 2 next to the island, and inside the island (zone 1)
+    np.testing.assert_array_equal(index.lookup([0.44, 0.48], [0.48, 0.48]), [2, 1])
+
+
+def test_missing_and_outside_points_are_zero():
+    index = ZoneIndex(_zones(), 16)
+    np.testing.assert_array_equal(index.lookup([np.nan, 0.1, 5.0], [0.5, 0.1, 5.0]), [0, 1, 0])
+
+
+def test_assign_zones_parses_string_coordinates_leniently():
+    index = ZoneIndex(_zones(), 16)
+    batch = pa.record_batch({
+        "pickup_location_id": pa.array([0, 0, 0, 0, 0, 7, None], pa.int32()),
+        "pickup_longitude": ["0.1", " 2.0 ", "x", "", None, "0.1", "1e-1"],
+        "pickup_latitude": ["0.1", "1.45", "0.1", "0.1", "0.1", "0.1", "0.1"],
+    })
+    filled = assign_zones(batch, index)
+    # Bad coordinates get zone 0 instead of failing the batch; set ids are kept
+    assert filled.column("pickup_location_id").to_pylist() == [1, 4, 0, 0, 0, 7, 1]
+    assert filled.schema == batch.schema
@@ -0,0 +1,340 @@
+"""
+Bulk notebook conversion and Databricks workspace sync, in one process.
+
+``sync_all_notebooks.sh`` used to call ``sync_notebook.sh`` per notebook,
+which re-read ``~/.databrickscfg``, started a Python interpreter for the
+conversion and opened a new HTTPS connection for the upload, every time.
+Here a whole tree is handled in one process:
+
+- ``~/.databrickscfg`` is parsed once (``read_databricks_config``)
+- files are converted on a thread pool (``convert_tree``)
+- files whose content hash matches the last successful run are skipped; the
+  hashes are kept in a JSON state file (``SyncState``)
+- uploads go through ``WorkspaceImporter``, a pool of keep-alive HTTP
+  connections with at most ``max_connections`` requests in flight; the
+  folders of the files to import are created first, one mkdirs per folder
+
+Used by the ``--bulk`` modes of jupyter_to_databricks.py and
+databricks_to_jupyter.py.
+"""
+
+import base64
+import configparser
+import hashlib
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+STATE_VERSION = 1
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_SYNC_STATE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nyctaxi", "workspace_sync_state.json")
+
+
+def read_databricks_config(profile="DEFAULT", path=None):
+    """
+    Host and token of a ~/.databrickscfg profile.
+
+    Returns:
+        (host, token)
+    """
+    path = path or os.path.join(os.path.expanduser("~"), ".databrickscfg")
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found; run 'databricks configure --token' to set up your credentials"
+        )
+    config = configparser.ConfigParser()
+    config.read(path)
+    # configparser exposes [DEFAULT] as defaults() rather than as a section
+    section = config.defaults() if profile == "DEFAULT" else config[profile]
+    host, token = section.get("host"), section.get("token")
+    if not host or not token:
+        raise ValueError(f"Profile {profile} in {path} needs both host and token")
+    return host.strip(), token.strip()
+
+
+def content_hash(path):
+    """SHA-256 of a file's bytes."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def workspace_path(path):
+    """Normalize a remote path the way sync_notebook.sh does: leading slash, no /Workspace prefix."""
+    if not path.startswith("/"):
+        path = "/" + path
+    if path.startswith("/Workspace/") or path == "/Workspace":
+        path = path[len("/Workspace"):] or "/"
+    return path
+
+
+class SyncState:
+    """
+    Content hashes of the files handled by the last successful runs.
+
+    Usage:
+        state = SyncState(state_path)
+        if not state.is_current(key, digest):
+            ...
+            state.record(key, digest)
+        state.save()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            return {}
+        return state["entries"]
+
+    def is_current(self, key, digest):
+        return self.entries.get(key, {}).get("hash") == digest
+
+    def record(self, key, digest):
+        with self._lock:
+            self.entries[key] = {"hash": digest, "synced_at": time.time()}
+
+    def save(self):
+        """Write the state atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self._lock, open(tmp_path, "w") as f:
+            json.dump({"version": STATE_VERSION, "entries": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class WorkspaceImporter:
+    """
+    Client for the workspace import API over a pool of keep-alive connections.
+
+    Connections are reused across requests and threads; at most
+    max_connections requests are in flight at once.
+
+    Usage:
+        importer = WorkspaceImporter(host, token, max_connections=4)
+        importer.import_source("/NYCTaxi/Report", content, "PYTHON")
+        importer.close()
+    """
+
+    def __init__(self, host, token, max_connections=DEFAULT_MAX_CONNECTIONS, timeout=60):
+        url = urlsplit(host if "://" in host else f"https://{host}")
+        self.host = f"{url.scheme}://{url.netloc}"
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.base_path = url.path.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.connections_opened = 0
+        self.requests = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._counter_lock = threading.Lock()
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        with self._counter_lock:
+            self.connections_opened += 1
+        return connection_class(self.netloc, timeout=self.timeout)
+
+    def post(self, path, payload):
+        """
+        POST a JSON payload to an API path.
+
+        Returns:
+            Decoded JSON response
+
+        Raises:
+            RuntimeError: The API returned an error status
+        """
+        body = json.dumps(payload)
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                # A pooled connection the server has since closed fails on first use; retry once on a new one
+                for attempt in range(2):
+                    try:
+                        connection.request("POST", self.base_path + path, body=body, headers=headers)
+                        response = connection.getresponse()
+                        data = response.read()
+                        break
+                    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                        connection.close()
+                        if attempt:
+                            raise
+                        connection = self._connect()
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._idle.put(connection)
+        with self._counter_lock:
+            self.requests += 1
+
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            result = {}
+        if response.status >= 300 or "error_code" in result:
+            raise RuntimeError(f"{path} returned {response.status}: {data.decode(errors='replace')}")
+        return result
+
+    def import_source(self, remote_path, content, language):
+        """Import (overwrite) a notebook or file in SOURCE format."""
+        return self.post("/api/2.0/workspace/import", {
+            "path": workspace_path(remote_path),
+            "format": "SOURCE",
+            "language": language,
+            "overwrite": True,
+            "content": base64.b64encode(content.encode()).decode(),
+        })
+
+    def mkdirs(self, remote_dir):
+        """Create a workspace folder and its parents; a no-op for existing ones."""
+        return self.post("/api/2.0/workspace/mkdirs", {"path": workspace_path(remote_dir)})
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def find_files(src_dir, suffix):
+    """Paths of the files under src_dir ending with suffix, relative to src_dir, sorted."""
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(src_dir):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith("."))
+        for name in sorted(file_names):
+            if name.endswith(suffix):
+                paths.append(os.path.relpath(os.path.join(dir_path, name), src_dir))
+    return paths
+
+
+def _run_pool(tasks, workers):
+    # Run (name, function) tasks on a thread pool; returns the failures as (name, error)
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(function): name for name, function in tasks}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failures.append((futures[future], str(e)))
+    return sorted(failures)
+
+
+def convert_tree(src_dir, dest_dir, convert, src_suffix, dest_suffix, workers=DEFAULT_WORKERS, force=False):
+    """
+    Convert every file of a tree, skipping those unchanged since the last run.
+
+    Args:
+        src_dir: Tree of files to convert
+        dest_dir: Output tree; gets the same layout and a .convert_state.json
+        convert: Function of (input_path, output_path) writing the converted file
+        src_suffix: Suffix of the files to convert, e.g. ".ipynb"
+        dest_suffix: Suffix replacing it in the output, e.g. ".py"
+        workers: Threads converting at once
+        force: Convert every file regardless of the state
+
+    Returns:
+        Dict with the converted and skipped relative paths, failures and elapsed seconds
+    """
+    start_time = time.time()
+    state = SyncState(os.path.join(dest_dir, ".convert_state.json"))
+    converted, skipped, tasks = [], [], []
+
+    for rel_path in find_files(src_dir, src_suffix):
+        src_path = os.path.join(src_dir, rel_path)
+        dest_path = os.path.join(dest_dir, rel_path[:-len(src_suffix)] + dest_suffix)
+        digest = content_hash(src_path)
+        if not force and state.is_current(rel_path, digest) and os.path.exists(dest_path):
+            skipped.append(rel_path)
+            continue
+
+        def task(src_path=src_path, dest_path=dest_path, rel_path=rel_path, digest=digest):
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            convert(src_path, dest_path)
+            state.record(rel_path, digest)
+            converted.append(rel_path)
+
+        tasks.append((rel_path, task))
+
+    try:
+        failures = _run_pool(tasks, workers)
+    finally:
+        state.save()
+    return {"converted": sorted(converted), "skipped": skipped, "failures": failures,
+            "seconds": time.time() - start_time}
+
+
+def sync_tree(src_dir, remote_dir, convert, importer, src_suffix, language,
+              state_path=DEFAULT_SYNC_STATE_PATH, workers=DEFAULT_WORKERS, force=False):
+    """
+    Convert and import every file of a tree into the workspace, skipping unchanged ones.
+
+    Args:
+        src_dir: Tree of files to sync
+        remote_dir: Workspace folder mirroring src_dir; files are imported without their suffix
+        convert: Function of an input path returning the SOURCE content to import
+        importer: WorkspaceImporter
+        src_suffix: Suffix of the files to sync, e.g. ".ipynb"
+        language: Workspace language of the files, e.g. "PYTHON"
+        state_path: JSON file with the hashes of the files last imported, per host and remote path
+        workers: Threads converting and uploading at once (uploads are further bounded by the importer)
+        force: Import every file regardless of the state
+
+    Returns:
+        Dict with the imported and skipped remote paths, failures and elapsed seconds
+    """
+    start_time = time.time()
+    state = SyncState(state_path)
+    imported, skipped, tasks = [], [], []
+
+    for rel_path in find_files(src_dir, src_suffix):
+        src_path = os.path.join(src_dir, rel_path)
+        remote_path = workspace_path(f"{remote_dir.rstrip('/')}/{rel_path[:-len(src_suffix)]}")
+        key = importer.host + remote_path
+        digest = content_hash(src_path)
+        if not force and state.is_current(key, digest):
+            skipped.append(remote_path)
+            continue
+
+        def task(src_path=src_path, remote_path=remote_path, key=key, digest=digest):
+            importer.import_source(remote_path, convert(src_path), language)
+            state.record(key, digest)
+            imported.append(remote_path)
+
+        tasks.append((remote_path, task))
+
+    # Import does not create missing parent folders; create each one once, up front
+    for remote_folder in sorted({os.path.dirname(remote_path) for remote_path, _ in tasks}):
+        importer.mkdirs(remote_folder)
+    try:
+        failures = _run_pool(tasks, workers)
+    finally:
+        state.save()
+    return {"imported": sorted(imported), "skipped": skipped, "failures": failures,
+            "seconds": time.time() - start_time}
@@ -2,11 +2,24 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os
 import pathlib
+import sys
 
 # Get the script directory and project root directory
 SCRIPT_DIR = pathlib.Path(__file__).parent.absolute()
 PROJECT_ROOT = SCRIPT_DIR.parent.absolute()
 
+sys.path.append(os.path.join(PROJECT_ROOT, 'Workspace'))
+from NYCTaxi.billing import BillingLedger
+from NYCTaxi.run_metrics import STAGES, latest_stage_minutes, load_records, run_summaries
+
+# Run-metrics store (JSONL, see Workspace/NYCTaxi/run_metrics.py): first argument,
+# else $NYCTAXI_RUN_METRICS, else ~/.cache/nyctaxi/run_metrics.jsonl
+run_records = load_records(sys.argv[1] if len(sys.argv) > 1 else None)
+
+# GCP billing ledger (JSON, see Workspace/NYCTaxi/billing.py): second argument, else $NYCTAXI_BILLING_LEDGER
+billing_ledger_path = sys.argv[2] if len(sys.argv) > 2 else os.environ.get('NYCTAXI_BILLING_LEDGER')
+billing_ledger = BillingLedger(billing_ledger_path) if billing_ledger_path else None
+
 # Create images directories if they don't exist
 os.makedirs(os.path.join(PROJECT_ROOT, 'images/comparison'), exist_ok=True)
 
@@ -31,6 +44,16 @@ snowflake_storage_cost = 1.031  # daily snowflake storage cost (0.59 + 0.441 for
 snowflake_egress_gcp_cost = 6.37  # egress copy from GCP cost per run
 snowflake_transform_cost = 38.0  # transform data cost per run
 
+# Billed costs replace the GCP values above, category by category: per-run costs from the
+# latest labeled run, daily costs (storage) from the latest billed day
+if billing_ledger:
+    gcp_billed_run_costs = billing_ledger.latest_run_category_costs()
+    gcp_copy_data_cost = gcp_billed_run_costs.get('copy_data', gcp_copy_data_cost)
+    gcp_compute_vm_cost = gcp_billed_run_costs.get('compute_vm', gcp_compute_vm_cost)
+    gcp_compute_databricks_cost = gcp_billed_run_costs.get('compute_databricks', gcp_compute_databricks_cost)
+    gcp_transform_cost = gcp_billed_run_costs.get('transform', gcp_transform_cost)
+    gcp_storage_cost = billing_ledger.latest_day_category_costs().get('storage', gcp_storage_cost)
+
 
 # Calculate total costs (including copy data/egress)
 azure_total_with_copy_data_cost = azure_storage_cost + azure_copy_data_cost + azure_compute_vm_cost + azure_compute_databricks_cost
@@ -56,6 +79,17 @@ gcp_convert_time = 91.0  # Convert CSV to Parquet (91min)
 gcp_transform_time = 1.62  # Transform (1min 37s)
 gcp_materialize_time = 1.05  # Materialize (1min 3s)
 
+# Recorded runs replace the values above, stage by stage, with the latest run's timings
+azure_recorded_minutes = latest_stage_minutes(run_records, 'azure')
+azure_convert_time = azure_recorded_minutes.get('convert', azure_convert_time)
+azure_transform_time = azure_recorded_minutes.get('transform', azure_transform_time)
+azure_materialize_time = azure_recorded_minutes.get('materialize', azure_materialize_time)
+
+gcp_recorded_minutes = latest_stage_minutes(run_records, 'gcp')
+gcp_convert_time = gcp_recorded_minutes.get('convert', gcp_convert_time)
+gcp_transform_time = gcp_recorded_minutes.get('transform', gcp_transform_time)
+gcp_materialize_time = gcp_recorded_minutes.get('materialize', gcp_materialize_time)
+
 # Calculate total execution times
 azure_total_time = azure_convert_time + azure_transform_time + azure_materialize_time
 gcp_total_time = gcp_convert_time + gcp_transform_time + gcp_materialize_time
@@ -136,7 +170,10 @@ plt.pie(gcp_bigquery_sizes, labels=gcp_bigquery_labels, colors=gcp_bigquery_colo
         autopct=make_autopct(gcp_bigquery_sizes),
         shadow=True, startangle=140, textprops={'fontsize': 12})
 plt.axis('equal')
-plt.title('GCP Cost Breakdown with BigQuery\nTotal: $38.31/run + $0.69/day', fontsize=14)
+gcp_bigquery_title_total = '$38.31/run + $0.69/day'
+if billing_ledger:
+    gcp_bigquery_title_total = f'${sum(gcp_bigquery_sizes[1:]):.2f}/run + ${gcp_storage_cost:.2f}/day'
+plt.title(f'GCP Cost Breakdown with BigQuery\nTotal: {gcp_bigquery_title_total}', fontsize=14)
 
 # Second subplot - GCP with Databricks SQL Warehouse
 plt.subplot(1, 2, 2)
@@ -150,7 +187,10 @@ plt.pie(gcp_databricks_sizes, labels=gcp_databricks_labels, colors=gcp_databrick
         autopct=make_autopct(gcp_databricks_sizes),
         shadow=True, startangle=140, textprops={'fontsize': 12})
 plt.axis('equal')
-plt.title('GCP Cost Breakdown with Databricks SQL\nTotal: $33.17/run + $0.69/day', fontsize=14)
+gcp_databricks_title_total = '$33.17/run + $0.69/day'
+if billing_ledger:
+    gcp_databricks_title_total = f'${sum(gcp_databricks_sizes[1:]):.2f}/run + ${gcp_storage_cost:.2f}/day'
+plt.title(f'GCP Cost Breakdown with Databricks SQL\nTotal: {gcp_databricks_title_total}', fontsize=14)
 
 plt.tight_layout()
 plt.savefig(os.path.join(PROJECT_ROOT, 'images/comparison/gcp-cost-breakdown.png'), dpi=300, bbox_inches='tight')
@@ -281,4 +321,47 @@ plt.tight_layout()
 plt.savefig(os.path.join(PROJECT_ROOT, 'images/comparison/transform-cost-comparison.png'), dpi=300, bbox_inches='tight')
 plt.close()
 
+# Trend of total run time across recorded runs, one line per platform
+runs = run_summaries(run_records)
+if runs:
+    plt.figure(figsize=(12, 7))
+    platform_colors = {'azure': '#EA4335', 'gcp': '#0078D4', 'snowflake': '#29B5E8', 'local': '#5F6368'}
+    for platform in sorted({run['platform'] for run in runs}):
+        platform_runs = [run for run in runs if run['platform'] == platform]
+        totals = [sum(run['stages'].get(stage, 0.0) for stage in STAGES) / 60 for run in platform_runs]
+        plt.plot([run['started_at'][:10] for run in platform_runs], totals, marker='o',
+                 label=platform.capitalize(), color=platform_colors.get(platform))
+    plt.xlabel('Run Date', fontsize=14)
+    plt.ylabel('Total Execution Time (Minutes)', fontsize=14)
+    plt.title('Pipeline Run Time Trend', fontsize=16)
+    plt.xticks(rotation=45, fontsize=10)
+    plt.yticks(fontsize=12)
+    plt.legend(fontsize=12)
+    plt.tight_layout()
+    plt.savefig(os.path.join(PROJECT_ROOT, 'images/comparison/run-time-trend.png'), dpi=300, bbox_inches='tight')
+    plt.close()
+
+    # Per-stage breakdown of the latest runs, stacked
+    latest_runs = runs[-12:]
+    plt.figure(figsize=(14, 8))
+    x = np.arange(len(latest_runs))
+    bottom = np.zeros(len(latest_runs))
+    stage_colors = ['#243a5e', '#0063B1', '#50e6ff']
+    for stage, color in zip(STAGES, stage_colors):
+        minutes = np.array([run['stages'].get(stage, 0.0) / 60 for run in latest_runs])
+        plt.bar(x, minutes, 0.6, bottom=bottom, label=stage.capitalize(), color=color)
+        bottom += minutes
+    plt.xlabel('Run', fontsize=14)
+    plt.ylabel('Execution Time (Minutes)', fontsize=14)
+    plt.title('Execution Time by Stage, Latest Runs', fontsize=16)
+    plt.xticks(x, [f"{run['platform']}\n{run['started_at'][:10]}" for run in latest_runs], fontsize=10)
+    plt.yticks(fontsize=12)
+    plt.legend(fontsize=12)
+    plt.ylim(0, max(bottom.max(), 1e-9) * 1.15)
+    for i, total in enumerate(bottom):
+        plt.text(i, total + bottom.max() * 0.02, f"{total:.2f}", ha='center', fontsize=10)
+    plt.tight_layout()
+    plt.savefig(os.path.join(PROJECT_ROOT, 'images/comparison/run-stage-breakdown.png'), dpi=300, bbox_inches='tight')
+    plt.close()
+
 print(f"All charts have been generated and saved to '{os.path.join(PROJECT_ROOT, 'images/comparison')}' directory.")
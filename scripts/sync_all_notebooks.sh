@@ -15,23 +15,11 @@ if [ ! -d "$SOURCE_DIR" ]; then
     exit 1
 fi
 
-# Create a function to sync a notebook
-sync_notebook() {
-    local notebook_path="$1"
-    local relative_path="${notebook_path#$SOURCE_DIR/}"
-    local dest_path="$DEST_DIR/$relative_path"
-    
-    # Remove the .ipynb extension for the destination path
-    dest_path="${dest_path%.ipynb}"
-    
-    echo "Syncing $notebook_path to $dest_path"
-    "$(dirname "$0")/sync_notebook.sh" "$notebook_path" "$dest_path"
-}
-
-# Find all notebooks and sync them
-echo "Finding notebooks in $SOURCE_DIR..."
-find "$SOURCE_DIR" -name "*.ipynb" | while read notebook_path; do
-    sync_notebook "$notebook_path"
-done
+# Convert and import the whole tree in one process: ~/.databrickscfg is read once,
+# uploads share keep-alive connections and notebooks unchanged since the last
+# sync are skipped. Extra arguments are passed through (e.g. --force, --profile,
+# --max-connections, --host for a local stub server).
+echo "Syncing notebooks in $SOURCE_DIR to $DEST_DIR..."
+python "$(dirname "$0")/../Workspace/jupyter_to_databricks.py" --bulk "$SOURCE_DIR" --upload "$DEST_DIR" "$@"
 
 echo "All notebooks synced to Databricks workspace."